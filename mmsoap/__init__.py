@@ -1,2 +1,62 @@
 __author__ = 'Jordan Trudgett'
-from client import MMSoapClient
+
+import imp
+import importlib
+import sys
+from types import ModuleType
+
+# public names -> module defining them. The modules, and suds, are only imported
+# when one of their names is first used, so importing mmsoap itself is cheap.
+_exports = {
+    'BaseMMSOAPException': 'exceptions',
+    'InvalidRecipientException': 'exceptions',
+    'RecipientBlockedException': 'exceptions',
+    'EmptyMessageContentException': 'exceptions',
+    'OtherMMSOAPException': 'exceptions',
+    'SnapshotMissingException': 'exceptions',
+    'InsufficientCreditException': 'exceptions',
+    'MMSoapClient': 'client',
+    'WellBehavedHttpTransport': 'client',
+    'AsyncMMSoapClient': 'async_client',
+    'BlockList': 'blocklist',
+    'CreditLedger': 'credit',
+    'Dispatcher': 'dispatch',
+    'MMSoapClientPool': 'pool',
+    'Metrics': 'metrics',
+    'Poller': 'poller',
+    'PooledHttpTransport': 'transport',
+    'Spool': 'spool',
+    'TimeoutError': 'executor',
+}
+
+
+class _LazyModule(ModuleType):
+    """
+    The mmsoap package, importing the module of a public name, or a submodule
+    such as ``mmsoap.exceptions``, on first access.
+    """
+
+    def __getattr__(self, name):
+        module_name = _exports.get(name)
+        if module_name is None:
+            try:
+                imp.find_module(name, self.__path__)
+            except ImportError:
+                raise AttributeError("module %r has no attribute %r" % (self.__name__, name))
+            # importing a submodule sets it on the package
+            return importlib.import_module('%s.%s' % (self.__name__, name))
+        module = importlib.import_module('%s.%s' % (self.__name__, module_name))
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_exports))
+
+
+_module = sys.modules[__name__]
+_lazy = _LazyModule(__name__, _module.__doc__)
+_lazy.__dict__.update(_module.__dict__)
+# python 2 clears the globals of a module once it is garbage collected
+_lazy._original = _module
+sys.modules[__name__] = _lazy
@@ -0,0 +1,122 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Non-blocking MMSoapClient returning futures.
+"""
+
+import threading
+
+from .client import MMSoapClient
+from .executor import WorkerPool
+from .transport import PooledHttpTransport
+
+# MMSoapClient methods available on AsyncMMSoapClient
+OPERATIONS = (
+    'check_user',
+    'send_messages',
+    'send_messages_with_retry',
+    'send_message_batch',
+    'send_templated',
+    'check_replies',
+    'iter_replies',
+    'confirm_replies',
+    'check_reports',
+    'iter_reports',
+    'confirm_reports',
+    'delete_scheduled_messages',
+    'block_numbers',
+    'get_blocked_numbers',
+    'unblock_numbers',
+)
+
+
+class AsyncMMSoapClient(object):
+    """
+    Message Media SOAP client whose operations return immediately with a Future.
+
+    Calls run on a fixed pool of worker threads, which bounds the number of requests in
+    flight. Each worker has its own MMSoapClient, all sharing the parsed WSDL (see
+    MMSoapClient.warmup) and one keep-alive connection pool. Calls beyond the concurrency
+    limit are queued.
+
+    Example::
+
+        client = AsyncMMSoapClient(user, password, max_concurrency=32)
+        futures = [client.send_messages([number], content) for number in numbers]
+        results = mmsoap.executor.wait(futures)
+    """
+
+    def __init__(self, userId=None, password=None, max_concurrency=16, max_pending=0, **kwargs):
+        """
+        :param userId: User ID for authenticating requests. Defaults to None.
+        :param password: Password for authenticating requests. Defaults to None.
+        :param max_concurrency: Maximum number of requests in flight.
+        :param max_pending: Maximum number of queued calls before callers block. 0 means unbounded.
+        :param kwargs: Arguments for MMSoapClient. Unless given, ``transport`` is a PooledHttpTransport
+                       sized to `max_concurrency`.
+        """
+        self.userId = userId
+        self.password = password
+        kwargs.setdefault('transport', PooledHttpTransport(pool_size=max_concurrency))
+        self.kwargs = kwargs
+        self.local = threading.local()
+        self.pool = WorkerPool(max_concurrency, max_pending)
+
+    def set_userId(self, userId):
+        """ Set user id for calls made from now on. Calls already submitted keep the previous one. """
+        self.userId = userId
+
+    def set_password(self, password):
+        """ Set password for calls made from now on. Calls already submitted keep the previous one. """
+        self.password = password
+
+    def warmup(self):
+        """ Parse the WSDL in the calling thread so the first calls don't wait for it. """
+        MMSoapClient.warmup(self.kwargs.get('cache_location'), self.kwargs.get('frozen'),
+                            self.kwargs.get('wsdl_url'), self.kwargs.get('cache_backend'))
+
+    def close(self, wait=True):
+        """ Stop the worker threads once queued calls have run. """
+        self.pool.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def client(self, userId, password):
+        """ The MMSoapClient of the current worker thread, set up with the given credentials. """
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = MMSoapClient(**self.kwargs)
+        client.set_userId(userId)
+        client.set_password(password)
+        return client
+
+    def _call(self, name, userId, password, args, kwargs):
+        return getattr(self.client(userId, password), name)(*args, **kwargs)
+
+
+def _operation(name):
+    def operation(self, *args, **kwargs):
+        # the credentials are taken when the call is submitted, not when a worker runs it
+        return self.pool.submit(self._call, name, self.userId, self.password, args, kwargs)
+    operation.__name__ = name
+    operation.__doc__ = 'Run MMSoapClient.%s on a worker thread.\n\n:return: Future of its result.' % name
+    return operation
+
+
+for _name in OPERATIONS:
+    setattr(AsyncMMSoapClient, _name, _operation(_name))
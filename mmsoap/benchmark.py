@@ -0,0 +1,501 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmarks of MMSoapClient against the local SOAP simulator.
+
+The simulator (see mmsoap.simulator) runs on the loopback interface and serves its
+own WSDL, or a snapshot of the live one (see mmsoap.snapshot), so nothing leaves the machine::
+
+    python -m mmsoap.benchmark --output before.json
+    python -m mmsoap.benchmark --output after.json --compare before.json
+
+``--max-import-ms`` makes the run fail when ``import mmsoap`` got slow or imports suds.
+
+The memory benchmarks compare the bytes per reply, report and blocked number held
+as suds objects, as records (see mmsoap.records) and as RecordColumns, and the decode
+benchmarks the time to decode a reply through suds and the NativeDecoder (see mmsoap.decoder).
+"""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from datetime import datetime
+from optparse import OptionParser
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+import suds
+
+from .decoder import Result
+from .numbers import normalize, to_e164
+from .records import BlockedNumberRecord, RecordColumns, ReplyRecord, ReportRecord
+from .registry import registry
+from .simulator import Simulator, SimulatorServer
+
+SIZES = (1, 100, 10000)
+
+# account the benchmarks use on the simulator
+USER = 'benchmark'
+
+
+def peak_rss():
+    """ Peak resident set size of this process in KiB, None where unknown. """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def summarize(name, latencies, elapsed, **params):
+    """ Result of one benchmark as a dict. """
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))] if latencies else None
+
+    result = dict(name=name, ops=len(latencies), seconds=elapsed,
+                  ops_per_sec=len(latencies) / elapsed if elapsed else None,
+                  p50=percentile(50), p90=percentile(90), p99=percentile(99),
+                  max=latencies[-1] if latencies else None, peak_rss_kb=peak_rss())
+    result.update(params)
+    return result
+
+
+def run(function, iterations, clients=1):
+    """
+    Call function(client_number) `iterations` times on each of `clients` threads.
+
+    :return: (latencies, elapsed seconds)
+    """
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Event()
+
+    def worker(number):
+        own = []
+        start.wait()
+        for i in range(iterations):
+            started = time.time()
+            function(number)
+            own.append(time.time() - started)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    started = time.time()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return latencies, time.time() - started
+
+
+# not followed by deep_size
+_OPAQUE = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+
+def deep_size(obj):
+    """
+    Approximate bytes held by `obj` and the objects it refers to, each counted once.
+
+    Classes, modules and functions are neither counted nor followed.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _OPAQUE):
+            continue
+        seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        if isinstance(obj, array):
+            size = max(size, obj.itemsize * len(obj))
+        total += size
+        if isinstance(obj, dict):
+            stack.extend(obj)
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                stack.append(getattr(obj, slot))
+    return total
+
+
+def numbers(size):
+    return ['+614%08d' % i for i in range(size)]
+
+
+def mixed_numbers(size, duplicates=0.0):
+    """ Distinct numbers written in the formats people use, with a fraction of them repeated. """
+    formats = ('04%s', '+614%s', '614%s', '0061 4%s', '(04) %s', '+1 (212) 5%s')
+    distinct = max(1, int(size * (1 - duplicates)))
+    # 7919 is coprime to 10 ** 8, so the first `distinct` numbers are all different
+    return [formats[i % len(formats)] % ('%08d' % (i % distinct * 7919 % 10 ** 8)) for i in range(size)]
+
+
+def blocked_numbers(size):
+    """ Numbers for the blocking benchmarks, apart from those messages are sent to. """
+    return ['+615%08d' % i for i in range(size)]
+
+
+# operation -> function(client, size) calling it
+OPERATIONS = dict(
+    check_user=lambda client, size: client.check_user(),
+    send_messages=lambda client, size: client.send_messages(numbers(size), 'benchmark'),
+    send_message_batch=lambda client, size: client.send_message_batch(
+        dict(recipients=[number], content='benchmark %s' % number) for number in numbers(size)),
+    send_templated=lambda client, size: client.send_templated(
+        'benchmark {group}', (dict(recipient=number, group=i % 10) for i, number in enumerate(numbers(size)))),
+    check_replies=lambda client, size: client.check_replies(size),
+    iter_replies=lambda client, size: list(client.iter_replies(size)),
+    confirm_replies=lambda client, size: client.confirm_replies(range(size)),
+    check_reports=lambda client, size: client.check_reports(size),
+    iter_reports=lambda client, size: list(client.iter_reports(size)),
+    confirm_reports=lambda client, size: client.confirm_reports(range(size)),
+    delete_scheduled_messages=lambda client, size: client.delete_scheduled_messages(range(size)),
+    block_numbers=lambda client, size: client.block_numbers(blocked_numbers(size)),
+    get_blocked_numbers=lambda client, size: client.get_blocked_numbers(size),
+    unblock_numbers=lambda client, size: client.unblock_numbers(blocked_numbers(size)),
+)
+
+# operations without a size
+UNSIZED = frozenset(['check_user'])
+
+# operations whose replies the decode benchmarks decode
+DECODED = ('check_user', 'send_messages', 'check_replies', 'check_reports', 'get_blocked_numbers')
+
+# (operation, form) -> function(client, size) fetching items in that form, for the memory benchmarks
+FORMS = [
+    (('check_replies', 'suds'), lambda client, size: client.check_replies(size)),
+    (('check_replies', 'records'), lambda client, size: client.check_replies(size, records=True)),
+    (('check_replies', 'columns'), lambda client, size: RecordColumns(ReplyRecord, client.iter_replies(size))),
+    (('check_reports', 'suds'), lambda client, size: client.check_reports(size)),
+    (('check_reports', 'records'), lambda client, size: client.check_reports(size, records=True)),
+    (('check_reports', 'columns'), lambda client, size: RecordColumns(ReportRecord, client.iter_reports(size))),
+    (('get_blocked_numbers', 'suds'), lambda client, size: client.get_blocked_numbers(size)),
+    (('get_blocked_numbers', 'records'), lambda client, size: client.get_blocked_numbers(size, records=True)),
+    (('get_blocked_numbers', 'columns'), lambda client, size: RecordColumns(
+        BlockedNumberRecord, client.get_blocked_numbers(size, records=True))),
+]
+
+
+class Benchmark(object):
+    """
+    Runs the benchmarks against a SimulatorServer.
+    """
+
+    def __init__(self, server, client_class=None, iterations=50, sizes=SIZES, concurrency=8,
+                 operations=None, out=sys.stdout):
+        """
+        :param server: A started SimulatorServer running a Simulator.
+        :param client_class: The client class, defaults to MMSoapClient.
+        :param iterations: Calls per benchmark with 100 items, fewer for larger sizes.
+        :param sizes: Recipient / item counts.
+        :param concurrency: Number of clients of the concurrent benchmarks.
+        :param operations: Names of the operations to run, defaults to all.
+        :param out: Stream progress is written to, None for none.
+        """
+        if client_class is None:
+            from .client import MMSoapClient as client_class
+        self.server = server
+        self.client_class = client_class
+        self.iterations = iterations
+        self.sizes = sizes
+        self.concurrency = concurrency
+        self.operations = operations or sorted(OPERATIONS)
+        self.out = out
+        self.results = []
+        self.cache_location = tempfile.mkdtemp(prefix='mmsoap-benchmark-')
+
+    def close(self):
+        shutil.rmtree(self.cache_location, ignore_errors=True)
+
+    def client(self, cache_location=None, **kwargs):
+        return self.client_class(USER, 'benchmark', wsdl_url=self.server.wsdl_url, location=self.server.url,
+                                 cache_location=cache_location or self.cache_location, **kwargs)
+
+    def forget_model(self, cache_location, cache_backend=None):
+        """ Make the next client parse the WSDL again, from the on-disk cache if there is one. """
+        registry.discard((self.server.wsdl_url, cache_location, None, cache_backend))
+        self.client_class._object_caches.pop((cache_location, cache_backend), None)
+
+    def run(self):
+        """ Run every benchmark and return the results. """
+        # checks return what is queued, and are never confirmed
+        self.server.respond.queue(USER, replies=max(self.sizes), reports=max(self.sizes))
+        self.run_import()
+        self.run_construction()
+        for operation in self.operations:
+            for size in ([1] if operation in UNSIZED else self.sizes):
+                self.run_operation(operation, size, 1)
+        for operation in ('check_user', 'send_messages'):
+            if operation in self.operations:
+                self.run_operation(operation, 1, self.concurrency)
+        self.run_memory(max(self.sizes))
+        self.run_decode()
+        self.run_normalize(max(self.sizes) * 100)
+        return self.results
+
+    def run_import(self):
+        """ Time ``import mmsoap`` and the first use of MMSoapClient, each in a new interpreter. """
+        iterations = max(3, self.iterations // 10)
+        package, client, eager = [], [], False
+        for i in range(iterations):
+            imported, first_use, suds_imported = measure_import()
+            package.append(imported)
+            client.append(first_use)
+            eager = eager or suds_imported
+        self.add(summarize('import[mmsoap]', package, sum(package), operation='import', suds_imported=eager))
+        self.add(summarize('import[MMSoapClient]', client, sum(client), operation='import'))
+
+    def run_construction(self):
+        """
+        Time creating a client, which doesn't load the WSDL, and loading it with a cold
+        cache, a warm on-disk cache and a parsed model.
+        """
+        iterations = max(3, self.iterations // 10)
+
+        def cold(n):
+            location = tempfile.mkdtemp(prefix='mmsoap-cold-', dir=self.cache_location)
+            self.forget_model(location)
+            self.client(location).load()
+
+        def warm_disk(n):
+            self.forget_model(self.cache_location)
+            self.client().load()
+
+        def warm_sqlite(n):
+            self.forget_model(self.cache_location, 'sqlite')
+            self.client(cache_backend='sqlite').load()
+
+        self.client().load()    # fills the on-disk caches
+        self.client(cache_backend='sqlite').load()
+        self.add(summarize('construct[lazy]', *run(lambda n: self.client(), self.iterations),
+                           operation='construct', cache='none'))
+        self.add(summarize('construct[cache=cold]', *run(cold, iterations), operation='construct', cache='cold'))
+        self.add(summarize('construct[cache=disk]', *run(warm_disk, iterations), operation='construct', cache='disk'))
+        self.add(summarize('construct[cache=sqlite]', *run(warm_sqlite, iterations),
+                           operation='construct', cache='sqlite'))
+        self.add(summarize('construct[cache=model]', *run(lambda n: self.client().load(), self.iterations),
+                           operation='construct', cache='model'))
+
+        def first_call(n):
+            self.forget_model(self.cache_location)
+            self.client().check_user()
+        self.add(summarize('first_call[cache=disk]', *run(first_call, iterations),
+                           operation='first_call', cache='disk'))
+
+    def run_operation(self, operation, size, clients):
+        """ Time an operation on `clients` concurrent clients sharing one parsed model. """
+        iterations = max(3, self.iterations * 100 // max(size, 100))
+        function = OPERATIONS[operation]
+        instances = [self.client() for n in range(clients)]
+        function(instances[0], size)    # warm up the connection and the templates
+        latencies, elapsed = run(lambda n: function(instances[n], size), iterations, clients)
+        self.add(summarize('%s[size=%d,clients=%d]' % (operation, size, clients), latencies, elapsed,
+                           operation=operation, size=size, clients=clients))
+
+    def run_memory(self, size):
+        """
+        Measure the memory held by `size` replies, reports and blocked numbers in each form.
+
+        The bytes per item are the difference between holding `size` items and one item,
+        so the parsed WSDL which suds objects refer to isn't counted.
+        """
+        if size < 2:
+            return
+        client = self.client()
+        client.block_numbers(blocked_numbers(size))
+        try:
+            for (operation, form), function in FORMS:
+                if operation not in self.operations:
+                    continue
+                total = deep_size(function(client, size))
+                one = deep_size(function(client, 1))
+                self.add(dict(name='memory[%s,form=%s,size=%d]' % (operation, form, size), operation='memory',
+                              fetched=operation, form=form, size=size, bytes=total,
+                              bytes_per_item=float(total - one) / (size - 1)))
+        finally:
+            client.unblock_numbers(blocked_numbers(size))
+
+    def run_decode(self):
+        """ Time decoding the replies of each size through suds and through the NativeDecoder. """
+        client = self.client(native_decoder=True)
+        client.load()
+        decode, replies = client.decoder.decode, []
+
+        def capture(suds_client, method, reply):
+            replies.append((method, reply))
+            return decode(suds_client, method, reply)
+        client.decoder.decode = capture
+
+        client.block_numbers(blocked_numbers(max(self.sizes)))
+        try:
+            for operation in DECODED:
+                if operation not in self.operations:
+                    continue
+                for size in ([1] if operation in UNSIZED else self.sizes):
+                    OPERATIONS[operation](client, size)
+                    method, reply = replies[-1]
+                    if not isinstance(decode(client.client, method, reply), Result):
+                        # timing suds twice would hide a decoder which doesn't handle the reply
+                        raise RuntimeError('the native decoder fell back to suds for %s' % operation)
+                    binding = method.binding.output
+                    iterations = max(3, self.iterations * 100 // max(size, 100))
+                    for decoder, function in (('suds', lambda n: binding.get_reply(method, reply)),
+                                              ('native', lambda n: decode(client.client, method, reply))):
+                        self.add(summarize('decode[%s,decoder=%s,size=%d]' % (operation, decoder, size),
+                                           *run(function, iterations), operation='decode', decoded=operation,
+                                           decoder=decoder, size=size, response_bytes=len(reply)))
+        finally:
+            client.unblock_numbers(blocked_numbers(max(self.sizes)))
+
+    def run_normalize(self, size):
+        """ Time normalize against calling to_e164 on every number, without and with duplicates. """
+        iterations = max(3, self.iterations * 100 // size)
+        for duplicates in (0.0, 0.1):
+            recipients = mixed_numbers(size, duplicates)
+            for method, function in (('to_e164', lambda n: [to_e164(number) for number in recipients]),
+                                     ('normalize', lambda n: normalize(recipients))):
+                self.add(summarize('normalize[method=%s,duplicates=%d%%,size=%d]' % (method, duplicates * 100, size),
+                                   *run(function, iterations), operation='normalize', method=method,
+                                   duplicates=duplicates, size=size))
+
+    def add(self, result):
+        self.results.append(result)
+        if self.out is None:
+            return
+        if 'bytes' in result:
+            self.out.write('%-50s %10d bytes  %8.1f bytes/item\n' % (
+                result['name'], result['bytes'], result['bytes_per_item']))
+        else:
+            self.out.write('%-50s %10.1f ops/s  p50 %8.2fms  p99 %8.2fms\n' % (
+                result['name'], result['ops_per_sec'] or 0, (result['p50'] or 0) * 1000,
+                (result['p99'] or 0) * 1000))
+
+
+# run by measure_import in a new interpreter
+IMPORT_SCRIPT = '''
+import sys, time
+started = time.time()
+import mmsoap
+imported = time.time()
+suds_imported = 'suds' in sys.modules
+mmsoap.MMSoapClient
+sys.stdout.write('%r %r %r' % (imported - started, time.time() - imported, suds_imported))
+'''
+
+
+def measure_import():
+    """
+    Import mmsoap in a new interpreter.
+
+    :return: (seconds to import mmsoap, seconds to then get MMSoapClient, whether importing mmsoap imported suds)
+    """
+    env = dict(os.environ)
+    parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [parent, env.get('PYTHONPATH')]))
+    process = subprocess.Popen([sys.executable, '-c', IMPORT_SCRIPT], stdout=subprocess.PIPE, env=env)
+    output = process.communicate()[0]
+    if process.returncode:
+        raise RuntimeError('importing mmsoap failed')
+    imported, first_use, suds_imported = output.split()
+    return float(imported), float(first_use), suds_imported == 'True'
+
+
+def environment():
+    """ Description of the machine and versions the benchmarks ran with. """
+    return dict(python=platform.python_version(), implementation=platform.python_implementation(),
+                platform=platform.platform(), suds=suds.__version__,
+                created=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+
+def compare(baseline, results):
+    """
+    Compare the throughput of two runs.
+
+    :param baseline: Results of the earlier run, as saved by main.
+    :param results: Results of the later run.
+    :return: List of (name, baseline ops/s, ops/s, relative change) for benchmarks in both runs.
+    """
+    before = dict((r['name'], r.get('ops_per_sec')) for r in baseline['results'])
+    changes = []
+    for result in results['results']:
+        old, new = before.get(result['name']), result.get('ops_per_sec')
+        if old and new:
+            changes.append((result['name'], old, new, new / old - 1))
+    return changes
+
+
+def main(argv=None):
+    """ Command line entry point, see the module docstring. """
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--output', help='write the results to this JSON file')
+    parser.add_option('--compare', help='compare with the results in this JSON file')
+    parser.add_option('--iterations', type='int', default=50, help='calls per benchmark (default: %default)')
+    parser.add_option('--sizes', default=','.join(map(str, SIZES)),
+                      help='comma separated recipient counts (default: %default)')
+    parser.add_option('--concurrency', type='int', default=8,
+                      help='clients of the concurrent benchmarks (default: %default)')
+    parser.add_option('--operations', help='comma separated operations (default: all)')
+    parser.add_option('--snapshot', default=None, help='WSDL snapshot directory to serve instead of simulator.wsdl')
+    parser.add_option('--max-import-ms', type='float', default=None,
+                      help='fail if the median time of import mmsoap exceeds this, or if it imports suds')
+    options, args = parser.parse_args(argv)
+
+    server = SimulatorServer(Simulator(credit_limit=10 ** 9), options.snapshot).start()
+    benchmark = Benchmark(server, iterations=options.iterations,
+                          sizes=[int(size) for size in options.sizes.split(',')],
+                          concurrency=options.concurrency,
+                          operations=options.operations and options.operations.split(','))
+    try:
+        results = dict(environment=environment(), results=benchmark.run())
+    finally:
+        benchmark.close()
+        server.stop()
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        for name, old, new, change in compare(baseline, results):
+            sys.stdout.write('%-50s %10.1f -> %10.1f ops/s  %+6.1f%%\n' % (name, old, new, change * 100))
+
+    if options.max_import_ms is not None:
+        result = [r for r in results['results'] if r['name'] == 'import[mmsoap]'][0]
+        if result['suds_imported'] or result['p50'] * 1000 > options.max_import_ms:
+            sys.stdout.write('import mmsoap regressed: %.1fms, suds imported: %s\n' % (
+                result['p50'] * 1000, result['suds_imported']))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Local index of blocked numbers.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from logging import getLogger
+
+from .results import decode_errors
+
+log = getLogger(__name__)
+
+
+class BlockList(object):
+    """
+    Set of the account's blocked numbers, kept on the client so sends can skip them.
+
+    The whole list is fetched with get_blocked_numbers when it is older than
+    `refresh_interval`. Between fetches it is updated from successful block_numbers
+    and unblock_numbers calls made through a client using it. With a `path` the list
+    is saved after every change and loaded on start, so a restarted process doesn't
+    have to fetch it again.
+
+    Only one fetch runs at a time, and numbers blocked or unblocked while it runs
+    are applied again to the fetched list, so they are never lost.
+
+    Numbers are compared exactly as they were blocked, so block and send numbers in
+    the same format, e.g. with the client's ``normalize`` option.
+
+    Example::
+
+        client = MMSoapClient(user, password, blocklist=BlockList('/var/lib/mmsoap/blocked.json'))
+    """
+
+    def __init__(self, path=None, refresh_interval=3600):
+        """
+        :param path: File the list is saved to, None to keep it in memory only.
+        :param refresh_interval: Seconds after which the list is fetched again, None to never refresh.
+        """
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.numbers = frozenset()
+        self.synced = None
+        self.lock = threading.Lock()
+        self._syncing = threading.Lock()
+        self._changes = None    # [(numbers, add)] made while a fetch runs
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __contains__(self, number):
+        return number in self.numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def stale(self):
+        """ True if the list was never fetched or is older than the refresh interval. """
+        if self.synced is None:
+            return True
+        return self.refresh_interval is not None and time.time() - self.synced >= self.refresh_interval
+
+    def refresh(self, client):
+        """ Fetch the list with `client` if it is stale. """
+        if self.stale():
+            with self._syncing:
+                if self.stale():
+                    self._sync(client)
+
+    def sync(self, client):
+        """ Replace the list by the numbers returned by client.get_blocked_numbers. """
+        with self._syncing:
+            self._sync(client)
+
+    def _sync(self, client):
+        with self.lock:
+            self._changes = []
+        try:
+            numbers = frozenset(r.recipient for r in client.get_blocked_numbers(records=True))
+        except Exception:
+            with self.lock:
+                self._changes = None
+            raise
+        with self.lock:
+            for changed, add in self._changes:
+                numbers = numbers | changed if add else numbers - changed
+            self._changes = None
+            self.numbers = numbers
+            self.synced = time.time()
+            self._save()
+
+    def filter(self, recipients, uids=None):
+        """
+        Remove blocked numbers from a list of recipients.
+
+        :param recipients: Iterable of recipient numbers
+        :param uids: uids of the recipients, defaults to their 0-based positions.
+        :return: (recipients, uids, blocked) where blocked is the number of recipients removed.
+                 `recipients` and `uids` are returned unchanged if nothing was removed.
+        """
+        recipients = list(recipients)
+        numbers = self.numbers
+        if numbers.isdisjoint(recipients):
+            return recipients, uids, 0
+
+        if uids is None:
+            uids = range(len(recipients))
+        kept = [(uid, r) for uid, r in zip(uids, recipients) if r not in numbers]
+        return [r for uid, r in kept], [uid for uid, r in kept], len(recipients) - len(kept)
+
+    def blocked(self, numbers, response):
+        """ Add the numbers of a block_numbers request, except those the response has errors for. """
+        self._update(numbers, response, add=True)
+
+    def unblocked(self, numbers, response):
+        """ Remove the numbers of an unblock_numbers request, except those the response has errors for. """
+        self._update(numbers, response, add=False)
+
+    def load(self):
+        """ Load the list from `path`. """
+        with open(self.path) as fp:
+            data = json.load(fp)
+        with self.lock:
+            self.numbers = frozenset(data['numbers'])
+            self.synced = data['synced']
+
+    def _update(self, numbers, response, add):
+        failed = set(e.recipient for e in decode_errors(response))
+        changed = set(numbers) - failed
+        with self.lock:
+            self.numbers = self.numbers | changed if add else self.numbers - changed
+            if self._changes is not None:
+                self._changes.append((changed, add))
+            self._save()
+
+    def _save(self):
+        """ Write the list to `path` through a temporary file, so readers never see half of it. """
+        if self.path is None:
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, prefix='.blocklist-')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(dict(synced=self.synced, numbers=sorted(self.numbers)), fp)
+            try:
+                os.rename(temp, self.path)
+            except OSError:
+                # windows doesn't replace existing files
+                os.remove(self.path)
+                os.rename(temp, self.path)
+        except Exception:
+            log.warning('could not save blocked numbers to %s', self.path, exc_info=1)
+            if os.path.exists(temp):
+                os.remove(temp)
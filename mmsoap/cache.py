@@ -17,13 +17,21 @@
 # Modified by: Jordan Trudgett ( jordan.trudgett@messagemedia.com.au )
 
 """
-Modifies the SUDS FileCache class to allow it to work on Windows.
+Modifies the SUDS FileCache class to allow it to work on Windows, and to be
+shared by many processes: entries are written atomically and refreshed by
+one process at a time. SqliteObjectCache keeps every entry in a single file.
 """
 
+import errno
 import os
+import sqlite3
+import tempfile
+import threading
+import time
 from tempfile import gettempdir as tmp
 from datetime import datetime as dt
 from datetime import timedelta
+from logging import getLogger
 
 import suds
 
@@ -32,12 +40,105 @@ try:
 except:
     import pickle
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+log = getLogger(__name__)
+
+
+class FileLock(object):
+    """
+    An exclusive lock on a file, held across processes and threads.
+    The lock is released when its holder exits, so a crashed process never
+    blocks the others. Where the lock file can't be created, e.g. in a
+    read-only location, or locking isn't supported, the lock is always granted.
+    @ivar path: The lock file.
+    @type path: str
+    @cvar poll: Seconds between attempts while waiting for the lock.
+    @type poll: float
+    """
+    poll = 0.05
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Acquire the lock.
+        @param blocking: Wait for the lock if it is held elsewhere.
+        @type blocking: bool
+        @param timeout: Maximum seconds to wait, None to wait forever.
+        @type timeout: float
+        @return: True if the lock was acquired.
+        @rtype: bool
+        """
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        except (IOError, OSError):
+            log.debug(self.path, exc_info=1)
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.__trylock(fd):
+            if not blocking or (deadline is not None and time.time() >= deadline):
+                os.close(fd)
+                return False
+            time.sleep(self.poll)
+        self.fd = fd
+        return True
+
+    def release(self):
+        """
+        Release the lock, if it is held.
+        """
+        fd, self.fd = self.fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(fd, 0, 0)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        except (IOError, OSError):
+            log.debug(self.path, exc_info=1)
+        os.close(fd)
+
+    def __trylock(self, fd):
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                os.lseek(fd, 0, 0)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except (IOError, OSError) as e:
+            if e.errno in (errno.EACCES, errno.EAGAIN, errno.EDEADLK):
+                return False
+            # e.g. a file system without locks
+            log.debug(self.path, exc_info=1)
+            return True
+
 
 class ExtendedFileCache(suds.cache.Cache):
     """
-    A file-based URL cache.
+    A file-based URL cache, safe to share between processes.
+    Files are replaced atomically, so readers never see a partly written
+    file. When an entry is missing or expired only one process (or thread)
+    fetches it: the others wait for it, or keep using the expired copy
+    until it is replaced.
     @cvar fnprefix: The file name prefix.
     @type fnsuffix: str
+    @cvar lock_timeout: Seconds to wait for another process fetching
+        an entry before fetching it anyway.
+    @type lock_timeout: int
     @ivar duration: The cached file duration which defines how
         long the file will be cached.
     @type duration: (unit, value)
@@ -46,6 +147,7 @@ class ExtendedFileCache(suds.cache.Cache):
     """
     fnprefix = 'suds'
     units = ('months', 'weeks', 'days', 'hours', 'minutes', 'seconds')
+    lock_timeout = 60
 
     def __init__(self, location=None, **duration):
         """
@@ -59,8 +161,11 @@ class ExtendedFileCache(suds.cache.Cache):
         if location is None:
             location = os.path.join(tmp(), 'suds')
         self.location = location
+        self.created_location = None
         self.duration = (None, 0)
         self.setduration(**duration)
+        self.__refreshing = {}
+        self.__refreshing_lock = threading.Lock()
         self.checkversion()
 
     def fnsuffix(self):
@@ -95,39 +200,69 @@ class ExtendedFileCache(suds.cache.Cache):
         """
         self.location = location
 
+    def lifetime(self):
+        """
+        Get the caching duration in seconds.
+        @return: The number of seconds a file is cached, or None if forever.
+        @rtype: int
+        """
+        unit, value = self.duration
+        if value < 1:
+            return None
+        if unit == 'months':
+            unit, value = 'days', value * 31
+        d = timedelta(**{unit: value})
+        return d.days * 86400 + d.seconds
+
+    def stamp(self, id):
+        """
+        Get a stamp which changes whenever the cached file is replaced.
+        @param id: The cache id.
+        @type id: str
+        @return: (ctime, mtime, size) of the file, or None if it doesn't exist.
+        @rtype: tuple
+        """
+        try:
+            st = os.stat(self.__fn(id))
+            return (st.st_ctime, st.st_mtime, st.st_size)
+        except OSError:
+            return None
+
     def mktmp(self):
         """
         Make the I{location} directory if it doesn't already exits.
+        The check is only made once per location.
         """
+        if self.created_location == self.location:
+            return self
         try:
             if not os.path.isdir(self.location):
                 os.makedirs(self.location)
+            self.created_location = self.location
         except:
             log.debug(self.location, exc_info=1)
         return self
 
     def put(self, id, bfr):
         try:
-            fn = self.__fn(id)
-            f = self.open(fn, 'wb')
-            f.write(bfr)
-            f.close()
-            return bfr
+            self.__write(self.__fn(id), bfr)
         except:
             log.debug(id, exc_info=1)
-            return bfr
+        finally:
+            self.__release(id)
+        return bfr
 
     def putf(self, id, fp):
         try:
             fn = self.__fn(id)
-            f = self.open(fn, 'w')
-            f.write(fp.read())
+            self.__write(fn, fp.read())
             fp.close()
-            f.close()
             return open(fn)
         except:
             log.debug(id, exc_info=1)
             return fp
+        finally:
+            self.__release(id)
 
     def get(self, id):
         try:
@@ -139,27 +274,48 @@ class ExtendedFileCache(suds.cache.Cache):
             pass
 
     def getf(self, id):
+        """
+        Open the cached file of I{id}.
+        When the file is missing or expired, None is returned to the one
+        caller which should fetch it and put() it. Callers elsewhere wait
+        for that, or get the expired file meanwhile.
+        @param id: The cache id.
+        @type id: str
+        @return: The open file, or None.
+        """
         try:
             fn = self.__fn(id)
-            self.validate(fn)
-            return self.open(fn, 'rb')
+            fp = self.__fresh(fn)
+            if fp is not None:
+                return fp
+            self.mktmp()
+            self.__release(id, abandoned=True)
+            lock = FileLock(self.__lockfn(id))
+            if os.path.exists(fn):
+                if not lock.acquire(blocking=False):
+                    log.debug('%s expired, being refreshed elsewhere', fn)
+                    return self.open(fn, 'rb')
+            elif not lock.acquire(timeout=self.lock_timeout):
+                log.debug('%s not fetched elsewhere in time', fn)
+                return None
+            # it may have been fetched while waiting for the lock
+            fp = self.__fresh(fn)
+            if fp is not None:
+                lock.release()
+                return fp
+            self.__hold(id, lock)
         except:
-            pass
+            log.debug(id, exc_info=1)
 
-    def validate(self, fn):
+    def expired(self, created):
         """
-        Validate that the file has not expired based on the I{duration}.
-        @param fn: The file name.
-        @type fn: str
+        Check whether a file has outlived the I{duration}.
+        @param created: The time the file was written.
+        @type created: float
+        @rtype: bool
         """
-        if self.duration[1] < 1:
-            return
-        created = dt.fromtimestamp(os.path.getctime(fn))
-        d = {self.duration[0]: self.duration[1]}
-        expired = created + timedelta(**d)
-        if expired < dt.now():
-            log.debug('%s expired, deleted', fn)
-            os.remove(fn)
+        lifetime = self.lifetime()
+        return lifetime is not None and created + lifetime < time.time()
 
     def clear(self):
         for fn in os.listdir(self.location):
@@ -167,7 +323,11 @@ class ExtendedFileCache(suds.cache.Cache):
                 continue
             if fn.startswith(self.fnprefix):
                 log.debug('deleted: %s', fn)
-                os.remove(os.path.join(self.location, fn))
+                try:
+                    os.remove(os.path.join(self.location, fn))
+                except OSError:
+                    # e.g. open elsewhere on windows
+                    log.debug(fn, exc_info=1)
 
     def purge(self, id):
         fn = self.__fn(id)
@@ -184,18 +344,105 @@ class ExtendedFileCache(suds.cache.Cache):
         return open(fn, *args)
 
     def checkversion(self):
+        """
+        Clear the cache if it was written by another version of suds.
+        Only one process checks at a time, and the version file is
+        replaced atomically.
+        """
         path = os.path.join(self.location, 'version')
+        if self.__version(path) == suds.__version__:
+            return
+        self.mktmp()
+        lock = FileLock(os.path.join(self.location, 'lock-version'))
+        lock.acquire(timeout=self.lock_timeout)
         try:
-            f = self.open(path)
-            version = f.read()
-            f.close()
-            if version != suds.__version__:
-                raise Exception()
+            if self.__version(path) != suds.__version__:
+                self.clear()
+                self.__write(path, suds.__version__)
         except:
-            self.clear()
-            f = self.open(path, 'w')
-            f.write(suds.__version__)
+            log.debug(self.location, exc_info=1)
+        finally:
+            lock.release()
+
+    def __version(self, path):
+        try:
+            f = open(path)
+            try:
+                return f.read()
+            finally:
+                f.close()
+        except (IOError, OSError):
+            return None
+
+    def __fresh(self, fn):
+        """
+        Open a file if it exists and has not expired.
+        """
+        try:
+            f = open(fn, 'rb')
+        except (IOError, OSError):
+            return None
+        if self.expired(os.fstat(f.fileno()).st_ctime):
             f.close()
+            return None
+        return f
+
+    def __write(self, fn, data):
+        """
+        Write a file through a temporary file renamed over it.
+        """
+        self.mktmp()
+        fd, temp = tempfile.mkstemp(dir=self.location, prefix='.%s-' % self.fnprefix)
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.chmod(temp, 0o644)
+            try:
+                os.rename(temp, fn)
+            except OSError:
+                # windows doesn't replace existing files
+                os.remove(fn)
+                os.rename(temp, fn)
+        except:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    def __hold(self, id, lock):
+        """
+        Keep the lock of an entry this thread fetches until it is put().
+        """
+        self.__refreshing_lock.acquire()
+        try:
+            self.__refreshing[id] = (lock, threading.current_thread().ident, time.time())
+        finally:
+            self.__refreshing_lock.release()
+
+    def __release(self, id, abandoned=False):
+        """
+        Release the lock of an entry fetched by this process.
+        @param abandoned: Only if the fetch looks abandoned: it was started
+            by this thread, or longer than I{lock_timeout} ago.
+        """
+        self.__refreshing_lock.acquire()
+        try:
+            held = self.__refreshing.get(id)
+            if held is None:
+                return
+            lock, thread, acquired = held
+            if abandoned and thread != threading.current_thread().ident and \
+                    time.time() - acquired < self.lock_timeout:
+                return
+            del self.__refreshing[id]
+        finally:
+            self.__refreshing_lock.release()
+        lock.release()
+
+    def __lockfn(self, id):
+        return os.path.join(self.location, 'lock-%s' % id)
 
     def __fn(self, id):
         name = id
@@ -229,3 +476,317 @@ class ExtendedObjectCache(ExtendedFileCache):
         bfr = pickle.dumps(object, self.protocol)
         ExtendedFileCache.put(self, id, bfr)
         return object
+
+
+class SqliteObjectCache(suds.cache.Cache):
+    """
+    Provides pickled object caching in a single SQLite database.
+    Entries are stamped with the time they were stored and the suds
+    version, so expiry doesn't depend on file system times and entries
+    of other suds versions are ignored rather than cleared. Any number
+    of processes can read the database while one writes, and a database
+    on a read-only file system is used as it is.
+    @cvar protocol: The pickling protocol.
+    @type protocol: int
+    @cvar filename: The database file name within a location directory.
+    @type filename: str
+    @cvar touch: Seconds between updates of an entry's access time.
+    @type touch: int
+    @ivar path: The database file.
+    @type path: str
+    @ivar maxsize: The maximum total size of the pickled entries in bytes,
+        least recently used entries are evicted beyond it. None for no limit.
+    @type maxsize: int
+    @ivar readonly: Never write to the database.
+    @type readonly: bool
+    """
+    protocol = 2
+    filename = 'suds.sqlite'
+    touch = 60
+    units = ExtendedFileCache.units
+    setduration = ExtendedFileCache.__dict__['setduration']
+    lifetime = ExtendedFileCache.__dict__['lifetime']
+
+    def __init__(self, location=None, maxsize=None, readonly=False, timeout=30, **duration):
+        """
+        @param location: The database file, or the directory for it.
+        @type location: str
+        @param maxsize: The maximum total size of the entries in bytes.
+        @type maxsize: int
+        @param readonly: Never write to the database, e.g. one mounted read-only.
+        @type readonly: bool
+        @param timeout: Seconds to wait for another process writing.
+        @type timeout: float
+        @param duration: The cached entry duration, see L{ExtendedFileCache}.
+        @type duration: {unit:value}
+        """
+        if location is None:
+            location = os.path.join(tmp(), 'suds')
+        if os.path.isdir(location) or not os.path.splitext(location)[1]:
+            location = os.path.join(location, self.filename)
+        self.path = location
+        self.maxsize = maxsize
+        self.readonly = readonly
+        self.timeout = timeout
+        self.duration = (None, 0)
+        self.setduration(**duration)
+        self.__local = threading.local()
+        if not readonly:
+            self.__write("""CREATE TABLE IF NOT EXISTS entries (
+                              id TEXT PRIMARY KEY, version TEXT NOT NULL, created REAL NOT NULL,
+                              accessed REAL NOT NULL, size INTEGER NOT NULL, data BLOB NOT NULL)""",
+                         "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, id):
+        try:
+            row = self.__connection().execute(
+                'SELECT data, created, accessed FROM entries WHERE id = ? AND version = ?',
+                (id, suds.__version__)).fetchone()
+        except sqlite3.Error:
+            log.debug(id, exc_info=1)
+            return None
+        if row is None:
+            return None
+        data, created, accessed = row
+        if self.expired(created):
+            return None
+        try:
+            object = pickle.loads(bytes(data))
+        except:
+            log.debug(id, exc_info=1)
+            self.purge(id)
+            return None
+        now = time.time()
+        if now - accessed > self.touch:
+            self.__write(('UPDATE entries SET accessed = ? WHERE id = ?', (now, id)))
+        return object
+
+    def put(self, id, object):
+        data = pickle.dumps(object, self.protocol)
+        now = time.time()
+        self.__write(('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                      (id, suds.__version__, now, now, len(data), sqlite3.Binary(data))))
+        if self.maxsize is not None:
+            self.evict(self.maxsize)
+        return object
+
+    def purge(self, id):
+        self.__write(('DELETE FROM entries WHERE id = ?', (id,)))
+
+    def clear(self):
+        self.__write('DELETE FROM entries')
+
+    def expire(self):
+        """
+        Delete every expired entry, and the entries of other suds versions.
+        @return: The number of entries deleted.
+        @rtype: int
+        """
+        lifetime = self.lifetime()
+        if lifetime is None:
+            return self.__write(('DELETE FROM entries WHERE version != ?', (suds.__version__,)))
+        return self.__write(('DELETE FROM entries WHERE version != ? OR created < ?',
+                             (suds.__version__, time.time() - lifetime)))
+
+    def evict(self, maxsize):
+        """
+        Delete the least recently used entries until the rest take at most I{maxsize} bytes.
+        @param maxsize: The maximum total size of the entries in bytes.
+        @type maxsize: int
+        @return: The number of entries deleted.
+        @rtype: int
+        """
+        try:
+            rows = self.__connection().execute('SELECT id, size FROM entries ORDER BY accessed DESC').fetchall()
+        except sqlite3.Error:
+            log.debug(self.path, exc_info=1)
+            return 0
+        total, evicted = 0, []
+        for id, size in rows:
+            total += size
+            if total > maxsize:
+                evicted.append((id,))
+        if not evicted:
+            return 0
+        return self.__write(('DELETE FROM entries WHERE id = ?', evicted), many=True)
+
+    def expired(self, created):
+        """
+        Check whether an entry has outlived the I{duration}.
+        @param created: The time the entry was stored.
+        @type created: float
+        @rtype: bool
+        """
+        lifetime = self.lifetime()
+        return lifetime is not None and created + lifetime < time.time()
+
+    def stamp(self, id):
+        """
+        Get a stamp which changes whenever the entry is replaced.
+        @param id: The cache id.
+        @type id: str
+        @return: (created, size) of the entry, or None if it doesn't exist.
+        @rtype: tuple
+        """
+        try:
+            row = self.__connection().execute('SELECT created, size FROM entries WHERE id = ? AND version = ?',
+                                              (id, suds.__version__)).fetchone()
+        except sqlite3.Error:
+            return None
+        return tuple(row) if row is not None else None
+
+    def __connection(self):
+        """
+        Get this thread's connection, connecting on first use.
+        """
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            if self.readonly:
+                # connecting would create it
+                if not os.path.exists(self.path):
+                    raise sqlite3.OperationalError('no database at %s' % self.path)
+            else:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+            connection = self.__local.connection = sqlite3.connect(self.path, timeout=self.timeout)
+        return connection
+
+    def __write(self, *statements, **kwargs):
+        """
+        Run statements in one transaction, unless read-only.
+        @param statements: SQL, or (SQL, parameters) tuples.
+        @param many: Run each statement for every parameter tuple.
+        @return: The number of rows changed by the last statement.
+        @rtype: int
+        """
+        if self.readonly:
+            return 0
+        changed = 0
+        try:
+            connection = self.__connection()
+            with connection:
+                for statement in statements:
+                    sql, parameters = statement if isinstance(statement, tuple) else (statement, ())
+                    if kwargs.get('many'):
+                        changed = connection.executemany(sql, parameters).rowcount
+                    else:
+                        changed = connection.execute(sql, parameters).rowcount
+        except (sqlite3.Error, OSError):
+            # e.g. a read-only file system
+            log.debug(self.path, exc_info=1)
+        return changed
+
+
+class MemoryCache(suds.cache.Cache):
+    """
+    Bounded in-memory LRU cache in front of another (on-disk) cache.
+    Entries expire with the backend's duration and are dropped when
+    the backing file changes. Entries are held pickled, so like the
+    backend every lookup returns a new object which the caller may modify.
+    @ivar backend: The cache being fronted.
+    @type backend: L{ExtendedFileCache}
+    @ivar maxsize: The maximum number of entries held in memory.
+    @type maxsize: int
+    @ivar recheck: Seconds between checks of the backing file for changes.
+    @type recheck: int
+    @ivar hits: Number of lookups served from memory.
+    @ivar misses: Number of lookups passed to the backend.
+    @ivar evictions: Number of entries dropped because of size, expiry or change.
+    """
+
+    def __init__(self, backend, maxsize=32, recheck=60):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.recheck = recheck
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        self.__tick = 0
+
+    def get(self, id):
+        now = time.time()
+        self.__lock.acquire()
+        try:
+            entry = self.__entries.get(id)
+            if entry is not None and not self.__valid(id, entry, now):
+                del self.__entries[id]
+                self.evictions += 1
+                entry = None
+            if entry is not None:
+                self.__tick += 1
+                entry[4] = self.__tick
+                self.hits += 1
+                data = entry[0]
+            else:
+                self.misses += 1
+                data = None
+        finally:
+            self.__lock.release()
+        if data is not None:
+            return pickle.loads(data)
+        object = self.backend.get(id)
+        if object is not None:
+            self.__store(id, object, now)
+        return object
+
+    def put(self, id, object):
+        object = self.backend.put(id, object)
+        self.__store(id, object, time.time())
+        return object
+
+    def purge(self, id):
+        self.__lock.acquire()
+        try:
+            self.__entries.pop(id, None)
+        finally:
+            self.__lock.release()
+        self.backend.purge(id)
+
+    def clear(self):
+        self.__lock.acquire()
+        try:
+            self.__entries.clear()
+        finally:
+            self.__lock.release()
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Get the cache counters.
+        @return: hits, misses, evictions and the current size.
+        @rtype: dict
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, size=len(self.__entries))
+
+    def __valid(self, id, entry, now):
+        data, stamp, expires, checked, tick = entry
+        if expires is not None and expires < now:
+            return False
+        if now - checked < self.recheck:
+            return True
+        if self.backend.stamp(id) != stamp:
+            return False
+        entry[3] = now
+        return True
+
+    def __store(self, id, object, now):
+        data = pickle.dumps(object, getattr(self.backend, 'protocol', pickle.HIGHEST_PROTOCOL))
+        stamp = self.backend.stamp(id)
+        lifetime = self.backend.lifetime()
+        expires = None
+        if lifetime is not None and stamp is not None:
+            expires = stamp[0] + lifetime
+        self.__lock.acquire()
+        try:
+            if id not in self.__entries and len(self.__entries) >= self.maxsize:
+                oldest = min(self.__entries, key=lambda k: self.__entries[k][4])
+                del self.__entries[oldest]
+                self.evictions += 1
+            self.__tick += 1
+            self.__entries[id] = [data, stamp, expires, now, self.__tick]
+        finally:
+            self.__lock.release()
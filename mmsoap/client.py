@@ -11,12 +11,29 @@
 # limitations under the License.
 #
 
+import itertools
+import threading
+import time
+import urllib2
+from StringIO import StringIO
+
 import suds
-from cache import ExtendedObjectCache
+from cache import ExtendedObjectCache, MemoryCache, SqliteObjectCache
 
+from suds.client import SoapClient
+from suds.transport import Request, TransportError
 from suds.transport.http import HttpTransport as SudsHttpTransport
 
+from .decoder import NativeDecoder, NativeService
+from .envelope import EnvelopeWriter, render
 from .exceptions import *
+from .metrics import Call, CountingReader, metered
+from .numbers import normalize
+from .records import BlockedNumberRecord, ReplyRecord, ReportRecord, iter_records
+from .registry import registry
+from .results import BatchResult, SendResult, TemplatedResult, decode_errors
+from .snapshot import SnapshotTransport
+from .templated import group_messages, read_csv
 
 
 class MMSoapClient(object):
@@ -28,27 +45,205 @@ class MMSoapClient(object):
     """
     WSDL_URL = "https://soap.m4u.com.au/?wsdl"
 
+    # limits for a single sendMessages request made by send_message_batch
+    BATCH_MAX_MESSAGES = 1000
+    BATCH_MAX_BYTES = 1024 * 1024
+
+    # rough serialised size of the xml wrapping a message and a recipient
+    MESSAGE_OVERHEAD = 256
+    RECIPIENT_OVERHEAD = 48
+
+    # cache_backend names -> classes of the WSDL cache
+    CACHE_BACKENDS = dict(file=ExtendedObjectCache, sqlite=SqliteObjectCache)
+
+    # in-memory cache tiers, shared by every service model using the same cache location and backend
+    _object_caches = {}
+
     def __init__(self, userId=None, password=None, **kwargs):
         """
         Initialise the SOAP client.
 
         :param userId: User ID for authenticating requests. Defaults to None.
         :param password: Password for authenticating requests. Defaults to None.
-        :param kwargs: Additional arguments to set on the client. Currently only 'cache_location' is supported.
+        :param kwargs: Additional arguments to set on the client:
+                       * cache_location -- directory of the WSDL cache.
+                       * cache_backend -- 'file' (default) for a file per cached document, 'sqlite' for
+                                          a single SQLite database in `cache_location` (see
+                                          cache.SqliteObjectCache), or a callable taking the location and
+                                          the cache duration, e.g. functools.partial(SqliteObjectCache,
+                                          readonly=True).
+                       * frozen -- directory of a WSDL snapshot written by ``mmsoap-snapshot --output``.
+                                   The WSDL and the documents it imports are loaded from it instead
+                                   of being fetched (see mmsoap.snapshot). Defaults to None.
+                       * fast_serializer -- write request envelopes from precompiled templates instead
+                                            of marshalling suds objects (see mmsoap.envelope).
+                                            Defaults to False.
+                       * transport -- suds transport for the SOAP calls, e.g. a PooledHttpTransport
+                                      (see mmsoap.transport) shared by several clients.
+                                      Defaults to a new WellBehavedHttpTransport.
+                       * normalize -- country calling code of national numbers, e.g. '61'. If given,
+                                      the recipients of send_messages, send_messages_with_retry,
+                                      block_numbers and unblock_numbers are converted to E.164 and
+                                      deduplicated, and malformed numbers are dropped (see mmsoap.numbers).
+                                      Defaults to None, which sends numbers as given.
+                       * blocklist -- a BlockList (see mmsoap.blocklist). Blocked recipients are removed
+                                      before sending, and the list is updated by block_numbers and
+                                      unblock_numbers. Defaults to None.
+                       * credit -- a CreditLedger (see mmsoap.credit). Every sendMessages request reserves
+                                   one credit per recipient first and is rejected or held back if the
+                                   account's credit, as of the last response, would run out. Defaults to None.
+                       * metrics -- a Metrics (see mmsoap.metrics) recording the latency, payload size
+                                    and errors of every operation. Defaults to None.
+                       * native_decoder -- decode replies with cElementTree into plain objects with the
+                                           same names as the suds objects, instead of unmarshalling them
+                                           through suds (see mmsoap.decoder). Defaults to False.
+                       * wsdl_url -- url of the WSDL. Defaults to WSDL_URL.
+                       * location -- url the SOAP requests are sent to instead of the one in the WSDL,
+                                     e.g. a local test server. Defaults to None.
+
+        The WSDL is not loaded until the first operation, or until load() is called.
+        """
+        if isinstance(kwargs.get('frozen'), bool) and kwargs['frozen']:
+            raise ValueError('frozen takes the directory of a WSDL snapshot, see mmsoap.snapshot')
+        self._kwargs = kwargs
+        self.metrics = kwargs.get('metrics')
+        self.fast_serializer = kwargs.get('fast_serializer', False)
+        self.envelopes = EnvelopeWriter(self) if self.fast_serializer else None
+        self.normalize = kwargs.get('normalize')
+        self.blocklist = kwargs.get('blocklist')
+        self.credit = kwargs.get('credit')
+        self.native_decoder = kwargs.get('native_decoder', False)
+
+        self._userId = userId
+        self._password = password
+        self._model = None
+        self._client = None
+        self._authentication = None
+        self._service = None
+        self.decoder = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """ The shared ServiceModel of the WSDL, loaded on first use. """
+        if self._model is None:
+            self.load()
+        return self._model
+
+    @property
+    def client(self):
+        """ The suds client, created on first use. """
+        if self._client is None:
+            self.load()
+        return self._client
+
+    @property
+    def service(self):
+        """ The operations of the suds client, decoding replies natively with ``native_decoder``. """
+        if self._service is None:
+            self.load()
+        return self._service
+
+    @property
+    def authentication(self):
+        """ The AuthenticationType sent with every request, created on first use. """
+        if self._authentication is None:
+            self.load()
+        return self._authentication
+
+    def load(self):
         """
-        object_cache = ExtendedObjectCache()
-        object_cache.setduration(days=10)
-        if 'cache_location' in kwargs:
-            object_cache.setlocation(kwargs["cache_location"])
+        Load the WSDL (or take the already parsed service model) and create the suds client now
+        rather than on the first operation.
+        """
+        with self._lock:
+            if self._authentication is not None:
+                return
+
+            kwargs = self._kwargs
+            options = dict(transport=kwargs.get('transport') or WellBehavedHttpTransport())
+            if self.metrics is not None:
+                options['plugins'] = [self.metrics.plugin]
+            if kwargs.get('location'):
+                options['location'] = kwargs['location']
+            if self.native_decoder:
+                # suds returns the reply xml, which the NativeService decodes
+                options['retxml'] = True
+
+            model = self._service_model(kwargs.get('cache_location'), kwargs.get('frozen'),
+                                        kwargs.get('wsdl_url'), kwargs.get('cache_backend'))
+            client = model.clone(**options)
+
+            authentication = client.factory.create('AuthenticationType')
+            if self._userId is not None:
+                authentication.userId = self._userId
+            if self._password is not None:
+                authentication.password = self._password
+
+            if self.native_decoder:
+                self.decoder = NativeDecoder(model)
+                self._service = NativeService(client, self.decoder)
+            else:
+                self._service = client.service
+            self._model, self._client, self._authentication = model, client, authentication
 
-        self.client = suds.client.Client(self.WSDL_URL,
-                                         cache=object_cache,
-                                         transport=WellBehavedHttpTransport())
+    @classmethod
+    def warmup(cls, cache_location=None, frozen=None, wsdl_url=None, cache_backend=None):
+        """
+        Parse the WSDL ahead of time.
+
+        Clients created afterwards with the same `cache_location`, `frozen`, `wsdl_url` and
+        `cache_backend` share the parsed service model and are cheap to construct.
+
+        :param cache_location: Location of the WSDL cache, as passed to the constructor.
+        :param frozen: Directory of the WSDL snapshot, as passed to the constructor.
+        :param wsdl_url: url of the WSDL, as passed to the constructor.
+        :param cache_backend: Backend of the WSDL cache, as passed to the constructor.
+        """
+        cls._service_model(cache_location, frozen, wsdl_url, cache_backend)
+
+    @classmethod
+    def _service_model(cls, cache_location=None, frozen=None, wsdl_url=None, cache_backend=None):
+        """ Get the process-wide service model for this WSDL and cache location. """
+        wsdl_url = wsdl_url or cls.WSDL_URL
+        return registry.get((wsdl_url, cache_location, frozen, cache_backend),
+                            lambda: cls._build_service_client(cache_location, frozen, wsdl_url, cache_backend))
+
+    @classmethod
+    def object_cache(cls, cache_location=None, cache_backend=None):
+        """
+        Get the in-memory cache in front of the on-disk WSDL cache at `cache_location`.
 
-        self.authentication = self.create('AuthenticationType')
-        if userId and password:
-            self.authentication.userId = userId
-            self.authentication.password = password
+        Its ``stats()`` show whether building clients had to go to disk.
+
+        :param cache_backend: See the constructor.
+        """
+        key = (cache_location, cache_backend)
+        cache = cls._object_caches.get(key)
+        if cache is None:
+            backend = cls.CACHE_BACKENDS.get(cache_backend or 'file', cache_backend)
+            if not callable(backend):
+                raise ValueError('unknown cache backend %r' % (cache_backend,))
+            # the location is passed to the constructor so the suds version is checked there
+            object_cache = backend(cache_location, days=10)
+            cache = cls._object_caches.setdefault(key, MemoryCache(object_cache))
+        return cache
+
+    @classmethod
+    def _build_service_client(cls, cache_location=None, frozen=None, wsdl_url=None, cache_backend=None):
+        """ Create the suds client which parses the WSDL. Only called once per service model. """
+        wsdl_url = wsdl_url or cls.WSDL_URL
+        if frozen:
+            # the snapshot is read straight from its directory, so the on-disk cache (and its
+            # suds version check) is not involved at all
+            transport = SnapshotTransport(WellBehavedHttpTransport(), frozen)
+            if wsdl_url not in transport.documents:
+                raise SnapshotMissingException('No snapshot of %s in %s' % (wsdl_url, frozen))
+            return suds.client.Client(wsdl_url, cache=suds.cache.NoCache(), transport=transport)
+
+        return suds.client.Client(wsdl_url,
+                                  cache=cls.object_cache(cache_location, cache_backend),
+                                  transport=WellBehavedHttpTransport())
 
     def create(self, object_name):
         """Short-hand for creating WSDL objects."""
@@ -56,20 +251,26 @@ class MMSoapClient(object):
 
     def set_userId(self, userId):
         """ Set user id on the authentication element. """
-        self.authentication.userId = userId
+        self._userId = userId
+        if self._authentication is not None:
+            self._authentication.userId = userId
 
     def set_password(self, password):
         """ Set password on the authentication element. """
-        self.authentication.password = password
+        self._password = password
+        if self._authentication is not None:
+            self._authentication.password = password
 
+    @metered('check_user')
     def check_user(self):
         """
         Check user account details.
 
         :return: The account details including used and remaining credit limits.
         """
-        return self.client.service.checkUser(self.authentication).accountDetails
+        return self.service.checkUser(self.authentication).accountDetails
 
+    @metered('send_messages')
     def send_messages(self, recipients, content, send_mode='normal', scheduled=None, report=None, seq=None):
         """
         Send a single message to `recipients`.
@@ -85,13 +286,214 @@ class MMSoapClient(object):
         :param report: Request a delivery report for this message.
 
         :return: Response containing count of sent, scheduled, failed and any associated error code types.
+                 With ``normalize`` each recipient's uid is the position of its first occurrence in `recipients`.
+        :raises RecipientBlockedException: If every recipient is in the client's blocklist.
+        """
+        recipients, uids = self.prepare_recipients(recipients)
+        message = dict(recipients=recipients, uids=uids, content=content, scheduled=scheduled, report=report,
+                       seq=seq)
+        response = self._send_message_list([message], send_mode)
+
+        self.raise_for_response(response)
+
+        return response
+
+    @metered('send_messages_with_retry')
+    def send_messages_with_retry(self, recipients, content, send_mode='normal', scheduled=None, report=None,
+                                 retries=3, delay=1.0, sleep=time.sleep):
+        """
+        Send a single message to `recipients`, resending only to recipients whose errors are retryable.
+
+        Each recipient's uid is its 0-based position in `recipients`. Recipients which fail
+        permanently (e.g. invalid or blocked) are never resent, and neither are recipients
+        without an error, so a retry never duplicates a delivered message. An error without
+        a uid is an error of the whole message: if it is retryable, every recipient of the
+        attempt without a permanent error is resent. Errors are returned rather than raised.
+
+        :param recipients: Iterable of recipient numbers
+        :param content: Message content
+        :param send_mode: See send_messages.
+        :param scheduled: Scheduled date/time of the message in UTC format.
+        :param report: Request a delivery report for this message.
+        :param retries: Maximum number of resends.
+        :param delay: Seconds to wait before the first resend, doubled for every following one.
+        :param sleep: Function called with the number of seconds to wait before each resend.
+                      Defaults to time.sleep, which blocks the calling thread.
+
+        :return: SendResult with the errors remaining after the last attempt.
+        """
+        recipients, uids = self.prepare_recipients(recipients)
+        pending = list(itertools.izip(uids, recipients)) if uids is not None else list(enumerate(recipients))
+        result = SendResult()
+
+        for attempt in range(retries + 1):
+            message = dict(recipients=[r for uid, r in pending], uids=[uid for uid, r in pending],
+                           content=content, scheduled=scheduled, report=report, seq=1)
+            response = self._send_message_list([message], send_mode)
+            errors = decode_errors(response)
+            result.add(response, errors, message['uids'])
+
+            if any(e.uid is None and e.retryable for e in errors):
+                permanent = set(e.uid for e in errors if e.permanent)
+                pending = [(uid, r) for uid, r in pending if uid not in permanent]
+            else:
+                recipients_by_uid = dict(pending)
+                pending = [(e.uid, recipients_by_uid[e.uid]) for e in errors
+                           if e.retryable and e.uid in recipients_by_uid]
+            if not pending or attempt == retries:
+                break
+
+            result.retried += len(pending)
+            if self.metrics is not None:
+                self.metrics.retried(len(pending))
+            sleep(delay * 2 ** attempt)
+
+        return result
+
+    def normalize_recipients(self, recipients, counts=None):
+        """
+        Apply the ``normalize`` option to a list of recipients.
+
+        :param recipients: Iterable of recipient numbers
+        :param counts: dict the numbers of ``invalid`` and ``duplicate`` recipients removed are added to.
+        :return: (recipients, uids). Without ``normalize`` these are `recipients` unchanged and None.
+                 Otherwise the distinct valid E.164 numbers and the position of each one's first
+                 occurrence in `recipients`.
+        :raises InvalidRecipientException: If no valid recipient is left.
+        """
+        if not self.normalize:
+            return recipients, None
+
+        normalized = normalize(recipients, self.normalize)
+        if counts is not None:
+            counts['invalid'] = counts.get('invalid', 0) + len(normalized.rejected)
+            counts['duplicate'] = counts.get('duplicate', 0) + normalized.duplicates
+        if not normalized.numbers:
+            raise InvalidRecipientException()
+        return normalized.numbers, normalized.first_positions()
+
+    def prepare_recipients(self, recipients, counts=None):
+        """
+        Apply the ``normalize`` and ``blocklist`` options to the recipients of a message.
+
+        :param recipients: Iterable of recipient numbers
+        :param counts: dict the numbers of ``invalid``, ``duplicate`` and ``blocked`` recipients removed
+                       are added to, also when an exception is raised.
+        :return: (recipients, uids), where uids is None if the recipients are unchanged.
+        :raises InvalidRecipientException: If no valid recipient is left.
+        :raises RecipientBlockedException: If every recipient is blocked.
+        """
+        recipients, uids = self.normalize_recipients(recipients, counts)
+        if self.blocklist is None:
+            return recipients, uids
+
+        self.blocklist.refresh(self)
+        recipients, uids, blocked = self.blocklist.filter(recipients, uids)
+        if counts is not None:
+            counts['blocked'] = counts.get('blocked', 0) + blocked
+        if not recipients and blocked:
+            raise RecipientBlockedException()
+        return recipients, uids
+
+    @metered('send_message_batch')
+    def send_message_batch(self, messages, send_mode='normal', max_messages=None, max_bytes=None, result=None):
+        """
+        Send many messages, packing them into as few sendMessages requests as possible.
+
+        :param messages: Iterable of dicts, one per message, with the keys ``recipients`` and ``content``
+                         and optionally ``scheduled``, ``report`` (see send_messages) and ``uids``
+                         (see create_message).
+        :param send_mode: See send_messages.
+        :param max_messages: Maximum number of messages per request. Defaults to BATCH_MAX_MESSAGES.
+        :param max_bytes: Approximate maximum payload size per request. Defaults to BATCH_MAX_BYTES.
+        :param result: BatchResult the response of each request is added to as soon as it arrives, so if
+                       a request raises it holds the requests sent before. Defaults to a new one.
+
+        :return: BatchResult merged over all requests. Each message's sequence number is its
+                 1-based position in `messages`. Errors are not raised but recorded per sequence number.
+        """
+        return self._send_batch(messages, send_mode, max_messages, max_bytes,
+                                result if result is not None else BatchResult())
+
+    @metered('send_templated')
+    def send_templated(self, template, rows, send_mode='normal', scheduled=None, report=None,
+                       recipient_field='recipient', window=None, max_recipients=None,
+                       max_messages=None, max_bytes=None):
+        """
+        Send a personalised message per row, grouping recipients of identical messages.
+
+        The content of every row is rendered from `template`. Recipients whose content,
+        schedule and report flag are the same are sent as one message, and the messages
+        are packed into as few sendMessages requests as possible (see send_message_batch).
+        Rows are streamed, so memory use doesn't depend on their number. The ``normalize``
+        and ``blocklist`` options apply to the recipients of each message.
+
+        Example::
+
+            result = client.send_templated('Hi {name}, your code is {code}', 'customers.csv')
+            print result.requests_saved
+
+        :param template: A format string, e.g. 'Hi {name}', a string.Template or a callable
+                         taking the row and returning the content.
+        :param rows: Iterable of dicts, or the path or file object of a CSV file with a header line.
+        :param send_mode: See send_messages.
+        :param scheduled: Scheduled date/time of the messages, overridden by a ``scheduled`` column.
+        :param report: Request delivery reports, overridden by a ``report`` column.
+        :param recipient_field: Column holding the recipient number.
+        :param window: Rows grouped at a time. Defaults to mmsoap.templated.WINDOW.
+        :param max_recipients: Maximum recipients per message. Defaults to mmsoap.templated.MAX_RECIPIENTS.
+        :param max_messages: See send_message_batch.
+        :param max_bytes: See send_message_batch.
+
+        :return: TemplatedResult with the numbers of rows, messages and requests, and errors by row.
+        """
+        if isinstance(rows, basestring) or hasattr(rows, 'read'):
+            rows = read_csv(rows)
+
+        result = TemplatedResult()
+        options = dict(recipient_field=recipient_field, scheduled=scheduled, report=report,
+                       prepare=self.prepare_recipients if self.normalize or self.blocklist is not None else None)
+        if window:
+            options['window'] = window
+        if max_recipients:
+            options['max_recipients'] = max_recipients
+
+        return self._send_batch(group_messages(rows, template, result, **options), send_mode,
+                                max_messages, max_bytes, result)
+
+    def _send_batch(self, messages, send_mode, max_messages, max_bytes, result):
+        """ Send messages in as few sendMessages requests as possible, adding the responses to `result`. """
+        for chunk in self._chunk_messages(messages,
+                                          max_messages or self.BATCH_MAX_MESSAGES,
+                                          max_bytes or self.BATCH_MAX_BYTES):
+            response = self._send_message_list([dict(message, seq=seq) for seq, message in chunk], send_mode)
+            result.add(response, [seq for seq, message in chunk])
+
+        return result
+
+    def create_message(self, recipients, content, scheduled=None, report=None, seq=None, uids=None):
+        """
+        Create a MessageType.
+
+        :param recipients: Iterable of recipient numbers
+        :param content: Message content
+        :param scheduled: Scheduled date/time of the message in UTC format.
+        :param report: Request a delivery report for this message.
+        :param seq: Sequence number of the message within its request.
+        :param uids: Iterable of uids, one per recipient, returned with any error for that recipient.
+                     Defaults to the 0-based position of each recipient in `recipients`.
+
+        :return: The MessageType.
         """
         recipients_type = self.create('RecipientsType')
 
-        for recipient in recipients:
+        if uids is None:
+            uids = itertools.count()
+
+        for uid, recipient in itertools.izip(uids, recipients):
             this_recipient = self.create('RecipientType')
             this_recipient.value = recipient
-            # add uid here
+            this_recipient._uid = uid
             recipients_type.recipient.append(this_recipient)
 
         message = self.create('MessageType')
@@ -107,18 +509,87 @@ class MMSoapClient(object):
         if report:
             message.deliveryReport = report
 
+        return message
+
+    def _send_message_list(self, messages, send_mode):
+        """ Send messages, given as dicts of create_message arguments, in one sendMessages request. """
+        if self.credit is None:
+            return self._send_message_list_now(messages, send_mode)
+
+        messages = [dict(message, recipients=list(message['recipients'])) for message in messages]
+        credits = sum(len(message['recipients']) for message in messages)
+        ticket = self.credit.reserve(credits)
+        response = None
+        try:
+            response = self._send_message_list_now(messages, send_mode)
+        finally:
+            self.credit.settle(credits, getattr(response, 'accountDetails', None), ticket)
+        return response
+
+    def _send_message_list_now(self, messages, send_mode):
+        """ Send messages in one sendMessages request, without reserving credit. """
+        if self.fast_serializer:
+            return self.envelopes.send('sendMessages', self.envelopes.send_messages(messages, send_mode))
+
+        message_list = [self.create_message(**message) for message in messages]
+        return self.service.sendMessages(self.authentication,
+                                         self._send_messages_body(message_list, send_mode))
+
+    def _send_messages_body(self, messages, send_mode):
+        """ Create the SendMessagesBodyType for a MessageType or a list of them. """
         message_list = self.create('MessageListType')
-        message_list.message = message
+        message_list.message = messages
         message_list._sendMode = send_mode
 
         request_body = self.create('SendMessagesBodyType')
         request_body.messages = message_list
 
-        response = self.client.service.sendMessages(self.authentication, request_body)
+        return request_body
 
-        self.raise_for_response(response)
+    def _call(self, operation, build, items):
+        """
+        Call an operation whose request body is a list of simple items.
 
-        return response
+        :param operation: Name of the operation, e.g. 'confirmReplies'.
+        :param build: Name of the method creating the request body from `items`.
+        :param items: Iterable of values.
+        """
+        if self.fast_serializer:
+            return self.envelopes.send(operation, self.envelopes.items(operation, build, items))
+
+        return getattr(self.service, operation)(self.authentication, getattr(self, build)(items))
+
+    def _chunk_messages(self, messages, max_messages, max_bytes):
+        """
+        Split `messages` into lists of (sequence number, message) within the given limits.
+        A single message larger than `max_bytes` is sent in a request of its own.
+        """
+        chunk, size = [], 0
+
+        for seq, message in enumerate(messages, 1):
+            message = dict(message, recipients=list(message['recipients']))
+            if message.get('uids') is not None:
+                message['uids'] = list(message['uids'])
+            message_size = self._message_size(message)
+
+            if chunk and (len(chunk) >= max_messages or size + message_size > max_bytes):
+                yield chunk
+                chunk, size = [], 0
+
+            chunk.append((seq, message))
+            size += message_size
+
+        if chunk:
+            yield chunk
+
+    def _message_size(self, message):
+        """ Estimate the serialised size of a message in bytes. """
+        content = message['content'] or ''
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+
+        return (self.MESSAGE_OVERHEAD + len(content) +
+                sum(len('%s' % (r,)) + self.RECIPIENT_OVERHEAD for r in message['recipients']))
 
     def raise_for_response(self, response):
         """
@@ -144,23 +615,48 @@ class MMSoapClient(object):
         except AttributeError:
             pass
 
-    def check_replies(self, maximum_replies=None):
+    @metered('check_replies')
+    def check_replies(self, maximum_replies=None, records=False):
         """
         Check replies to any sent messages.
 
         :param maximum_replies: Limits the number of replies returned in the response.
                                 Default is to return all if this value isn't supplied.
+        :param records: Return ReplyRecords decoded straight from the response instead of suds objects.
+                        They take a fraction of the memory. Defaults to False.
 
         :return: Iterable containing the replies, never null.
         """
+        if records:
+            return list(self._stream('checkReplies', self._check_replies_body(maximum_replies), 'reply', ReplyRecord))
+        response = self.service.checkReplies(self.authentication,
+                                             self._check_replies_body(maximum_replies))
+        # the replies are in a list element, older code found them on the result itself
+        replies = response.replies if 'replies' in response else response
+        return replies.reply if replies is not None and 'reply' in replies else []
+
+    def iter_replies(self, maximum_replies=None):
+        """
+        Check replies like check_replies, but parse the response incrementally.
+
+        :param maximum_replies: Limits the number of replies returned in the response.
+                                Default is to return all if this value isn't supplied.
+
+        :return: Generator of ReplyRecord. Memory use doesn't depend on the number of replies.
+        """
+        return self._stream('checkReplies', self._check_replies_body(maximum_replies), 'reply', ReplyRecord,
+                            name='iter_replies')
+
+    def _check_replies_body(self, maximum_replies):
+        """ Create the CheckRepliesBodyType for check_replies. """
         request_body = self.create('CheckRepliesBodyType')
 
-        if maximum_replies is int and maximum_replies >= 0:
+        if isinstance(maximum_replies, int) and maximum_replies >= 0:
             request_body.maximumReplies = maximum_replies
 
-        response = self.client.service.checkReplies(self.authentication, request_body)
-        return response.reply if 'reply' in response else []
+        return request_body
 
+    @metered('confirm_replies')
     def confirm_replies(self, message_receipt_ids):
         """
         Confirm replies which were previously retrieved with the check_replies function.
@@ -171,6 +667,10 @@ class MMSoapClient(object):
 
         :return: Response containing the number of replies confirmed.
         """
+        return self._call('confirmReplies', '_confirm_replies_body', message_receipt_ids)
+
+    def _confirm_replies_body(self, message_receipt_ids):
+        """ Create the ConfirmRepliesBodyType for confirm_replies. """
         confirm_reply_list = self.create('ConfirmReplyListType')
         for receipt_id in message_receipt_ids:
             this_confirm_item = self.create('ConfirmItemType')
@@ -179,25 +679,96 @@ class MMSoapClient(object):
         request_body = self.create('ConfirmRepliesBodyType')
         request_body.replies = confirm_reply_list
 
-        return self.client.service.confirmReplies(self.authentication, request_body)
+        return request_body
 
-    def check_reports(self, maximum_reports=None):
+    @metered('check_reports')
+    def check_reports(self, maximum_reports=None, records=False):
         """
         Check delivery reports to any sent messages.
 
         :param maximum_reports: Limits the number of reports returned in the response.
                                 Default is to return all if this value isn't supplied.
+        :param records: Return ReportRecords decoded straight from the response instead of suds objects.
+                        They take a fraction of the memory. Defaults to False.
 
         :return: Iterable containing the reports, never null.
         """
+        if records:
+            return list(self._stream('checkReports', self._check_reports_body(maximum_reports), 'report',
+                                     ReportRecord))
+        response = self.service.checkReports(self.authentication,
+                                             self._check_reports_body(maximum_reports))
+        reports = response.reports if 'reports' in response else response
+        return reports.report if reports is not None and 'report' in reports else []
+
+    def iter_reports(self, maximum_reports=None):
+        """
+        Check delivery reports like check_reports, but parse the response incrementally.
+
+        :param maximum_reports: Limits the number of reports returned in the response.
+                                Default is to return all if this value isn't supplied.
+
+        :return: Generator of ReportRecord. Memory use doesn't depend on the number of reports.
+        """
+        return self._stream('checkReports', self._check_reports_body(maximum_reports), 'report', ReportRecord,
+                            name='iter_reports')
+
+    def _check_reports_body(self, maximum_reports):
+        """ Create the CheckReportsBodyType for check_reports. """
         request_body = self.create('CheckReportsBodyType')
 
-        if maximum_reports is int and maximum_reports >= 0:
+        if isinstance(maximum_reports, int) and maximum_reports >= 0:
             request_body.maximumReports = maximum_reports
 
-        response = self.client.service.checkReports(self.authentication, request_body)
-        return response.report if 'report' in response else []
+        return request_body
 
+    def _stream(self, operation, request_body, tag, record_type, name=None):
+        """
+        Send a request and parse the response incrementally into records.
+
+        The reply is read straight from the connection when the transport supports
+        ``stream()``, otherwise from the buffered reply. The suds plugin doesn't see
+        these requests, so they are metered here: as the operation `name`, recorded
+        once the records are exhausted, or by default as part of the current metered call.
+        """
+        call = None
+        if self.metrics is not None:
+            call = Call(name) if name is not None else self.metrics.current()
+        try:
+            method = getattr(self.client.service, operation).method
+            soap_client = SoapClient(self.client, method)
+
+            xml = render(self, operation, self.authentication, request_body)
+            request = Request(soap_client.location(), xml.encode('utf-8'))
+            request.headers = soap_client.headers()
+
+            transport = self.client.options.transport
+            sent = time.time()
+            try:
+                if hasattr(transport, 'stream'):
+                    fp = transport.stream(request)
+                else:
+                    fp = StringIO(transport.send(request).message)
+            except TransportError as e:
+                # raises a WebFault for SOAP faults
+                soap_client.failed(method.binding.output, e)
+                raise
+        except Exception as e:
+            if call is not None and name is not None:
+                self.metrics.failed(call, e)
+                call.total = time.time() - call.started
+                self.metrics.record(call)
+            raise
+
+        if call is None:
+            return iter_records(fp, tag, record_type)
+        call.requests += 1
+        call.request_bytes += len(request.message)
+        call.transport += time.time() - sent
+        fp = CountingReader(fp)
+        return self.metrics.stream(call, fp, iter_records(fp, tag, record_type), own=name is not None)
+
+    @metered('confirm_reports')
     def confirm_reports(self, delivery_report_ids):
         """
         Confirm reports which were previously retrieved with the check_reports function.
@@ -208,18 +779,23 @@ class MMSoapClient(object):
 
         :return: Response containing the number of reports confirmed.
         """
+        return self._call('confirmReports', '_confirm_reports_body', delivery_report_ids)
+
+    def _confirm_reports_body(self, delivery_report_ids):
+        """ Create the ConfirmReportsBodyType for confirm_reports. """
         confirm_report_list = self.create('ConfirmReportListType')
 
         for report_id in delivery_report_ids:
             this_confirm_item = self.create('ConfirmItemType')
-            this_confirm_item._deliveryReportd = report_id
+            this_confirm_item._deliveryReportId = report_id
             confirm_report_list.report.append(this_confirm_item)
 
         request_body = self.create('ConfirmReportsBodyType')
         request_body.reports = confirm_report_list
 
-        return self.client.service.confirmReports(self.authentication, request_body)
+        return request_body
 
+    @metered('delete_scheduled_messages')
     def delete_scheduled_messages(self, message_ids):
         """
         Delete scheduled messages.
@@ -229,6 +805,10 @@ class MMSoapClient(object):
 
         :return: Response containing the count of unscheduled messages.
         """
+        return self._call('deleteScheduledMessages', '_delete_scheduled_messages_body', message_ids)
+
+    def _delete_scheduled_messages_body(self, message_ids):
+        """ Create the DeleteScheduledMessagesBodyType for delete_scheduled_messages. """
         messages = self.create('MessageIdListType')
 
         for msg_id in message_ids:
@@ -239,8 +819,9 @@ class MMSoapClient(object):
         request_body = self.create('DeleteScheduledMessagesBodyType')
         request_body.messages = messages
 
-        return self.client.service.deleteScheduledMessages(self.authentication, request_body)
+        return request_body
 
+    @metered('block_numbers')
     def block_numbers(self, numbers):
         """
         Blocks a list of numbers.
@@ -251,26 +832,40 @@ class MMSoapClient(object):
                  If there are failures the response will contain an associate error code type
                  containing the recipient that was in error.
         """
-        request = self.create_recipients_request_body('BlockNumbersBodyType', numbers)
-        return self.client.service.blockNumbers(self.authentication, request)
+        numbers = list(self.normalize_recipients(numbers)[0])
+        response = self._call('blockNumbers', '_block_numbers_body', numbers)
+        if self.blocklist is not None:
+            self.blocklist.blocked(numbers, response)
+        return response
+
+    def _block_numbers_body(self, numbers):
+        """ Create the BlockNumbersBodyType for block_numbers. """
+        return self.create_recipients_request_body('BlockNumbersBodyType', numbers)
 
-    def get_blocked_numbers(self, maximum_numbers=None):
+    @metered('get_blocked_numbers')
+    def get_blocked_numbers(self, maximum_numbers=None, records=False):
         """
         Retrieves currently blocked numbers.
 
         :param maximum_numbers: Max number of recipients to return in the response.
                                 Defaults to ll items returned if this value is not supplied.
+        :param records: Return BlockedNumberRecords decoded straight from the response instead of
+                        suds objects. Defaults to False.
 
         :return: Response containing the blocked numbers, never null.
         """
         request_body = self.create('GetBlockedNumbersBodyType')
 
-        if maximum_numbers is int and maximum_numbers >= 0:
+        if isinstance(maximum_numbers, int) and maximum_numbers >= 0:
             request_body.maximumRecipients = maximum_numbers
 
-        response = self.client.service.getBlockedNumbers(self.authentication, request_body)
+        if records:
+            return list(self._stream('getBlockedNumbers', request_body, 'recipient', BlockedNumberRecord))
+
+        response = self.service.getBlockedNumbers(self.authentication, request_body)
         return response.recipients.recipient if 'recipient' in response.recipients else []
 
+    @metered('unblock_numbers')
     def unblock_numbers(self, numbers):
         """
         Unblocks a list of numbers.
@@ -281,8 +876,15 @@ class MMSoapClient(object):
         :return: Count of unblocked and failed. If there are failures the response will contain
                  an associate error code type containing the recipient that was in error.
         """
-        request = self.create_recipients_request_body('UnblockNumbersBodyType', numbers)
-        return self.client.service.unblockNumbers(self.authentication, request)
+        numbers = list(self.normalize_recipients(numbers)[0])
+        response = self._call('unblockNumbers', '_unblock_numbers_body', numbers)
+        if self.blocklist is not None:
+            self.blocklist.unblocked(numbers, response)
+        return response
+
+    def _unblock_numbers_body(self, numbers):
+        """ Create the UnblockNumbersBodyType for unblock_numbers. """
+        return self.create_recipients_request_body('UnblockNumbersBodyType', numbers)
 
     def create_recipients(self, recipients):
         recipients_type = self.create('RecipientsType')
@@ -336,3 +938,20 @@ class WellBehavedHttpTransport(SudsHttpTransport):
         behaves correctly.
         """
         return []
+
+    def stream(self, request):
+        """
+        Send a SOAP request like ``send``, but return the open reply
+        instead of reading it into memory.
+
+        :param request: A suds transport Request.
+        :return: File-like object with the reply body. The caller must close it.
+        """
+        u2request = urllib2.Request(request.url, request.message, request.headers)
+        self.addcookies(u2request)
+        try:
+            fp = self.u2open(u2request)
+        except urllib2.HTTPError as e:
+            raise TransportError(e.msg, e.code, e.fp)
+        self.getcookies(fp, u2request)
+        return fp
@@ -0,0 +1,152 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Client-side credit ledger fed by the account details of every response.
+"""
+
+import threading
+import time
+
+from .exceptions import InsufficientCreditException
+
+
+class CreditLedger(object):
+    """
+    Tracks the account's remaining credit without extra checkUser calls.
+
+    Every sendMessages response carries the account details, which replace the
+    ledger's balance unless a request sent later already did, so a late response
+    never overwrites a newer balance. Before a request is sent its credits, one per recipient, are
+    reserved against the balance minus the credits of requests still in flight, and
+    requests which don't fit are rejected with InsufficientCreditException or, with
+    `wait`, held until earlier requests settle or resync() finds more credit.
+
+    Until the first response or resync() the balance is unknown and nothing is held back.
+    Only resync() calls checkUser.
+
+    Example::
+
+        ledger = CreditLedger()
+        client = MMSoapClient(user, password, credit=ledger)
+        ledger.resync(client)   # optional, otherwise the first send sets the balance
+    """
+
+    def __init__(self, wait=False, timeout=None):
+        """
+        :param wait: Wait for credit instead of raising InsufficientCreditException.
+        :param timeout: Maximum seconds to wait for credit, None to wait forever.
+        """
+        self.wait = wait
+        self.timeout = timeout
+        self.type = None
+        self.limit = None
+        self.remaining = None
+        self.reserved = 0
+        self.updated = None
+        self.issued = 0     # tickets handed out to requests, in the order they were sent
+        self.applied = 0    # ticket of the request the balance was last set from
+        self.condition = threading.Condition()
+
+    @property
+    def available(self):
+        """ Credits which can be reserved, None if the balance is unknown. """
+        if self.remaining is None:
+            return None
+        return self.remaining - self.reserved
+
+    def ticket(self):
+        """ Number a request about to be sent, for update() and settle(). """
+        with self.condition:
+            self.issued += 1
+            return self.issued
+
+    def update(self, account_details, ticket=None):
+        """
+        Set the balance from the account details of a response.
+
+        :param account_details: accountDetails of a checkUser or sendMessages response. None is ignored.
+        :param ticket: ticket() taken before the request was sent. The details are ignored if a
+                       request sent later already set the balance. None always sets it.
+        """
+        with self.condition:
+            self._set(account_details, ticket)
+            self.condition.notify_all()
+
+    def resync(self, client):
+        """
+        Set the balance from a checkUser call.
+
+        :param client: MMSoapClient of the account.
+        :return: The account details.
+        """
+        ticket = self.ticket()
+        details = client.check_user()
+        self.update(details, ticket)
+        return details
+
+    def reserve(self, credits, wait=None, timeout=None):
+        """
+        Reserve credits for a request.
+
+        :param credits: Credits needed, usually the number of recipients.
+        :param wait: Overrides the ledger's `wait`.
+        :param timeout: Overrides the ledger's `timeout`.
+        :return: The ticket of the request, for settle().
+        :raises InsufficientCreditException: If the credits are not available (in time).
+        """
+        wait = self.wait if wait is None else wait
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self.condition:
+            while self.available is not None and self.available < credits:
+                if not wait or (self.limit is not None and credits > self.limit):
+                    raise InsufficientCreditException()
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise InsufficientCreditException()
+                    self.condition.wait(remaining)
+            self.reserved += credits
+            self.issued += 1
+            return self.issued
+
+    def settle(self, credits, account_details=None, ticket=None):
+        """
+        Release a reservation once its request finished.
+
+        :param credits: Credits reserved for the request.
+        :param account_details: accountDetails of the response, None if the request failed.
+        :param ticket: The ticket reserve() returned, see update().
+        """
+        with self.condition:
+            self.reserved -= credits
+            self._set(account_details, ticket)
+            self.condition.notify_all()
+
+    def _set(self, account_details, ticket):
+        remaining = getattr(account_details, '_creditRemaining', None)
+        if remaining is None:
+            return
+        if ticket is not None:
+            if ticket < self.applied:
+                return
+            self.applied = ticket
+        limit = getattr(account_details, '_creditLimit', None)
+        self.type = getattr(account_details, '_type', self.type)
+        self.limit = self.limit if limit is None else int(limit)
+        self.remaining = int(remaining)
+        self.updated = time.time()
@@ -0,0 +1,251 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Native decoder of SOAP replies, used by MMSoapClient with ``native_decoder``.
+
+suds parses a reply into its own DOM and unmarshals it into dynamic objects.
+Instead the reply is parsed with cElementTree straight into plain Result objects
+with the same names as the suds objects: attributes are prefixed with an
+underscore (``_sent``, ``_creditRemaining``), elements are named as in the
+schema (``accountDetails``, ``errors``), repeated elements are lists and the
+text of elements with attributes is ``value``. Which elements repeat and how
+values are converted comes from the schema, so the results match the suds ones.
+
+SOAP 1.1 and SOAP 1.2 envelopes are both decoded; the envelope, body and fault
+are found by their local names, like suds does.
+"""
+
+from suds.plugin import PluginContainer
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+NIL = '{http://www.w3.org/2001/XMLSchema-instance}nil'
+
+
+class Result(object):
+    """
+    Plain object of a decoded element. Like suds objects it supports ``in``,
+    indexing by name or by position, and iterating over (name, value) pairs.
+
+    Positions follow the order the values were decoded in, attributes first and
+    then the child elements in document order, so ``response.errors[0][0]`` is
+    the first error like with suds.
+    """
+    __slots__ = ('__dict__', '__keylist__')
+
+    def __init__(self):
+        self.__keylist__ = []
+
+    def __contains__(self, name):
+        return name in self.__dict__
+
+    def __getitem__(self, name):
+        if isinstance(name, (int, long)):
+            return self.__dict__[self.__keylist__[name]]
+        if isinstance(name, slice):
+            return [self.__dict__[key] for key in self.__keylist__[name]]
+        return self.__dict__[name]
+
+    def __iter__(self):
+        return iter(sorted(self.__dict__.items()))
+
+    def __len__(self):
+        return len(self.__dict__)
+
+    def __repr__(self):
+        return '(%s)%r' % (type(self).__name__, self.__dict__)
+
+
+class Shape(object):
+    """
+    What the decoder needs to know about a schema type.
+
+    :ivar attributes: dict of attribute name to converter, None for text.
+    :ivar children: dict of element name to (Shape or converter, whether it repeats).
+    """
+    __slots__ = ('attributes', 'children')
+
+    def __init__(self):
+        self.attributes = {}
+        self.children = {}
+
+
+def local(tag):
+    return tag.split('}')[-1]
+
+
+def child(element, name):
+    """ First child of `element` with local name `name`, None if there is none. """
+    for node in element:
+        if local(node.tag) == name:
+            return node
+    return None
+
+
+def converter(resolved):
+    """ Converter of the text of a builtin schema type, None to keep the text. """
+    if resolved is not None and resolved.builtin():
+        return resolved.translate
+    return None
+
+
+class NativeDecoder(object):
+    """
+    Decodes the replies of one service model's operations.
+
+    The shapes of the schema types are computed on first use and shared by every
+    decoder of the model.
+    """
+
+    def __init__(self, model):
+        """
+        :param model: The ServiceModel of the WSDL.
+        """
+        self.shapes = model.shapes
+
+    def decode(self, client, method, reply):
+        """
+        Decode the reply of an operation.
+
+        :param client: The suds client the operation was called with.
+        :param method: The suds method of the operation.
+        :param reply: The reply xml, as returned by suds with ``retxml``.
+        :return: The Result, or what suds returns where the reply isn't a single element.
+        :raises WebFault: If the reply is a SOAP fault.
+        """
+        if reply is None:
+            return None
+        binding = method.binding.output
+        body = child(ElementTree.fromstring(reply), 'Body')
+        if body is None:
+            return self.unmarshal(client, binding.get_reply(method, reply)[1])
+        if child(body, 'Fault') is not None:
+            # raises the WebFault unless the client's ``faults`` option is off
+            return binding.get_fault(reply)
+
+        nodes = list(body[0]) if getattr(method.soap.output.body, 'wrapped', False) else list(body)
+        rtypes = binding.returned_types(method)
+        if len(rtypes) != 1 or rtypes[0].unbounded():
+            return self.unmarshal(client, binding.get_reply(method, reply)[1])
+        if not nodes:
+            return None
+        return self.unmarshal(client, self.element(nodes[0], self.shape(rtypes[0].resolve(nobuiltin=True))))
+
+    def unmarshal(self, client, result):
+        """ Pass the result to the unmarshalled hook of the client's plugins, which suds skips with retxml. """
+        context = PluginContainer(client.options.plugins).message.unmarshalled(reply=result)
+        return context.reply
+
+    def shape(self, resolved):
+        """
+        The Shape of a resolved complex schema type.
+
+        Shapes are built privately, with those of the types they contain, and published
+        to the shared dict once complete, so other threads never see a partial Shape.
+        """
+        shape = self.shapes.get(id(resolved))
+        if shape is None:
+            building = {}
+            shape = self._build(resolved, building)
+            self.shapes.update(building)
+        return shape
+
+    def _build(self, resolved, building):
+        """ Build the Shape of `resolved` into `building`, which holds the unfinished ones of recursive types. """
+        shape = self.shapes.get(id(resolved)) or building.get(id(resolved))
+        if shape is not None:
+            return shape
+
+        shape = building[id(resolved)] = Shape()
+        for attribute, ancestry in resolved.attributes():
+            shape.attributes[attribute.name] = converter(attribute.resolve())
+        for child, ancestry in resolved.children():
+            child_type = child.resolve()
+            if child_type.builtin() or not (child_type.attributes() or child_type.children()):
+                shape.children[child.name] = (converter(child_type), child.unbounded())
+            else:
+                shape.children[child.name] = (self._build(child.resolve(nobuiltin=True), building),
+                                              child.unbounded())
+        return shape
+
+    def element(self, element, shape):
+        """ Decode an element of a complex type. """
+        result = Result()
+        values, keys = result.__dict__, result.__keylist__
+        for name, value in element.attrib.items():
+            if name[0] == '{':
+                continue
+            convert = shape.attributes.get(name) if shape is not None else None
+            values['_' + name] = convert(value) if convert is not None else value
+            keys.append('_' + name)
+
+        children = False
+        for node in element:
+            children = True
+            name = local(node.tag)
+            kind, repeated = shape.children.get(name, (None, False)) if shape is not None else (None, False)
+            value = self.value(node, kind)
+            if name not in values:
+                values[name] = [value] if repeated else value
+                keys.append(name)
+            elif repeated:
+                values[name].append(value)
+            else:
+                # repeated although the schema doesn't say so
+                if not isinstance(values[name], list):
+                    values[name] = [values[name]]
+                values[name].append(value)
+
+        if not children and element.text is not None and element.text.strip():
+            values['value'] = element.text
+            keys.append('value')
+        return result
+
+    def value(self, element, kind):
+        """ Decode a child element: kind is its Shape, converter or None if unknown. """
+        if element.get(NIL) in ('true', '1'):
+            return None
+        if isinstance(kind, Shape) or (kind is None and (len(element) or element.attrib)):
+            return self.element(element, kind if isinstance(kind, Shape) else None)
+        text = element.text
+        if not text:
+            return None
+        return kind(text) if kind is not None else text
+
+
+class NativeService(object):
+    """
+    Stands in for the ``service`` of a suds client created with ``retxml``,
+    decoding the reply of every operation with a NativeDecoder.
+    """
+
+    def __init__(self, client, decoder):
+        """
+        :param client: The suds client.
+        :param decoder: The NativeDecoder.
+        """
+        self.client = client
+        self.decoder = decoder
+
+    def __getattr__(self, name):
+        operation = getattr(self.client.service, name)
+        decoder, client = self.decoder, self.client
+
+        def call(*args, **kwargs):
+            return decoder.decode(client, operation.method, operation(*args, **kwargs))
+        call.method = operation.method
+        return call
@@ -0,0 +1,232 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Bulk send dispatcher with per-account rate limiting.
+"""
+
+import threading
+import time
+from logging import getLogger
+
+from .exceptions import InvalidRecipientException, RecipientBlockedException
+from .executor import WorkerPool
+
+log = getLogger(__name__)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: Tokens added per second.
+        :param capacity: Maximum number of tokens, i.e. the largest burst. Defaults to `rate`.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def take(self, tokens=1):
+        """
+        Take `tokens`, sleeping until they are available.
+
+        Requests for more than the capacity are allowed and wait until the bucket is full.
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                needed = min(tokens, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class DispatchSummary(object):
+    """
+    Throughput summary of a Dispatcher run.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.requests = 0
+        self.errors = 0
+        self.latencies = []
+        self.started = time.time()
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def record(self, result, latency):
+        """ Count the recipients accepted and rejected in a BatchResult. """
+        with self.lock:
+            self.requests += result.requests
+            self.sent += result.sent + result.scheduled
+            self.failed += result.failed
+            self.latencies.append(latency)
+
+    def record_removed(self, counts):
+        """ Count recipients removed before sending: invalid and blocked ones fail, duplicates don't. """
+        with self.lock:
+            self.failed += counts.get('invalid', 0) + counts.get('blocked', 0)
+            self.deduplicated += counts.get('duplicate', 0)
+
+    def record_error(self, recipients, latency=None):
+        """
+        Count a message which raised, e.g. on a fault or network error, failing all its recipients.
+
+        :param latency: Seconds the request took, None if the message failed before it was sent.
+        """
+        with self.lock:
+            self.errors += 1
+            self.failed += recipients
+            if latency is not None:
+                self.requests += 1
+                self.latencies.append(latency)
+
+    def percentile(self, p):
+        """ Request latency in seconds at percentile `p` (0-100), None if nothing was sent. """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def __str__(self):
+        p50, p99 = self.percentile(50), self.percentile(99)
+        return ('sent %d, failed %d, deduplicated %d in %d requests (%d errors) over %.1fs, '
+                '%.1f msg/s, p50 %s, p99 %s' % (
+                    self.sent, self.failed, self.deduplicated, self.requests, self.errors, self.elapsed,
+                    self.sent / max(self.elapsed, 1e-9),
+                    p50 is None and '-' or '%.0fms' % (p50 * 1000),
+                    p99 is None and '-' or '%.0fms' % (p99 * 1000)))
+
+
+class Dispatcher(object):
+    """
+    Sends a stream of messages on a pool of worker threads.
+
+    Each message is sent in a sendMessages request of its own like with
+    MMSoapClient.send_messages, but errors of some recipients are counted instead of
+    raised, so the summary has the accepted and rejected recipients of every request.
+
+    Each account (``userId``) has a token bucket for recipients per second and one for
+    requests per second, shared by all workers. The input is consumed lazily: at most
+    `max_pending` messages are read ahead of the workers.
+
+    Example::
+
+        dispatcher = Dispatcher(lambda: MMSoapClient(user, password), workers=8,
+                                messages_per_second=50, requests_per_second=10)
+        summary = dispatcher.run(dict(recipients=[n], content=text) for n in numbers)
+    """
+
+    def __init__(self, client_factory, workers=4, messages_per_second=None,
+                 requests_per_second=None, max_pending=None):
+        """
+        :param client_factory: Callable returning a new MMSoapClient, called once per worker thread.
+        :param workers: Number of worker threads.
+        :param messages_per_second: Recipients per second allowed per account, None for no limit.
+        :param requests_per_second: Requests per second allowed per account, None for no limit.
+        :param max_pending: Messages read from the input ahead of the workers. Defaults to 2 * workers.
+        """
+        self.client_factory = client_factory
+        self.workers = workers
+        self.messages_per_second = messages_per_second
+        self.requests_per_second = requests_per_second
+        self.max_pending = max_pending or 2 * workers
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def run(self, messages):
+        """
+        Send every message and wait for the last one to finish.
+
+        :param messages: Iterable of dicts of MMSoapClient.send_messages arguments; ``seq`` is ignored.
+        :return: DispatchSummary.
+        """
+        summary = DispatchSummary()
+        pool = WorkerPool(self.workers, self.max_pending)
+        try:
+            for message in messages:
+                # blocks while max_pending messages are queued, which holds back the input
+                pool.submit(self._send, message, summary)
+        finally:
+            pool.shutdown(wait=True)
+        summary.finished = time.time()
+        return summary
+
+    def buckets_for(self, user_id):
+        """ Get the (messages, requests) token buckets of an account. Either may be None. """
+        with self.lock:
+            buckets = self.buckets.get(user_id)
+            if buckets is None:
+                buckets = self.buckets[user_id] = (
+                    self.messages_per_second and TokenBucket(self.messages_per_second),
+                    self.requests_per_second and TokenBucket(self.requests_per_second))
+            return buckets
+
+    def client(self):
+        """ The MMSoapClient of the current worker thread. """
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.client_factory()
+        return client
+
+    def _send(self, message, summary):
+        # any exception is recorded here, as nobody reads the futures of the pool
+        recipients, started = [], None
+        try:
+            recipients = list(message['recipients'])
+            message = dict(message, recipients=recipients)
+            send_mode = message.pop('send_mode', 'normal')
+            # the batch numbers its messages itself
+            message.pop('seq', None)
+            client = self.client()
+
+            counts = {}
+            try:
+                prepared, uids = client.prepare_recipients(recipients, counts)
+            except (InvalidRecipientException, RecipientBlockedException):
+                summary.record_removed(counts)
+                return
+            summary.record_removed(counts)
+            recipients = list(prepared)
+            message.update(recipients=recipients, uids=uids)
+
+            message_bucket, request_bucket = self.buckets_for(client.authentication.userId)
+            if request_bucket:
+                request_bucket.take()
+            if message_bucket:
+                message_bucket.take(len(recipients))
+
+            started = time.time()
+            result = client.send_message_batch([message], send_mode)
+        except Exception:
+            log.debug('send failed', exc_info=1)
+            summary.record_error(len(recipients), None if started is None else time.time() - started)
+        else:
+            summary.record(result, time.time() - started)
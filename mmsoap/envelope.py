@@ -0,0 +1,285 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Fast-path SOAP envelope writer.
+
+Instead of creating a suds object per recipient and marshalling the result, each
+request is rendered once through suds with marker values in place of the real
+ones. The rendered text is split into templates at the markers and the repeated
+elements (messages, recipients, confirm items) are cut out as item templates, so
+later requests are plain string formatting. Because the templates come from the
+same request builders as the suds path, both produce the same envelope.
+"""
+
+import itertools
+import re
+from datetime import date, datetime
+
+from suds.client import SoapClient
+from suds.sax.date import Date, DateTime
+
+MARKER = 'MMSOAPSLOT%sX'
+
+CREDENTIALS = ('userId', 'password')
+
+# the same substitutions, in the same order, as suds.sax.enc.Encoder
+ENCODINGS = (
+    (re.compile('&(?!(amp|lt|gt|quot|apos);)'), '&amp;'),
+    (re.compile('<'), '&lt;'),
+    (re.compile('>'), '&gt;'),
+    (re.compile('"'), '&quot;'),
+    (re.compile("'"), '&apos;'),
+)
+SPECIAL = ('&', '<', '>', '"', "'")
+
+
+def marker(name):
+    """ Marker value standing in for the slot `name` while a template is rendered by suds. """
+    return MARKER % name
+
+
+def escape(s):
+    """ Escape text or an attribute value exactly like suds does. """
+    for c in SPECIAL:
+        if c in s:
+            break
+    else:
+        return s
+    for pattern, replacement in ENCODINGS:
+        s = pattern.sub(replacement, s)
+    return s
+
+
+def text(value):
+    """ Convert a value to escaped xml text the way suds translates python values. Byte strings are UTF-8. """
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    elif isinstance(value, bool):
+        value = value and 'true' or 'false'
+    elif isinstance(value, datetime):
+        value = DateTime(value)
+    elif isinstance(value, date):
+        value = Date(value)
+    return escape(unicode(value))
+
+
+def boolean(value):
+    """ Convert a value set on an xsd:boolean element to escaped xml text. """
+    if isinstance(value, (bool, int)):
+        value = bool(value)
+    return text(value)
+
+
+def render(client, operation, authentication, body):
+    """
+    Render a request envelope through suds.
+
+    :param client: The MMSoapClient.
+    :param operation: Name of the operation, e.g. 'checkReplies'.
+    :param authentication: The AuthenticationType.
+    :param body: The request body.
+    :return: The envelope xml.
+    """
+    method = getattr(client.client.service, operation).method
+    return method.binding.input.get_message(method, (authentication, body), {}).plain()
+
+
+class Template(object):
+    """
+    Rendered xml with ``%(slot)s`` placeholders where the markers were.
+    """
+
+    def __init__(self, xml, slots):
+        xml = xml.replace('%', '%%')
+        for slot in slots:
+            xml = xml.replace(marker(slot), '%%(%s)s' % slot)
+        self.xml = xml
+
+    def render(self, values):
+        """
+        :param values: dict of slot name to already escaped text.
+        :return: The rendered xml.
+        """
+        return self.xml % values
+
+
+def cut(xml, name, hole, local=None):
+    """
+    Cut the element holding the marker of slot `name` out of `xml`.
+
+    :param xml: Rendered xml.
+    :param name: Slot whose marker is in the element's text or attributes.
+    :param hole: Slot whose marker replaces the element.
+    :param local: Local name of an enclosing element to cut instead of the innermost one.
+    :return: (xml with the element replaced, the element)
+    """
+    position = xml.index(marker(name))
+    if local is None:
+        start = xml.rindex('<', 0, position)
+    else:
+        starts = [m.start() for m in re.finditer(r'<(\w+:)?%s[\s/>]' % local, xml[:position])]
+        start = starts[-1]
+    tag = re.match(r'<([\w:]+)', xml[start:]).group(1)
+    head_end = xml.index('>', start) + 1
+    if xml[head_end - 2] == '/':
+        end = head_end
+    else:
+        end = xml.index('</%s>' % tag, position) + len(tag) + 3
+    return xml[:start] + marker(hole) + xml[end:], xml[start:end]
+
+
+class EnvelopeWriter(object):
+    """
+    Writes request envelopes for one MMSoapClient from templates shared by its service model.
+    """
+
+    def __init__(self, client):
+        """
+        :param client: The MMSoapClient. Its request builders are used to compile the templates.
+        """
+        self.client = client
+
+    @property
+    def templates(self):
+        return self.client.model.templates
+
+    def send(self, operation, xml):
+        """
+        Send a rendered envelope through suds, which still handles the transport,
+        faults and unmarshalling of the reply, or the client's NativeDecoder.
+
+        :param operation: Name of the operation, e.g. 'sendMessages'.
+        :param xml: The rendered envelope.
+        :return: The unmarshalled response.
+        """
+        method = getattr(self.client.client.service, operation).method
+        reply = SoapClient(self.client.client, method).send(RawEnvelope(xml))
+        if self.client.decoder is not None:
+            return self.client.decoder.decode(self.client.client, method, reply)
+        return reply
+
+    def send_messages(self, messages, send_mode):
+        """
+        Render a sendMessages envelope.
+
+        :param messages: Iterable of dicts with the arguments of MMSoapClient.create_message.
+        :param send_mode: See MMSoapClient.send_messages.
+        """
+        outer, _, _ = self._send_messages_templates(False, False, False)
+        rendered = []
+        for message in messages:
+            seq = message.get('seq')
+            scheduled = message.get('scheduled')
+            report = message.get('report')
+            _, template, recipient = self._send_messages_templates(bool(seq), bool(scheduled), bool(report))
+            uids = message.get('uids')
+            if uids is None:
+                uids = itertools.count()
+            values = dict(content=text(message['content']),
+                          recipients=''.join([recipient.render(dict(recipient=text(r), uid=text(uid)))
+                                              for uid, r in itertools.izip(uids, message['recipients'])]))
+            if seq:
+                values['seq'] = text(seq)
+            if scheduled:
+                values['scheduled'] = text(scheduled)
+            if report:
+                values['report'] = boolean(report)
+            rendered.append(template.render(values))
+        return outer.render(self._values(sendMode=text(send_mode), messages=''.join(rendered)))
+
+    def items(self, operation, build, items):
+        """
+        Render the envelope of an operation whose body is a list of simple items.
+
+        :param operation: Name of the operation, e.g. 'confirmReplies'.
+        :param build: Name of the MMSoapClient method building the request body from a list of values.
+        :param items: The values.
+        """
+        outer, item = self._items_templates(operation, build)
+        return outer.render(self._values(items=''.join([item.render(dict(item=text(i))) for i in items])))
+
+    def _values(self, **values):
+        """ Add the credential elements to `values`, empty like suds renders them when a credential is None. """
+        authentication = self.client.authentication
+        for name in CREDENTIALS:
+            value = getattr(authentication, name)
+            template, empty = self.templates[('authentication', name)]
+            values[name] = empty if value is None else template.render({name: text(value)})
+        return values
+
+    def _render(self, operation, body):
+        """ Render a request through suds, with the credential elements cut out as slots of their own. """
+        authentication = self.client.create('AuthenticationType')
+        for name in CREDENTIALS:
+            setattr(authentication, name, marker(name))
+        xml = render(self.client, operation, authentication, body)
+        for name in CREDENTIALS:
+            xml, element = cut(xml, name, name)
+            if ('authentication', name) not in self.templates:
+                self.templates[('authentication', name)] = (Template(element, (name,)),
+                                                            element[:element.index('>')] + '/>')
+        return xml
+
+    def _send_messages_templates(self, seq, scheduled, report):
+        key = ('sendMessages', seq, scheduled, report)
+        templates = self.templates.get(key)
+        if templates is None:
+            message = self.client.create_message([marker('recipient')], marker('content'),
+                                                 uids=[marker('uid')],
+                                                 scheduled=scheduled and marker('scheduled') or None,
+                                                 report=report and marker('report') or None,
+                                                 seq=seq and marker('seq') or None)
+            xml = self._render('sendMessages', self.client._send_messages_body(message, marker('sendMode')))
+            xml, message_xml = cut(xml, 'content', 'messages', local='message')
+            message_xml, recipient_xml = cut(message_xml, 'recipient', 'recipients')
+            templates = (Template(xml, ('userId', 'password', 'sendMode', 'messages')),
+                         Template(message_xml, ('content', 'seq', 'scheduled', 'report', 'recipients')),
+                         Template(recipient_xml, ('recipient', 'uid')))
+            self.templates[key] = templates
+        return templates
+
+    def _items_templates(self, operation, build):
+        key = (operation, build)
+        templates = self.templates.get(key)
+        if templates is None:
+            xml = self._render(operation, getattr(self.client, build)([marker('item')]))
+            xml, item_xml = cut(xml, 'item', 'items')
+            templates = (Template(xml, ('userId', 'password', 'items')),
+                         Template(item_xml, ('item',)))
+            self.templates[key] = templates
+        return templates
+
+
+class RawEnvelope(object):
+    """
+    Stands in for the suds sax Document of a request which is already rendered.
+    """
+
+    def __init__(self, xml):
+        self.xml = xml
+
+    def root(self):
+        return None
+
+    def str(self):
+        return self.xml
+
+    def plain(self):
+        return self.xml
+
+    def __unicode__(self):
+        return self.xml
+
+    def __str__(self):
+        return self.xml.encode('utf-8')
@@ -26,3 +26,13 @@ class OtherMMSOAPException(BaseMMSOAPException):
     """
     Other error
     """
+
+class SnapshotMissingException(BaseMMSOAPException):
+    """
+    No WSDL snapshot
+    """
+
+class InsufficientCreditException(BaseMMSOAPException):
+    """
+    Not enough credit remaining
+    """
@@ -0,0 +1,178 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Minimal futures and worker pool, for running client calls concurrently.
+"""
+
+import threading
+from logging import getLogger
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+log = getLogger(__name__)
+
+
+class TimeoutError(RuntimeError):
+    """
+    A Future didn't finish within the timeout.
+    """
+
+
+class Future(object):
+    """
+    The eventual result of a call submitted to a WorkerPool.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        """ True once the call has finished. """
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to finish and return its result.
+
+        :param timeout: Seconds to wait, None to wait forever.
+        :raises: The exception raised by the call, or TimeoutError on timeout.
+        """
+        if not self._done.wait(timeout) and not self._done.is_set():
+            raise TimeoutError('timed out waiting for result')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """ Wait for the call to finish and return the exception it raised, or None. """
+        if not self._done.wait(timeout) and not self._done.is_set():
+            raise TimeoutError('timed out waiting for result')
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """ Call fn(future) when the call finishes, or now if it already has. """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                log.exception('future callback failed')
+
+
+class WorkerPool(object):
+    """
+    Fixed number of daemon threads running submitted calls.
+    """
+
+    def __init__(self, max_workers, max_pending=0, initializer=None):
+        """
+        :param max_workers: Number of threads, i.e. the maximum number of calls running at once.
+        :param max_pending: Maximum number of calls waiting for a thread. submit() blocks
+                            while the queue is full. 0 means unbounded.
+        :param initializer: Called with no arguments in each thread before it runs any call.
+        """
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self._queue = queue.Queue(max_pending)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker thread.
+
+        :return: Future of the result.
+        """
+        if self._shutdown:
+            raise RuntimeError('cannot submit after shutdown')
+        self._start()
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def map(self, fn, iterable):
+        """ Submit fn(item) for every item and return the futures, in order. """
+        return [self.submit(fn, item) for item in iterable]
+
+    def shutdown(self, wait=True):
+        """
+        Stop the threads once the queued calls have run.
+
+        :param wait: Wait for the threads to finish.
+        """
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _start(self):
+        if len(self._threads) >= self.max_workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        if self.initializer is not None:
+            self.initializer()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+def wait(futures, timeout=None):
+    """
+    Wait for all futures and return their results, in order.
+
+    :raises: The first exception raised by any of the calls, or TimeoutError.
+    """
+    return [future.result(timeout) for future in futures]
@@ -0,0 +1,392 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Latency and payload metrics of MMSoapClient operations.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from logging import getLogger
+
+from suds.plugin import MessagePlugin
+
+from .results import iter_errors
+
+log = getLogger(__name__)
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Counter(object):
+    """
+    A counter with one value per combination of label values.
+    """
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        """ Generator of (suffix, label pairs, value). """
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            yield '', zip(self.labels, label_values), value
+
+
+class Histogram(object):
+    """
+    A cumulative histogram with one set of buckets per combination of label values.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                # one count per bucket, then +Inf, count and sum
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0, 0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def count(self, label_values=()):
+        """ Number of observations. """
+        counts = self.values.get(label_values)
+        return counts[-2] if counts else 0
+
+    def sum(self, label_values=()):
+        """ Sum of observations. """
+        counts = self.values.get(label_values)
+        return counts[-1] if counts else 0
+
+    def percentile(self, label_values, p):
+        """ Upper bound of the bucket holding percentile `p` (0-100), None without observations. """
+        counts = self.values.get(label_values)
+        if not counts or not counts[-2]:
+            return None
+        rank, seen = counts[-2] * p / 100.0, 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+    def samples(self):
+        """ Generator of (suffix, label pairs, value). """
+        with self.lock:
+            values = sorted((k, list(v)) for k, v in self.values.items())
+        for label_values, counts in values:
+            labels = zip(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', labels + [('le', _format(bound))], cumulative
+            yield '_count', labels, counts[-2]
+            yield '_sum', labels, counts[-1]
+
+
+class MetricsRegistry(object):
+    """
+    Named collection of counters and histograms.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """ Add a metric, or return the one already registered under its name. """
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def get(self, name):
+        return self.metrics[name]
+
+    def exposition(self):
+        """ The metrics in the Prometheus text exposition format. """
+        lines = []
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            lines.append('# HELP %s %s' % (name, metric.help))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for suffix, labels, value in metric.samples():
+                if labels:
+                    lines.append('%s%s{%s} %s' % (name, suffix, ','.join(
+                        '%s="%s"' % (k, _escape(v)) for k, v in labels), _format(value)))
+                else:
+                    lines.append('%s%s %s' % (name, suffix, _format(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return ('%s' % (value,)).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Call(object):
+    """
+    Measurements of one MMSoapClient operation call, passed to the hooks of Metrics.
+
+    Durations are in seconds. `marshal` is the time spent creating and serialising
+    the request, i.e. everything but `transport` and `unmarshal`. An operation
+    making several requests (e.g. send_message_batch) sums them.
+    """
+    __slots__ = ('operation', 'started', 'total', 'transport', 'unmarshal', 'request_bytes',
+                 'response_bytes', 'requests', 'retries', 'error_codes', 'error', '_sent', '_received')
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.time()
+        self.total = self.transport = self.unmarshal = 0.0
+        self.request_bytes = self.response_bytes = 0
+        self.requests = 0
+        self.retries = 0
+        self.error_codes = []
+        self.error = None
+        self._sent = self._received = None
+
+    @property
+    def marshal(self):
+        return max(0.0, self.total - self.transport - self.unmarshal)
+
+
+class CountingReader(object):
+    """
+    File-like wrapper counting the bytes read, for the size of streamed responses.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        self.fp.close()
+
+
+class Metrics(object):
+    """
+    Collects per-operation metrics of the MMSoapClients created with it.
+
+    The request and response of every suds call are timed by a suds message plugin,
+    so each call is split into marshal, transport and unmarshal time. Calls
+    can also be passed to hooks, e.g. to log slow calls.
+
+    Example::
+
+        metrics = Metrics()
+        client = MMSoapClient(user, password, metrics=metrics)
+        ...
+        print metrics.exposition()
+    """
+
+    def __init__(self, registry=None, prefix='mmsoap', latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        """
+        :param registry: MetricsRegistry to register the metrics in. Defaults to a new one.
+        :param prefix: Prefix of the metric names.
+        """
+        self.registry = registry or MetricsRegistry()
+        self.hooks = []
+        self.local = threading.local()
+        self.plugin = MetricsPlugin(self)
+
+        register = self.registry.register
+        self.seconds = register(Histogram(prefix + '_call_seconds', 'Duration of calls by phase.',
+                                          ('operation', 'phase'), latency_buckets))
+        self.request_bytes = register(Histogram(prefix + '_request_bytes', 'Size of request envelopes.',
+                                                ('operation',), size_buckets))
+        self.response_bytes = register(Histogram(prefix + '_response_bytes', 'Size of response envelopes.',
+                                                 ('operation',), size_buckets))
+        self.calls = register(Counter(prefix + '_calls_total', 'Calls by outcome.', ('operation', 'outcome')))
+        self.requests = register(Counter(prefix + '_requests_total', 'SOAP requests sent.', ('operation',)))
+        self.retries = register(Counter(prefix + '_retries_total', 'Recipients resent.', ('operation',)))
+        self.errors = register(Counter(prefix + '_errors_total', 'Errors by code.', ('operation', 'code')))
+
+    def add_hook(self, hook):
+        """ Call `hook` with the Call of every finished operation. """
+        self.hooks.append(hook)
+
+    def exposition(self):
+        """ The metrics in the Prometheus text exposition format. """
+        return self.registry.exposition()
+
+    def measure(self, operation, function, *args, **kwargs):
+        """ Call `function` as the operation `operation` and record it. """
+        stack = self._stack()
+        call = Call(operation)
+        stack.append(call)
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            self.failed(call, e)
+            raise
+        finally:
+            stack.pop()
+            call.total = time.time() - call.started
+            self.record(call)
+
+    def stream(self, call, fp, records, own=True):
+        """
+        Yield `records` parsed from a streamed response, recording `call` once they are exhausted.
+
+        The suds plugin doesn't see streamed responses, so the caller counts the request and its
+        transport time up to the response headers. Here the time spent parsing is added as
+        unmarshal time, and the total is the time until the last record, or until the generator
+        is closed.
+
+        :param call: The Call of the operation.
+        :param fp: CountingReader the response is read from.
+        :param records: Generator of the records parsed from `fp`.
+        :param own: Record `call` at the end. False when the stream is read within a measured call,
+                    which records it itself.
+        """
+        try:
+            while True:
+                started = time.time()
+                try:
+                    record = next(records)
+                except StopIteration:
+                    break
+                finally:
+                    call.unmarshal += time.time() - started
+                yield record
+        except Exception as e:
+            if own:
+                self.failed(call, e)
+            raise
+        finally:
+            call.response_bytes += fp.bytes
+            if own:
+                call.total = time.time() - call.started
+                self.record(call)
+
+    def failed(self, call, error):
+        """ Mark `call` as failed with the exception `error`. """
+        call.error = error
+        call.error_codes.append(type(error).__name__)
+
+    def record(self, call):
+        """ Add a finished Call to the metrics and pass it to the hooks. """
+        operation = call.operation
+        self.seconds.observe((operation, 'total'), call.total)
+        self.seconds.observe((operation, 'marshal'), call.marshal)
+        if call.requests:
+            self.seconds.observe((operation, 'transport'), call.transport)
+            self.seconds.observe((operation, 'unmarshal'), call.unmarshal)
+            self.request_bytes.observe((operation,), call.request_bytes)
+            self.response_bytes.observe((operation,), call.response_bytes)
+            self.requests.inc((operation,), call.requests)
+        self.calls.inc((operation, 'error' if call.error is not None else 'ok'))
+        if call.retries:
+            self.retries.inc((operation,), call.retries)
+        for code in call.error_codes:
+            self.errors.inc((operation, code))
+
+        for hook in self.hooks:
+            try:
+                hook(call)
+            except Exception:
+                log.exception('metrics hook failed')
+
+    def retried(self, recipients):
+        """ Count recipients resent by the current call. """
+        call = self.current()
+        if call is not None:
+            call.retries += recipients
+
+    def current(self):
+        """ The innermost Call running in this thread, None outside of measured calls. """
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+
+class MetricsPlugin(MessagePlugin):
+    """
+    suds plugin timing the transport and unmarshalling of the current Call.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def sending(self, context):
+        call = self.metrics.current()
+        if call is not None:
+            call.requests += 1
+            call.request_bytes += len(context.envelope or '')
+            call._sent = time.time()
+
+    def received(self, context):
+        call = self.metrics.current()
+        if call is not None and call._sent is not None:
+            call._received = time.time()
+            call.transport += call._received - call._sent
+            call.response_bytes += len(context.reply or '')
+            call._sent = None
+
+    def unmarshalled(self, context):
+        call = self.metrics.current()
+        if call is not None and call._received is not None:
+            call.unmarshal += time.time() - call._received
+            call._received = None
+            call.error_codes.extend(code for code, seq, recipients in iter_errors(context.reply))
+
+
+def metered(operation):
+    """
+    Decorator recording calls of an MMSoapClient method when the client has metrics.
+
+    Clients without metrics only pay for one attribute lookup.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            return self.metrics.measure(operation, method, self, *args, **kwargs)
+        return wrapper
+    return decorate
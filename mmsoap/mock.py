@@ -7,7 +7,6 @@ from __future__ import (absolute_import, division,
 import httplib
 from mock import patch, MagicMock
 
-from django.test import override_settings
 from suds.transport import Reply
 
 
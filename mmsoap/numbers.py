@@ -0,0 +1,178 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Bulk normalisation of recipient numbers to E.164.
+"""
+
+import re
+from collections import namedtuple
+from itertools import count
+
+# a number as written by people: an optional international prefix ('+' or '00') or
+# trunk prefix ('0'), then digits, the first of which is never 0
+NUMBER = re.compile(r'(\+|00|0)?([1-9][0-9]*)$')
+
+# E.164 numbers have at most 15 digits, and no valid one has fewer than 7
+MIN_DIGITS, MAX_DIGITS = 7, 15
+
+# characters commonly used to group digits, removed before matching
+SEPARATORS = re.compile(r'[\s\-.()/]+')
+
+# the same patterns applied to many numbers at once, each line starting with '\n'
+SEPARATOR_CHARS = ' \t\r\f\v-.()/'
+LINE_SEPARATORS = re.compile(r'[ \t\r\f\v\-.()/]+')
+# lines still starting with a digit once prefixes and the country code were handled
+NATIONAL_LINE = re.compile(r'\n(?=[1-9])')
+MALFORMED_LINE = re.compile(r'\n(?!\+[1-9][0-9]{%d,%d}\n)[^\n]*' % (MIN_DIGITS - 1, MAX_DIGITS - 1))
+
+
+class Normalized(namedtuple('Normalized', 'numbers index rejected')):
+    """
+    Result of normalize.
+
+    `numbers` are the distinct E.164 numbers in the order they first appear.
+    `index` has one entry per input number: the position of its E.164 form in
+    `numbers`, or -1 if it was rejected. `rejected` are the positions of the
+    rejected input numbers.
+    """
+    __slots__ = ()
+
+    @property
+    def duplicates(self):
+        """ Number of valid input numbers which were dropped as duplicates. """
+        return len(self.index) - len(self.rejected) - len(self.numbers)
+
+    def first_positions(self):
+        """ The input position of the first occurrence of each of `numbers`. """
+        positions = [None] * len(self.numbers)
+        for position, i in enumerate(self.index):
+            if i >= 0 and positions[i] is None:
+                positions[i] = position
+        return positions
+
+    def positions(self):
+        """ The input positions of each of `numbers`, as a list of lists. """
+        positions = [[] for _ in self.numbers]
+        for position, i in enumerate(self.index):
+            if i >= 0:
+                positions[i].append(position)
+        return positions
+
+
+def to_e164(number, default_country='61'):
+    """
+    Convert a single number to E.164.
+
+    Numbers with a '+' or '00' prefix are international. Numbers with a '0' trunk
+    prefix are national numbers of `default_country`, as are numbers without any
+    prefix unless they already start with `default_country`.
+
+    :param number: Number as a string or an integer.
+    :param default_country: Country calling code of national numbers, e.g. '61'.
+    :return: The number as '+<digits>', or None if it is malformed.
+    """
+    if isinstance(number, (int, long)):
+        number = str(number)
+    match = NUMBER.match(number)
+    if match is None:
+        match = NUMBER.match(SEPARATORS.sub('', number))
+        if match is None:
+            return None
+
+    prefix, digits = match.groups()
+    if prefix == '0' or (prefix is None and not digits.startswith(default_country)):
+        digits = default_country + digits
+    if not MIN_DIGITS <= len(digits) <= MAX_DIGITS:
+        return None
+    return '+' + digits
+
+
+def normalize(numbers, default_country='61'):
+    """
+    Convert numbers to E.164 and remove duplicates.
+
+    The numbers are joined into one string, one per line, and rewritten with a handful
+    of string replacements and regular expression substitutions, so the per-number work
+    happens in C. Duplicates are looked for with a set first, as most lists have none.
+    This gives the same results as calling to_e164 on every number.
+
+    :param numbers: Iterable of numbers as strings or integers.
+    :param default_country: Country calling code of national numbers, see to_e164.
+    :return: Normalized.
+    """
+    default_country = str(default_country).lstrip('+')
+    if not default_country.isdigit():
+        raise ValueError('default_country must be a country calling code, e.g. 61')
+
+    numbers = list(numbers)
+    try:
+        try:
+            text = '\n'.join(numbers)
+        except TypeError:
+            text = '\n'.join(['%s' % (number,) for number in numbers])
+    except UnicodeError:
+        # non-ASCII byte strings among unicode ones
+        text = None
+
+    if text is not None and text.count('\n') == len(numbers) - 1:
+        converted = _convert_lines(text, default_country).split('\n') if numbers else []
+    else:
+        # a number with an embedded line break or which can't be joined
+        converted = [to_e164('%s' % (number,), default_country) or '' for number in numbers]
+
+    # rejected numbers are ''
+    unique = set(converted)
+    rejected = '' in unique
+    unique.discard('')
+    if not rejected:
+        if len(unique) == len(converted):
+            return Normalized(converted, range(len(converted)), [])
+    else:
+        valid = filter(None, converted)
+        if len(unique) == len(valid):
+            positions = count()
+            index = [next(positions) if number else -1 for number in converted]
+            return Normalized(valid, index, [position for position, i in enumerate(index) if i < 0])
+
+    # every number gets the next position when first seen
+    positions = {'': -1}
+    assign = positions.setdefault
+    index = [assign(number, len(positions) - 1) for number in converted]
+    del positions['']
+    unique = [None] * len(positions)
+    for number, i in positions.iteritems():
+        unique[i] = number
+
+    rejected = [position for position, i in enumerate(index) if i < 0] if rejected else []
+
+    return Normalized(unique, index, rejected)
+
+
+def _convert_lines(text, default_country):
+    """
+    Apply to_e164 to every line of `text`, replacing malformed numbers by empty lines.
+
+    A line is only checked once it is rewritten, so prefixes are replaced without looking at
+    what follows them: anything but digits after the prefix makes the line malformed anyway.
+    """
+    text = '\n%s\n' % text
+    if isinstance(text, str):
+        text = text.translate(None, SEPARATOR_CHARS)
+    else:
+        text = LINE_SEPARATORS.sub('', text)
+    # international prefix, trunk prefix, then national numbers with and without the country code
+    text = text.replace('\n00', '\n+').replace('\n0', '\n+' + default_country)
+    text = text.replace('\n' + default_country, '\n+' + default_country)
+    text = NATIONAL_LINE.sub('\n+' + default_country, text)
+    return MALFORMED_LINE.sub('\n', text)[1:-1]
@@ -0,0 +1,246 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Long-running reply / delivery report poller with batched confirmation.
+"""
+
+import threading
+import time
+from logging import getLogger
+
+from .executor import WorkerPool
+
+log = getLogger(__name__)
+
+
+class Poller(object):
+    """
+    Polls for replies or delivery reports and hands each one to a handler.
+
+    The next check is already running while the current page is handled, and
+    confirmations are sent in batches, flushed when `confirm_batch` ids are
+    waiting or the oldest has waited `confirm_interval` seconds. An item is only
+    confirmed after the handler returned, so every item is delivered at least once.
+    Items returned again by a check which overlapped with their handling or
+    confirmation are skipped.
+
+    Each check reads its whole page before the items are handled, so that the
+    connection is free for the next check while they are. The page is parsed
+    into compact records as it streams in, but all of them are held at once: set
+    `maximum` to bound the memory used by accounts with large backlogs.
+
+    Example::
+
+        poller = Poller(client, handle_reply, kind='replies')
+        threading.Thread(target=poller.run).start()
+        ...
+        poller.stop()
+    """
+
+    def __init__(self, client, handler, kind='replies', maximum=None, confirm_batch=500,
+                 confirm_interval=5.0, poll_interval=10.0, error_delay=1.0, max_error_delay=300.0):
+        """
+        :param client: The MMSoapClient.
+        :param handler: Called with each ReplyRecord / ReportRecord, or an object with a ``put``
+                        method such as a Queue.Queue.
+        :param kind: 'replies' or 'reports'.
+        :param maximum: Maximum number of items per check, None for all. Bounds the records held
+                        in memory at once.
+        :param confirm_batch: Number of ids sent per confirm request.
+        :param confirm_interval: Maximum seconds an id waits before it is confirmed.
+        :param poll_interval: Seconds to wait after a check which returned nothing new.
+        :param error_delay: Seconds to wait after a failed check or confirm request, doubled for
+                            every consecutive failure.
+        :param max_error_delay: Maximum seconds to wait after a failed request.
+        """
+        if kind == 'replies':
+            self.check = client.iter_replies
+            self.confirm = client.confirm_replies
+            self.item_id = lambda record: record.receipt_id
+        elif kind == 'reports':
+            self.check = client.iter_reports
+            self.confirm = client.confirm_reports
+            self.item_id = lambda record: (record.delivery_report_id if record.delivery_report_id is not None
+                                           else record.receipt_id)
+        else:
+            raise ValueError("kind must be 'replies' or 'reports'")
+
+        self.handler = getattr(handler, 'put', handler)
+        self.maximum = maximum
+        self.confirm_batch = confirm_batch
+        self.confirm_interval = confirm_interval
+        self.poll_interval = poll_interval
+        self.error_delay = error_delay
+        self.max_error_delay = max_error_delay
+
+        self.checks = 0
+        self.confirm_requests = 0
+        self.delivered = 0
+        self.skipped = 0
+        self.handler_errors = 0
+        self.errors = 0
+
+        # id -> None while being handled or waiting for confirmation,
+        # or the number of confirm requests completed once it was confirmed
+        self._seen = {}
+        self._unconfirmed = []
+        self._oldest = None
+        self._confirmed = 0
+        self._confirm_failures = 0
+        self._retry_at = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        """
+        Poll until stop() is called, then confirm everything handled.
+
+        A check or confirm request which fails, e.g. on a network error or fault, is
+        logged and retried after `error_delay` seconds, doubled for every consecutive
+        failure up to `max_error_delay`. Handled items stay pending until confirmed.
+        """
+        pool = WorkerPool(1)
+        failures = 0
+        try:
+            future = pool.submit(self._check)
+            while not self._stopped.is_set():
+                try:
+                    started, items = future.result()
+                except Exception:
+                    self.errors += 1
+                    failures += 1
+                    delay = self._error_delay(failures)
+                    log.exception('check failed, retrying in %.1fs', delay)
+                    self._wait(delay)
+                    future = pool.submit(self._check)
+                    continue
+
+                failures = 0
+                future = pool.submit(self._check)
+                if not self._handle(started, items):
+                    self._wait(self.poll_interval)
+        finally:
+            pool.shutdown(wait=False)
+            try:
+                self.flush()
+            except Exception:
+                self.errors += 1
+                log.exception('confirm failed, %d items will be delivered again', len(self._unconfirmed))
+
+    def stop(self):
+        """ Ask run() to return after the current page. """
+        self._stopped.set()
+
+    def flush(self):
+        """
+        Confirm all handled items now.
+
+        :raises: What the confirm request raised; the ids not confirmed stay pending.
+        """
+        while self._unconfirmed:
+            ids = self._unconfirmed[:self.confirm_batch]
+            self.confirm(ids)
+            del self._unconfirmed[:len(ids)]
+            self.confirm_requests += 1
+            self._confirmed += 1
+            for item_id in ids:
+                self._seen[item_id] = self._confirmed
+        self._oldest = None
+
+    def stats(self):
+        """ Get counters of checks, confirm requests, delivered and skipped items, handler and request errors. """
+        return dict(checks=self.checks, confirm_requests=self.confirm_requests, delivered=self.delivered,
+                    skipped=self.skipped, handler_errors=self.handler_errors, errors=self.errors)
+
+    def _check(self):
+        started = self._confirmed
+        # read to the end so the response is complete and the connection released
+        # before the items are handled, see the class docstring
+        items = list(self.check(self.maximum))
+        self.checks += 1
+        return started, items
+
+    def _handle(self, started, items):
+        """
+        Hand new items to the handler.
+
+        :param started: Number of confirm requests completed when the check started.
+        :return: True if there were any new items.
+        """
+        new = False
+        for item in items:
+            item_id = self.item_id(item)
+            confirmed = self._seen.get(item_id, 0)
+            if item_id in self._seen and (confirmed is None or confirmed > started):
+                # still being handled, or the check ran before the confirmation reached the server
+                self.skipped += 1
+                continue
+
+            new = True
+            self._seen[item_id] = None
+            try:
+                self.handler(item)
+            except Exception:
+                self.handler_errors += 1
+                log.exception('handler failed, %s will be delivered again', item_id)
+                del self._seen[item_id]
+                continue
+
+            self.delivered += 1
+            self._unconfirmed.append(item_id)
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._flush_due()
+
+        self._flush_due()
+        # ids confirmed before this check started will not be returned by later checks
+        # unless the confirmation failed, in which case they should be delivered again
+        for item_id, confirmed in list(self._seen.items()):
+            if confirmed is not None and confirmed <= started:
+                del self._seen[item_id]
+        return new
+
+    def _flush_due(self):
+        """ Confirm the handled items if due, unless a failed confirm request is waiting to be retried. """
+        now = time.time()
+        if now < self._retry_at:
+            return
+        if len(self._unconfirmed) >= self.confirm_batch or (
+                self._oldest is not None and now - self._oldest >= self.confirm_interval):
+            try:
+                self.flush()
+            except Exception:
+                self.errors += 1
+                self._confirm_failures += 1
+                delay = self._error_delay(self._confirm_failures)
+                self._retry_at = now + delay
+                log.exception('confirm failed, retrying in %.1fs with %d ids pending', delay,
+                              len(self._unconfirmed))
+            else:
+                self._confirm_failures = 0
+
+    def _error_delay(self, failures):
+        return min(self.error_delay * 2 ** (failures - 1), self.max_error_delay)
+
+    def _wait(self, seconds):
+        """ Sleep, waking up to confirm items whose interval runs out meanwhile. """
+        deadline = time.time() + seconds
+        while not self._stopped.is_set():
+            now = time.time()
+            if now >= deadline:
+                return
+            wake = deadline
+            if self._oldest is not None:
+                wake = min(wake, max(self._oldest + self.confirm_interval, self._retry_at))
+            self._stopped.wait(max(0, wake - now))
+            self._flush_due()
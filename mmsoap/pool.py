@@ -0,0 +1,211 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+One client for many accounts.
+"""
+
+import functools
+import threading
+import time
+
+from .client import MMSoapClient
+from .transport import PooledHttpTransport
+
+# MMSoapClient methods available per account
+OPERATIONS = frozenset([
+    'check_user',
+    'send_messages',
+    'send_messages_with_retry',
+    'send_message_batch',
+    'send_templated',
+    'check_replies',
+    'iter_replies',
+    'confirm_replies',
+    'check_reports',
+    'iter_reports',
+    'confirm_reports',
+    'delete_scheduled_messages',
+    'block_numbers',
+    'get_blocked_numbers',
+    'unblock_numbers',
+])
+
+
+class Account(object):
+    """
+    Credentials and usage of one account of an MMSoapClientPool.
+    """
+    __slots__ = ('key', 'userId', 'password', 'credit', 'blocklist', 'calls', 'errors', 'seconds', 'last_call')
+
+    def __init__(self, key, userId, password, credit=None, blocklist=None):
+        self.key = key
+        self.userId = userId
+        self.password = password
+        self.credit = credit
+        self.blocklist = blocklist
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.last_call = None
+
+    def stats(self):
+        """ Calls, failed calls, total seconds and time of the last call. """
+        return dict(calls=self.calls, errors=self.errors, seconds=self.seconds, last_call=self.last_call)
+
+
+class AccountClient(object):
+    """
+    The MMSoapClient operations of one account of an MMSoapClientPool.
+    """
+    __slots__ = ('pool', 'key')
+
+    def __init__(self, pool, key):
+        self.pool = pool
+        self.key = key
+
+    def __getattr__(self, name):
+        if name not in OPERATIONS:
+            raise AttributeError(name)
+        return functools.partial(self.pool.call, self.key, name)
+
+
+class MMSoapClientPool(object):
+    """
+    Sends on behalf of many accounts with one set of clients.
+
+    Every account only holds its credentials and counters. Calls run on an MMSoapClient
+    per thread, which takes the credentials of the account being called, and all of
+    those clients share the parsed WSDL and one PooledHttpTransport.
+
+    A CreditLedger or BlockList tracks one account, so the pool never shares one
+    between accounts: give each account its own when adding it, or give the pool
+    factories creating one for every account added without.
+
+    Example::
+
+        pool = MMSoapClientPool(credit=lambda key: CreditLedger())
+        for account in accounts:
+            pool.add(account.id, account.user, account.password)
+        pool[account.id].send_messages(recipients, content)
+        print pool.stats()
+    """
+
+    def __init__(self, accounts=(), **kwargs):
+        """
+        :param accounts: Iterable of (key, userId, password) to add.
+        :param kwargs: Arguments for the MMSoapClients. Unless given, ``transport`` is a PooledHttpTransport.
+                       ``credit`` and ``blocklist`` are callables taking the key of an account and
+                       returning a new CreditLedger or BlockList for it, used for the accounts added
+                       without one.
+        :raises TypeError: If ``credit`` or ``blocklist`` is not callable, e.g. a single CreditLedger.
+        """
+        self.credit = kwargs.pop('credit', None)
+        self.blocklist = kwargs.pop('blocklist', None)
+        for name, factory in (('credit', self.credit), ('blocklist', self.blocklist)):
+            if factory is not None and not callable(factory):
+                raise TypeError('%s must create one instance per account, e.g. lambda key: %s()'
+                                % (name, type(factory).__name__))
+        kwargs.setdefault('transport', PooledHttpTransport())
+        self.kwargs = kwargs
+        self.accounts = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        for key, userId, password in accounts:
+            self.add(key, userId, password)
+
+    def add(self, key, userId, password, credit=None, blocklist=None):
+        """
+        Add an account, replacing the one with the same key.
+
+        :param key: Key the account is called by, e.g. a sub-account id.
+        :param userId: User ID of the account.
+        :param password: Password of the account.
+        :param credit: CreditLedger of the account (see mmsoap.credit). Defaults to one created by
+                       the pool's ``credit`` factory, if any.
+        :param blocklist: BlockList of the account (see mmsoap.blocklist). Defaults to one created by
+                          the pool's ``blocklist`` factory, if any.
+        :return: The Account.
+        """
+        if credit is None and self.credit is not None:
+            credit = self.credit(key)
+        if blocklist is None and self.blocklist is not None:
+            blocklist = self.blocklist(key)
+        account = Account(key, userId, password, credit, blocklist)
+        with self.lock:
+            self.accounts[key] = account
+        return account
+
+    def remove(self, key):
+        """ Remove an account. """
+        with self.lock:
+            del self.accounts[key]
+
+    def __getitem__(self, key):
+        """ The operations of the account `key`, e.g. ``pool[key].check_user()``. """
+        if key not in self.accounts:
+            raise KeyError(key)
+        return AccountClient(self, key)
+
+    def __contains__(self, key):
+        return key in self.accounts
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def warmup(self):
+        """ Parse the WSDL in the calling thread so the first calls don't wait for it. """
+        kwargs = self.kwargs
+        MMSoapClient.warmup(kwargs.get('cache_location'), kwargs.get('frozen'), kwargs.get('wsdl_url'),
+                            kwargs.get('cache_backend'))
+
+    def client(self, account):
+        """ The MMSoapClient of the current thread, set up for `account`. """
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = MMSoapClient(**self.kwargs)
+        client.set_userId(account.userId)
+        client.set_password(account.password)
+        client.credit = account.credit
+        client.blocklist = account.blocklist
+        return client
+
+    def call(self, key, operation, *args, **kwargs):
+        """
+        Call an MMSoapClient operation for an account.
+
+        :param key: Key of the account.
+        :param operation: Name of the MMSoapClient method, e.g. 'send_messages'.
+        :raises KeyError: If there is no account `key`.
+        """
+        if operation not in OPERATIONS:
+            raise AttributeError(operation)
+        account = self.accounts[key]
+        client = self.client(account)
+        started = time.time()
+        failed = True
+        try:
+            result = getattr(client, operation)(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            with self.lock:
+                account.calls += 1
+                account.errors += failed
+                account.seconds += time.time() - started
+                account.last_call = started
+
+    def stats(self):
+        """ dict of account key to the account's stats. """
+        with self.lock:
+            return dict((key, account.stats()) for key, account in self.accounts.items())
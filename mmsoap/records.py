@@ -0,0 +1,251 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Compact records for replies, delivery reports and blocked numbers, an incremental
+parser producing them, and a column-wise container for large numbers of records.
+"""
+
+import calendar
+import re
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+ReplyRecord = namedtuple('ReplyRecord', 'uid receipt_id format origin received content')
+
+ReportRecord = namedtuple('ReportRecord', 'uid receipt_id delivery_report_id recipient timestamp status')
+
+BlockedNumberRecord = namedtuple('BlockedNumberRecord', 'uid recipient')
+
+# fields converted to int when present
+INTEGER_FIELDS = frozenset(['uid', 'receipt_id', 'delivery_report_id'])
+
+# xsd:dateTime fields converted to naive datetimes in UTC when present
+TIMESTAMP_FIELDS = frozenset(['received', 'timestamp'])
+
+# fields with few distinct values, stored once per value by RecordColumns
+REPEATED_FIELDS = frozenset(['format', 'status'])
+
+_CAMEL = re.compile('([a-z0-9])([A-Z])')
+
+_DATETIME = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(Z|([+-])(\d\d):(\d\d))?$')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def field_name(name):
+    """ Convert an xml attribute or element name to a record field name, e.g. receiptId -> receipt_id. """
+    return _CAMEL.sub(r'\1_\2', name.split('}')[-1]).lower()
+
+
+def parse_datetime(text):
+    """
+    Convert an xsd:dateTime to a naive datetime in UTC.
+
+    Times without a timezone are taken to be in UTC.
+
+    :return: The datetime, or `text` unchanged if it isn't an xsd:dateTime.
+    """
+    match = _DATETIME.match(text.strip())
+    if match is None:
+        return text
+    year, month, day, hour, minute, second, fraction, zone, sign, zone_hours, zone_minutes = match.groups()
+    value = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                     int((fraction or '0')[:6].ljust(6, '0')))
+    if sign is not None:
+        offset = timedelta(hours=int(zone_hours), minutes=int(zone_minutes))
+        value = value - offset if sign == '+' else value + offset
+    return value
+
+
+def make_record(record_type, values):
+    """
+    Create a record from a dict of field values, converting the integer and timestamp fields.
+
+    :param record_type: The record class.
+    :param values: dict of field name to text. Missing fields are None.
+    """
+    fields = []
+    for field in record_type._fields:
+        value = values.get(field)
+        if value is not None:
+            if field in INTEGER_FIELDS:
+                try:
+                    value = int(value)
+                except ValueError:
+                    pass
+            elif field in TIMESTAMP_FIELDS and isinstance(value, basestring):
+                value = parse_datetime(value)
+        fields.append(value)
+    return record_type._make(fields)
+
+
+def from_suds(record_type, obj, tag=None):
+    """
+    Create a record from a suds object of a response, e.g. a reply of check_replies.
+
+    Attributes lose their leading underscore, and values of simple content
+    types, e.g. a recipient with a uid, are taken from their `value`.
+
+    :param record_type: The record class.
+    :param obj: The suds object.
+    :param tag: Field of the object's own value, e.g. 'recipient' for a blocked number.
+    """
+    values = {}
+    for name, value in obj:
+        if name == 'value' and tag is not None:
+            name = tag
+        elif hasattr(value, '__keylist__'):
+            for child_name, child_value in value:
+                if child_name != 'value':
+                    values.setdefault(field_name(child_name.lstrip('_')), child_value)
+            value = getattr(value, 'value', None)
+        values[field_name(name.lstrip('_'))] = value
+    return make_record(record_type, values)
+
+
+def to_records(record_type, objects, tag=None):
+    """
+    Convert suds objects of a response to records, see from_suds.
+
+    :return: list of records.
+    """
+    return [from_suds(record_type, obj, tag) for obj in objects]
+
+
+def iter_records(fp, tag, record_type):
+    """
+    Parse a SOAP response incrementally, yielding a record per `tag` element.
+
+    Elements are discarded once their record is created, so memory use doesn't
+    depend on the size of the response.
+
+    :param fp: File-like object with the response.
+    :param tag: Local name of the repeated element, e.g. 'reply'.
+    :param record_type: Record class created from the element's attributes, child elements
+                        and text, which is the field named after `tag`.
+    :return: Generator of records.
+    """
+    parents = []
+    try:
+        for event, element in ElementTree.iterparse(fp, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag.split('}')[-1] != tag:
+                continue
+            values = dict((field_name(k), v) for k, v in element.attrib.items())
+            if element.text is not None and element.text.strip():
+                values[field_name(tag)] = element.text.strip()
+            for child in element:
+                values[field_name(child.tag)] = child.text
+            yield make_record(record_type, values)
+            parents[-1].remove(element)
+    finally:
+        fp.close()
+
+
+class RecordColumns(object):
+    """
+    Records of one type stored column by column.
+
+    Integer fields are kept in arrays of machine integers and timestamps in arrays of
+    seconds since the epoch, and the values of fields with few distinct values, e.g.
+    status, are stored once. Holding a large pull of records this way takes a fraction
+    of the memory of a list of the records, let alone of suds objects. Indexing and
+    iterating produce the records again.
+
+    Example::
+
+        reports = RecordColumns(ReportRecord, client.iter_reports())
+        delivered = reports.column('status').count('delivered')
+    """
+
+    def __init__(self, record_type, records=()):
+        """
+        :param record_type: The record class.
+        :param records: Iterable of records to add.
+        """
+        self.record_type = record_type
+        self.fields = record_type._fields
+        self.columns = []
+        for field in self.fields:
+            if field in INTEGER_FIELDS:
+                self.columns.append(array('l'))
+            elif field in TIMESTAMP_FIELDS:
+                self.columns.append(array('d'))
+            else:
+                self.columns.append([])
+        self._values = {}
+        self.extend(records)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        values = []
+        for column in self.columns:
+            value = column[index]
+            if getattr(column, 'typecode', None) == 'd':
+                value = None if value != value else _EPOCH + timedelta(seconds=value)
+            values.append(value)
+        return self.record_type._make(values)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def append(self, record):
+        for position, field in enumerate(self.fields):
+            value = record[position]
+            column = self.columns[position]
+            if isinstance(column, array):
+                try:
+                    if column.typecode == 'd':
+                        value = float('nan') if value is None else _timestamp(value)
+                    column.append(value)
+                    continue
+                except (AttributeError, TypeError, OverflowError):
+                    # not a number after all, keep the values as they are
+                    column = self.columns[position] = self.column(field)
+            elif field in REPEATED_FIELDS:
+                value = self._values.setdefault(value, value)
+            column.append(value)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def column(self, name):
+        """ list of the values of field `name`. """
+        position = self.fields.index(name)
+        column = self.columns[position]
+        if not isinstance(column, array):
+            return list(column)
+        if column.typecode == 'd':
+            return [None if value != value else _EPOCH + timedelta(seconds=value) for value in column]
+        return column.tolist()
+
+
+def _timestamp(value):
+    """ Seconds since the epoch of a naive datetime in UTC. """
+    return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
@@ -0,0 +1,189 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Process-wide registry of parsed WSDL service models.
+
+Parsing the WSDL and resolving its schema is by far the most expensive part of
+creating a suds client. The registry parses each WSDL once per process and hands
+out lightweight clones which share the parsed service model but carry their own
+options (transport, cache, etc).
+"""
+
+import copy
+import threading
+
+from suds.bindings.multiref import MultiRef
+from suds.client import Client, ServiceSelector
+from suds.options import Options
+from suds.properties import Unskin
+from suds.sudsobject import Facade
+from suds.transport import Transport
+from suds.transport.https import HttpAuthenticated
+
+
+class ServiceModel(object):
+    """
+    A parsed WSDL shared between all clients created for the same key.
+    """
+
+    def __init__(self, client):
+        """
+        :param client: Fully initialised suds client used as the prototype for clones.
+        """
+        self.client = client
+        # request templates of the fast-path envelope writer, see mmsoap.envelope
+        self.templates = {}
+        # reply shapes of the native decoder, see mmsoap.decoder
+        self.shapes = {}
+
+    def clone(self, **options):
+        """
+        Create a suds client sharing this model's WSDL, factory and service definitions.
+
+        :param options: suds options to set on the clone, e.g. ``transport``.
+        :return: New suds client.
+        """
+        return SharedClient(self.client, **options)
+
+
+class SharedClient(Client):
+    """
+    A suds client built from a prototype instead of a WSDL url.
+
+    Unlike ``suds.client.Client.clone`` the options are copied shallowly, so the
+    cost of creating a client does not depend on the size of the transport or cache.
+    The prototype's transport is not copied: suds links the options of a transport
+    to those of one client only, so the clone gets the ``transport`` option, a new
+    HttpAuthenticated like suds clients, and a transport already used by another
+    client is wrapped in a SharedTransport.
+
+    suds bindings read options such as ``faults``, ``prefixes``, ``plugins`` and
+    ``soapheaders`` from the WSDL definitions rather than the client, so the clone
+    gets a shallow copy of the definitions, services and bindings carrying its own
+    options. The schema and types stay shared.
+    """
+
+    def __init__(self, prototype, **options):
+        self.options = Options()
+        defined = dict(Unskin(prototype.options).defined)
+        defined.pop('transport', None)
+        Unskin(self.options).update(defined)
+        transport = options.pop('transport', None) or HttpAuthenticated()
+        if Unskin(transport.options).links:
+            transport = SharedTransport(transport)
+        self.set_options(transport=transport, **options)
+        self.wsdl = copy.copy(prototype.wsdl)
+        self.wsdl.options = self.options
+        self.wsdl.services = self._services(prototype.wsdl.services)
+        self.factory = prototype.factory
+        self.service = ServiceSelector(self, self.wsdl.services)
+        self.sd = prototype.sd
+        self.messages = dict(tx=None, rx=None)
+
+    def _services(self, services):
+        """ Copy the services down to the methods, with bindings reading this client's options. """
+        bindings = {}
+
+        def rebind(binding):
+            if binding is None:
+                return None
+            if id(binding) not in bindings:
+                bindings[id(binding)] = copy.copy(binding)
+                bindings[id(binding)].wsdl = self.wsdl
+                bindings[id(binding)].multiref = MultiRef()
+            return bindings[id(binding)]
+
+        copied = []
+        for service in services:
+            service = copy.copy(service)
+            ports = []
+            for port in service.ports:
+                port = copy.copy(port)
+                methods = {}
+                for name, method in port.methods.items():
+                    clone = Facade('Method')
+                    for key, value in method:
+                        setattr(clone, key, value)
+                    clone.binding = Facade('binding')
+                    clone.binding.input = rebind(method.binding.input)
+                    clone.binding.output = rebind(method.binding.output)
+                    methods[name] = clone
+                port.methods = methods
+                ports.append(port)
+            service.ports = ports
+            copied.append(service)
+        return copied
+
+
+class SharedTransport(Transport):
+    """
+    Transport of one client delegating to a transport shared with other clients.
+    """
+
+    def __init__(self, transport):
+        Transport.__init__(self)
+        self.transport = transport
+
+    def open(self, request):
+        return self.transport.open(request)
+
+    def send(self, request):
+        return self.transport.send(request)
+
+    def __getattr__(self, name):
+        # e.g. ``stream`` of the mmsoap transports
+        return getattr(self.transport, name)
+
+
+class ServiceRegistry(object):
+    """
+    Thread-safe mapping of keys to parsed service models.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def get(self, key, build):
+        """
+        Get the service model for `key`, parsing it on first use.
+
+        :param key: Hashable key identifying the WSDL, e.g. ``(url, cache_location)``.
+        :param build: Callable returning a new suds client, only called once per key.
+        :return: The shared ServiceModel.
+        """
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = ServiceModel(build())
+                    self._models[key] = model
+        return model
+
+    def discard(self, key):
+        """ Forget the service model for `key` so the next client parses the WSDL again. """
+        with self._lock:
+            self._models.pop(key, None)
+
+    def clear(self):
+        """ Forget all service models. """
+        with self._lock:
+            self._models.clear()
+
+    def __contains__(self, key):
+        return key in self._models
+
+
+registry = ServiceRegistry()
@@ -0,0 +1,224 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Decoding of sendMessages responses.
+"""
+
+from collections import namedtuple
+
+# error codes after which the recipient is never resent
+PERMANENT_CODES = frozenset(['invalidRecipient', 'recipientBlocked', 'emptyMessageContent'])
+
+# error codes after which the recipient may be resent
+RETRYABLE_CODES = frozenset(['other'])
+
+
+def iter_errors(response):
+    """
+    Iterate over the errors in a response.
+
+    :param response: Response of sendMessages, blockNumbers or unblockNumbers.
+    :return: Generator of (code, sequence number, [(uid, recipient), ...]).
+             The sequence number and uid are None when the response doesn't include them.
+    """
+    errors = getattr(response, 'errors', None)
+    for error in getattr(errors, 'error', None) or []:
+        recipients = getattr(error, 'recipients', None)
+        yield (getattr(error, '_code', None),
+               getattr(error, '_sequenceNumber', None),
+               [(getattr(r, '_uid', None), getattr(r, 'value', None))
+                for r in getattr(recipients, 'recipient', None) or []])
+
+
+class RecipientError(namedtuple('RecipientError', 'code sequence_number uid recipient')):
+    """
+    An error for one recipient of one message. `uid` and `recipient` are None
+    for errors which don't name a recipient.
+    """
+    __slots__ = ()
+
+    @property
+    def retryable(self):
+        """ True if the recipient may be resent. """
+        return self.code in RETRYABLE_CODES
+
+    @property
+    def permanent(self):
+        """ True if resending the recipient would fail again. """
+        return self.code in PERMANENT_CODES
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def decode_errors(response):
+    """
+    Decode every error in a response, one per recipient.
+
+    :param response: Response of sendMessages, blockNumbers or unblockNumbers.
+    :return: List of RecipientError.
+    """
+    decoded = []
+    for code, seq, recipients in iter_errors(response):
+        seq = _int(seq)
+        if not recipients:
+            decoded.append(RecipientError(code, seq, None, None))
+        for uid, recipient in recipients:
+            decoded.append(RecipientError(code, seq, _int(uid), recipient))
+    return decoded
+
+
+class SendResult(object):
+    """
+    Result of MMSoapClient.send_messages_with_retry.
+
+    `sent` and `scheduled` are summed over all attempts. `errors` are the errors
+    of the last attempt each recipient was sent in, so a recipient which failed
+    and then succeeded on a resend has no error. Errors without a uid belong to
+    the whole message and are replaced by the errors of the next attempt.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.scheduled = 0
+        self.attempts = 0
+        self.retried = 0
+        self.account_details = None
+        self.errors = []
+
+    def add(self, response, errors, uids):
+        """
+        Merge the response of one attempt.
+
+        :param response: The sendMessages response.
+        :param errors: The decoded errors of the response.
+        :param uids: The uids of the recipients sent in this attempt.
+        """
+        self.attempts += 1
+        self.sent += getattr(response, '_sent', 0) or 0
+        self.scheduled += getattr(response, '_scheduled', 0) or 0
+        self.account_details = getattr(response, 'accountDetails', self.account_details)
+        uids = set(uids)
+        self.errors = [e for e in self.errors if e.uid is not None and e.uid not in uids] + errors
+
+    @property
+    def failed(self):
+        """ Number of errors left after the last attempt. """
+        return len(self.errors)
+
+    def by_uid(self):
+        """ The errors as a dict of uid to RecipientError. """
+        return dict((e.uid, e) for e in self.errors)
+
+
+class BatchResult(object):
+    """
+    Result of sending a batch of messages in one or more sendMessages requests.
+
+    Counts are summed over every request. Errors are keyed by the sequence number of
+    the message they belong to, which is its 1-based position in the batch, and
+    each error carries the uid of its recipient.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.scheduled = 0
+        self.failed = 0
+        self.requests = 0
+        self.account_details = None
+        self.sequence_numbers = []
+        self.errors = {}
+
+    def add(self, response, sequence_numbers):
+        """
+        Merge the response of one sendMessages request.
+
+        :param response: The sendMessages response.
+        :param sequence_numbers: Sequence numbers of the messages sent in the request.
+        """
+        self.requests += 1
+        self.sent += getattr(response, '_sent', 0) or 0
+        self.scheduled += getattr(response, '_scheduled', 0) or 0
+        self.failed += getattr(response, '_failed', 0) or 0
+        self.account_details = getattr(response, 'accountDetails', self.account_details)
+        self.sequence_numbers.extend(sequence_numbers)
+        for error in decode_errors(response):
+            self.errors.setdefault(error.sequence_number, []).append(error)
+
+    def error_for(self, seq, uid):
+        """
+        Get the error of one recipient of one message.
+
+        :param seq: Sequence number of the message.
+        :param uid: uid of the recipient.
+        :return: RecipientError, or None if the recipient had no error.
+        """
+        for error in self.errors.get(seq, []):
+            if error.uid == uid:
+                return error
+        return None
+
+    def errors_for(self, seq):
+        """
+        Get the errors of one message.
+
+        :param seq: Sequence number of the message.
+        :return: List of RecipientError, empty if the message had no errors.
+        """
+        return self.errors.get(seq, [])
+
+    def succeeded(self, seq):
+        """ True if the message with sequence number `seq` was sent without any errors. """
+        return seq not in self.errors
+
+
+class TemplatedResult(BatchResult):
+    """
+    Result of send_templated.
+
+    Every recipient's uid is the 0-based number of its row, so errors can be traced
+    back to rows with error_for_row. Sequence numbers of the messages are not kept,
+    so the result doesn't grow with the number of rows.
+    """
+
+    def __init__(self):
+        BatchResult.__init__(self)
+        self.rows = 0
+        self.messages = 0
+        self.skipped = 0
+
+    def add(self, response, sequence_numbers):
+        BatchResult.add(self, response, ())
+
+    @property
+    def requests_saved(self):
+        """ sendMessages requests saved compared to a send_messages call per row sent. """
+        return max(0, self.rows - self.skipped - self.requests)
+
+    def error_for_row(self, row):
+        """
+        Get the error of a row.
+
+        :param row: 0-based number of the row.
+        :return: RecipientError, or None if the row's recipient had no error.
+        """
+        for errors in self.errors.itervalues():
+            for error in errors:
+                if error.uid == row:
+                    return error
+        return None
@@ -0,0 +1,572 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Local stand-in for the MessageMedia SOAP service.
+
+The simulator keeps the state of every account it sees (credit, scheduled messages,
+queued replies and delivery reports, blocked numbers) and implements every operation
+of the WSDL against it. Responses can be delayed by a latency distribution, and faults,
+HTTP errors, recipient errors and throttling can be injected::
+
+    python -m mmsoap.simulator --port 8080 --latency lognormal:0.05,0.5 --fault-rate 0.01
+
+    client = MMSoapClient(user, password, wsdl_url='http://127.0.0.1:8080/simulator.wsdl')
+
+The simulator serves its own WSDL (simulator.wsdl next to this module), which
+describes the operations as MMSoapClient uses them, so nothing leaves the machine.
+A snapshot of the live WSDL (see mmsoap.snapshot) can be served instead with
+``--snapshot DIRECTORY``.
+"""
+
+import calendar
+import itertools
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from datetime import datetime
+from optparse import OptionParser
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+from .snapshot import load_manifest
+
+NAMESPACE = 'http://xml.m4u.com.au/2009'
+
+WSDL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulator.wsdl')
+
+# service address in simulator.wsdl, replaced with the url of the server
+WSDL_ADDRESS = 'http://127.0.0.1:8080/'
+
+# the envelope of the canned replies in mmsoap.mock
+ENVELOPE = ('<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+            '<soap:Header></soap:Header><soap:Body>%s</soap:Body></soap:Envelope>')
+
+# first element of the SOAP body, i.e. the operation
+OPERATION = re.compile(r'<(?:[\w.-]+:)?Body[^>]*>\s*<(?:[\w.-]+:)?(\w+)')
+
+# operations of the WSDL, each implemented by the Simulator method of the same name
+OPERATIONS = frozenset(['checkUser', 'sendMessages', 'checkReplies', 'confirmReplies', 'checkReports',
+                        'confirmReports', 'deleteScheduledMessages', 'blockNumbers', 'unblockNumbers',
+                        'getBlockedNumbers'])
+
+# recipients the simulator accepts
+RECIPIENT = re.compile(r'\+?[1-9][0-9]{6,14}$')
+
+
+def fault(code, reason):
+    """ A SOAP fault envelope. """
+    return ENVELOPE % ('<soap:Fault><soap:Code><soap:Value>%s</soap:Value></soap:Code>'
+                       '<soap:Reason><soap:Text xml:lang="en">%s</soap:Text></soap:Reason></soap:Fault>'
+                       % (code, escape(reason)))
+
+
+def timestamp(seconds=None):
+    return datetime.utcfromtimestamp(seconds or time.time()).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_timestamp(text):
+    """ Seconds since the epoch of an xsd:dateTime in UTC, None if it can't be parsed. """
+    try:
+        value = datetime.strptime(text.strip()[:19], '%Y-%m-%dT%H:%M:%S')
+    except (AttributeError, ValueError):
+        return None
+    return calendar.timegm(value.timetuple())
+
+
+def local(tag):
+    return tag.split('}')[-1]
+
+
+def find(element, name):
+    """ First descendant of `element` with local name `name`, None if there is none. """
+    for child in element.getiterator():
+        if local(child.tag) == name:
+            return child
+    return None
+
+
+def find_all(element, name):
+    return [child for child in element.getiterator() if local(child.tag) == name]
+
+
+def text(element, name, default=None):
+    child = find(element, name)
+    return child.text if child is not None and child.text is not None else default
+
+
+class Latency(object):
+    """
+    Distribution of response delays.
+
+    Specified as ``constant:SECONDS``, ``uniform:LOW,HIGH``, ``exponential:MEAN``,
+    ``lognormal:MEDIAN,SIGMA`` or ``none``.
+    """
+
+    def __init__(self, spec='none', seed=None):
+        self.spec = spec
+        self.random = random.Random(seed)
+        name, _, args = spec.partition(':')
+        args = [float(arg) for arg in args.split(',') if arg]
+        if name == 'none':
+            self.sample = lambda: 0.0
+        elif name == 'constant':
+            self.sample = lambda: args[0]
+        elif name == 'uniform':
+            self.sample = lambda: self.random.uniform(args[0], args[1])
+        elif name == 'exponential':
+            self.sample = lambda: self.random.expovariate(1.0 / args[0])
+        elif name == 'lognormal':
+            self.sample = lambda: self.random.lognormvariate(math.log(args[0]), args[1])
+        else:
+            raise ValueError('unknown latency distribution %r' % spec)
+
+
+class Account(object):
+    """
+    State of one simulated account.
+    """
+
+    def __init__(self, user_id, credit_limit):
+        self.user_id = user_id
+        self.credit_limit = credit_limit
+        self.credit_remaining = credit_limit
+        self.replies = {}       # receiptId -> xml, until confirmed
+        self.reports = {}       # deliveryReportId -> xml, until confirmed
+        self.scheduled = {}     # messageId -> (due, [delivery])
+        self.scheduled_ids = itertools.count(1)
+        self.blocked = set()
+        self.requests = []      # times of recent requests, for throttling
+
+
+class Simulator(object):
+    """
+    Stateful implementation of the MessageMedia SOAP operations.
+
+    Sent messages are delivered immediately, or when they are due if they are
+    scheduled. Each delivery queues a delivery report if one was requested, and a
+    reply with probability `reply_rate`. Replies and reports are returned by every
+    check until they are confirmed. The ids of scheduled messages, for
+    deleteScheduledMessages, are listed in the sendMessages result as
+    scheduledMessages, which the MessageMedia schema doesn't have.
+    """
+
+    def __init__(self, credit_limit=1000000, accounts=None, latency='none', fault_rate=0.0, http_error_rate=0.0,
+                 error_rate=0.0, reply_rate=0.0, requests_per_second=None, seed=None):
+        """
+        :param credit_limit: Credit of every account.
+        :param accounts: dict of userId to password. Other users are rejected with a fault.
+                         Defaults to None, which accepts any user.
+        :param latency: Latency spec, see Latency.
+        :param fault_rate: Fraction of requests answered with a SOAP fault.
+        :param http_error_rate: Fraction of requests answered with HTTP 503.
+        :param error_rate: Fraction of valid recipients failing with the error code 'other'.
+        :param reply_rate: Fraction of delivered messages which get a reply.
+        :param requests_per_second: Requests per second per account before requests are
+                                    answered with a fault, None for no limit.
+        :param seed: Seed of the random choices, for reproducible runs.
+        """
+        self.credit_limit = credit_limit
+        self.accounts = accounts
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency, seed)
+        self.fault_rate = fault_rate
+        self.http_error_rate = http_error_rate
+        self.error_rate = error_rate
+        self.reply_rate = reply_rate
+        self.requests_per_second = requests_per_second
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.state = {}
+        self.lock = threading.Lock()
+        self.counts = dict(requests=0, faults=0, http_errors=0, throttled=0)
+
+    def account(self, user_id):
+        account = self.state.get(user_id)
+        if account is None:
+            account = self.state[user_id] = Account(user_id, self.credit_limit)
+        return account
+
+    def queue(self, user_id, replies=0, reports=0):
+        """ Queue synthetic replies and delivery reports for an account, e.g. to benchmark checks. """
+        with self.lock:
+            account = self.account(user_id)
+            for n in range(max(replies, reports)):
+                number = '+614%08d' % n
+                self.deliver(account, [(str(n), number, 'Message %d' % n, True)],
+                             reply=n < replies, report=n < reports)
+
+    def stats(self):
+        """ Counts of requests and injected failures. """
+        with self.lock:
+            return dict(self.counts)
+
+    def __call__(self, operation, body):
+        """
+        Answer a request.
+
+        :param operation: Name of the operation, e.g. 'sendMessages'.
+        :param body: The request envelope.
+        :return: (HTTP status, response envelope).
+        """
+        delay = self.latency.sample()
+        if delay > 0:
+            time.sleep(delay)
+
+        with self.lock:
+            self.counts['requests'] += 1
+            if self.random.random() < self.http_error_rate:
+                self.counts['http_errors'] += 1
+                return 503, 'Service Unavailable'
+            if self.random.random() < self.fault_rate:
+                self.counts['faults'] += 1
+                return 500, fault('soap:Receiver', 'Simulated fault')
+
+            try:
+                request = ElementTree.fromstring(body)
+            except SyntaxError:
+                return 500, fault('soap:Sender', 'Malformed request')
+
+            user_id, password = text(request, 'userId'), text(request, 'password')
+            if user_id is None or (self.accounts is not None and self.accounts.get(user_id) != password):
+                return 500, fault('soap:Sender', 'Authentication failed')
+            account = self.account(user_id)
+
+            if self.throttled(account):
+                self.counts['throttled'] += 1
+                return 500, fault('soap:Receiver', 'Too many requests')
+
+            if operation not in OPERATIONS:
+                return 500, fault('soap:Sender', 'Unknown operation %s' % operation)
+
+            self.deliver_due(account)
+            result = getattr(self, operation)(account, request)
+
+        return 200, ENVELOPE % ('<%sResponse xmlns="%s">%s</%sResponse>' % (operation, NAMESPACE, result, operation))
+
+    def throttled(self, account):
+        if self.requests_per_second is None:
+            return False
+        now = time.time()
+        account.requests = [t for t in account.requests if now - t < 1.0]
+        if len(account.requests) >= self.requests_per_second:
+            return True
+        account.requests.append(now)
+        return False
+
+    def account_details(self, account):
+        return '<accountDetails type="daily" creditLimit="%d" creditRemaining="%d"/>' % (
+            account.credit_limit, account.credit_remaining)
+
+    def checkUser(self, account, request):
+        return '<result>%s</result>' % self.account_details(account)
+
+    def sendMessages(self, account, request):
+        messages = find(request, 'messages')
+        send_mode = messages.get('sendMode', 'normal') if messages is not None else 'normal'
+        sent = scheduled = failed = 0
+        errors = {}     # (code, sequenceNumber) -> [(uid, recipient)]
+        message_ids = []
+
+        for message in find_all(request, 'message'):
+            seq = message.get('sequenceNumber')
+            content = text(message, 'content', '')
+            due = parse_timestamp(text(message, 'scheduled'))
+            report = text(message, 'deliveryReport', 'false') == 'true'
+            deliveries = []
+
+            for recipient in find_all(message, 'recipient'):
+                uid, number = recipient.get('uid'), (recipient.text or '').strip()
+                if not content:
+                    code = 'emptyMessageContent'
+                elif not RECIPIENT.match(number):
+                    code = 'invalidRecipient'
+                elif number in account.blocked:
+                    code = 'recipientBlocked'
+                elif send_mode == 'dropAllWithErrors' or (send_mode == 'dropAll' and self.random.random() < .5):
+                    code = 'other'
+                elif account.credit_remaining <= 0 or self.random.random() < self.error_rate:
+                    code = 'other'
+                else:
+                    code = None
+
+                if code is not None:
+                    errors.setdefault((code, seq), []).append((uid, number))
+                    failed += 1
+                    continue
+
+                if send_mode == 'normal':
+                    account.credit_remaining -= 1
+                    deliveries.append((uid, number, content, report))
+                if due is not None and due > time.time():
+                    scheduled += 1
+                else:
+                    sent += 1
+
+            if due is not None and due > time.time():
+                message_id = message.get('messageId') or 'scheduled-%d' % next(account.scheduled_ids)
+                account.scheduled[message_id] = (due, deliveries)
+                message_ids.append(message_id)
+            else:
+                self.deliver(account, deliveries)
+
+        return '<result sent="%d" scheduled="%d" failed="%d">%s%s%s</result>' % (
+            sent, scheduled, failed, self.account_details(account), self.errors(errors),
+            self.message_ids(message_ids))
+
+    def errors(self, errors):
+        if not errors:
+            return ''
+        xml = []
+        for (code, seq), recipients in sorted(errors.items()):
+            xml.append('<error code="%s"%s><recipients>%s</recipients></error>' % (
+                code, '' if seq is None else ' sequenceNumber=%s' % quoteattr(seq),
+                ''.join('<recipient%s>%s</recipient>' % ('' if uid is None else ' uid=%s' % quoteattr(uid),
+                                                        escape(number)) for uid, number in recipients)))
+        return '<errors>%s</errors>' % ''.join(xml)
+
+    def message_ids(self, message_ids):
+        if not message_ids:
+            return ''
+        return '<scheduledMessages>%s</scheduledMessages>' % ''.join(
+            '<message messageId=%s/>' % quoteattr(message_id) for message_id in message_ids)
+
+    def deliver(self, account, deliveries, reply=None, report=None):
+        """
+        Queue the delivery reports and replies of delivered messages.
+
+        :param deliveries: List of (uid, recipient, content, delivery report requested).
+        :param reply: Queue a reply for every message (True) or none (False) instead of by `reply_rate`.
+        :param report: Queue a report for every message (True) or none (False) instead of as requested.
+        """
+        for uid, number, content, requested in deliveries:
+            receipt_id = next(self.ids)
+            uid_attr = '' if uid is None else ' uid=%s' % quoteattr(uid)
+            if (requested if report is None else report):
+                report_id = next(self.ids)
+                account.reports[report_id] = (
+                    '<report%s receiptId="%d" deliveryReportId="%d" status="delivered">'
+                    '<recipient>%s</recipient><timestamp>%s</timestamp></report>'
+                    % (uid_attr, receipt_id, report_id, escape(number), timestamp()))
+            if (self.random.random() < self.reply_rate if reply is None else reply):
+                account.replies[receipt_id] = (
+                    '<reply%s receiptId="%d" format="SMS"><origin>%s</origin><received>%s</received>'
+                    '<content>%s</content></reply>'
+                    % (uid_attr, receipt_id, escape(number), timestamp(), escape('Re: ' + content)))
+
+    def deliver_due(self, account):
+        now = time.time()
+        for message_id, (due, deliveries) in list(account.scheduled.items()):
+            if due <= now:
+                del account.scheduled[message_id]
+                self.deliver(account, deliveries)
+
+    def checkReplies(self, account, request):
+        return self.check(account.replies, int(text(request, 'maximumReplies', 0)) or None, 'replies')
+
+    def checkReports(self, account, request):
+        return self.check(account.reports, int(text(request, 'maximumReports', 0)) or None, 'reports')
+
+    def check(self, queue, maximum, tag):
+        ids = sorted(queue)[:maximum]
+        return '<result returned="%d" remaining="%d"><%s>%s</%s></result>' % (
+            len(ids), len(queue) - len(ids), tag, ''.join(queue[i] for i in ids), tag)
+
+    def confirmReplies(self, account, request):
+        return self.confirm(account.replies, [item.get('receiptId') for item in find_all(request, 'reply')])
+
+    def confirmReports(self, account, request):
+        return self.confirm(account.reports, [item.get('deliveryReportId') for item in find_all(request, 'report')])
+
+    def confirm(self, queue, ids):
+        confirmed = 0
+        for item_id in ids:
+            try:
+                item_id = int(item_id)
+            except (TypeError, ValueError):
+                continue
+            if queue.pop(item_id, None) is not None:
+                confirmed += 1
+        return '<result confirmed="%d"/>' % confirmed
+
+    def deleteScheduledMessages(self, account, request):
+        unscheduled = 0
+        for message in find_all(request, 'message'):
+            if account.scheduled.pop(message.get('messageId'), None) is not None:
+                unscheduled += 1
+        return '<result unscheduled="%d"/>' % unscheduled
+
+    def blockNumbers(self, account, request):
+        return self.block(account, request, 'blocked', True)
+
+    def unblockNumbers(self, account, request):
+        return self.block(account, request, 'unblocked', False)
+
+    def block(self, account, request, counted, add):
+        """ Block or unblock numbers. Blocking a blocked number or unblocking an unblocked one succeeds. """
+        done, errors = 0, {}
+        for recipient in find_all(request, 'recipient'):
+            number = (recipient.text or '').strip()
+            if not RECIPIENT.match(number):
+                errors.setdefault(('invalidRecipient', None), []).append((recipient.get('uid'), number))
+                continue
+            if add:
+                account.blocked.add(number)
+            else:
+                account.blocked.discard(number)
+            done += 1
+        return '<result %s="%d" failed="%d">%s</result>' % (
+            counted, done, sum(len(r) for r in errors.values()), self.errors(errors))
+
+    def getBlockedNumbers(self, account, request):
+        numbers = sorted(account.blocked)
+        maximum = int(text(request, 'maximumRecipients', 0)) or None
+        returned = numbers[:maximum]
+        return '<result found="%d" returned="%d"><recipients>%s</recipients></result>' % (
+            len(numbers), len(returned), ''.join('<recipient>%s</recipient>' % escape(n) for n in returned))
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        document = self.server.documents.get(self.path)
+        if document is None:
+            self.reply(404, 'text/plain', 'not found')
+        else:
+            self.reply(200, 'text/xml', document)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('content-length') or 0))
+        match = OPERATION.search(body)
+        if match is None:
+            status, xml = 500, fault('soap:Sender', 'No operation in request')
+        else:
+            status, xml = self.server.respond(match.group(1), body)
+        self.reply(status, 'application/soap+xml; charset=utf-8', xml)
+
+    def reply(self, status, content_type, content):
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SimulatorServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server answering SOAP requests and serving the WSDL.
+
+    The WSDL is simulator.wsdl, or a snapshot of the live WSDL. Absolute urls of
+    snapshot documents inside the documents are rewritten to point at the server,
+    so the WSDL and everything it imports is loaded from it.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, respond=None, snapshot=None, host='127.0.0.1', port=0):
+        """
+        :param respond: Called with (operation, request envelope), returns (HTTP status, response envelope).
+                        Defaults to a new Simulator.
+        :param snapshot: Directory of a WSDL snapshot to serve, None to serve simulator.wsdl.
+        :param host: Address to listen on.
+        :param port: Port to listen on, 0 for any free port.
+        """
+        HTTPServer.__init__(self, (host, port), SimulatorHandler)
+        self.respond = respond or Simulator()
+        self.url = 'http://%s:%d/' % (host, self.server_address[1])
+        self.documents = {}
+        self.wsdl_url = None
+        self.thread = None
+        if snapshot is not None:
+            self.load_snapshot(snapshot)
+        else:
+            self.load_wsdl(WSDL)
+
+    def load_wsdl(self, path):
+        with open(path, 'rb') as f:
+            self.documents['/simulator.wsdl'] = f.read().replace(WSDL_ADDRESS, self.url)
+        self.wsdl_url = self.url + 'simulator.wsdl'
+
+    def load_snapshot(self, location):
+        manifest = load_manifest(location)
+        paths = dict((url, 'documents/%s' % document['file']) for url, document in manifest['documents'].items())
+        for url, document in manifest['documents'].items():
+            with open(os.path.join(location, document['file']), 'rb') as f:
+                content = f.read()
+            for other, path in paths.items():
+                content = content.replace(escape(other), self.url + path).replace(other, self.url + path)
+            self.documents['/' + paths[url]] = content
+        self.wsdl_url = self.url + paths[manifest['wsdl_url']]
+
+    def start(self):
+        """ Serve on a background thread. """
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    """ Command line entry point, see the module docstring. """
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--host', default='127.0.0.1', help='address to listen on (default: %default)')
+    parser.add_option('--port', type='int', default=8080, help='port to listen on (default: %default)')
+    parser.add_option('--snapshot', default=None, help='WSDL snapshot directory to serve instead of simulator.wsdl')
+    parser.add_option('--latency', default='none',
+                      help='constant:S, uniform:LOW,HIGH, exponential:MEAN, lognormal:MEDIAN,SIGMA or none')
+    parser.add_option('--credit', type='int', default=1000000, help='credit of each account (default: %default)')
+    parser.add_option('--fault-rate', type='float', default=0.0, help='fraction of requests failing with a fault')
+    parser.add_option('--http-error-rate', type='float', default=0.0, help='fraction of requests failing with 503')
+    parser.add_option('--error-rate', type='float', default=0.0, help="fraction of recipients failing with 'other'")
+    parser.add_option('--reply-rate', type='float', default=0.0, help='fraction of messages getting a reply')
+    parser.add_option('--throttle', type='float', default=None, help='requests per second per account')
+    parser.add_option('--seed', type='int', default=None, help='random seed')
+    options, args = parser.parse_args(argv)
+
+    simulator = Simulator(credit_limit=options.credit, latency=options.latency, fault_rate=options.fault_rate,
+                          http_error_rate=options.http_error_rate, error_rate=options.error_rate,
+                          reply_rate=options.reply_rate, requests_per_second=options.throttle, seed=options.seed)
+    server = SimulatorServer(simulator, options.snapshot, options.host, options.port)
+    sys.stdout.write('SOAP endpoint: %s\nWSDL: %s\n' % (server.url, server.wsdl_url))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stdout.write('%s\n' % simulator.stats())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Offline snapshot of the WSDL and the schema documents it imports.
+
+A snapshot is written to a directory, e.g. when a deployment is built, and clients
+created with ``frozen=DIRECTORY`` start without fetching anything over the network.
+It is only compared with the live WSDL when asked to, e.g.::
+
+    python -m mmsoap.snapshot --output /srv/app/wsdl           # write a snapshot
+    python -m mmsoap.snapshot --output /srv/app/wsdl --check   # compare it with the live WSDL
+
+    client = MMSoapClient(user, password, frozen='/srv/app/wsdl')
+
+The snapshot holds the raw documents, not a parsed service model: a frozen client
+still parses them, once per process, but never waits on the network or on the
+WSDL cache. No snapshot is shipped with this package.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+from optparse import OptionParser
+from StringIO import StringIO
+
+import suds
+from suds.cache import NoCache
+from suds.client import Client
+from suds.transport import Transport
+
+from .exceptions import SnapshotMissingException
+
+MANIFEST = 'manifest.json'
+
+
+def digest(content):
+    """ SHA-1 hex digest of a document. """
+    return hashlib.sha1(content).hexdigest()
+
+
+def load_manifest(location):
+    """
+    Read the snapshot manifest.
+
+    :param location: Directory containing the snapshot.
+    :return: dict with the WSDL url, suds version, creation time and documents (url -> file, sha1).
+    :raises SnapshotMissingException: if there is no snapshot at `location`.
+    """
+    try:
+        f = open(os.path.join(location, MANIFEST))
+    except IOError:
+        raise SnapshotMissingException(
+            'No WSDL snapshot in %s, run "python -m mmsoap.snapshot --output %s" to create one'
+            % (location, location))
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+class SnapshotTransport(Transport):
+    """
+    Transport serving documents from a snapshot, delegating everything else.
+    """
+
+    def __init__(self, transport, location):
+        """
+        :param transport: Transport used for SOAP calls and documents not in the snapshot.
+        :param location: Directory containing the snapshot.
+        """
+        Transport.__init__(self)
+        self.transport = transport
+        self.location = location
+        self.documents = load_manifest(location)['documents']
+
+    def open(self, request):
+        document = self.documents.get(request.url)
+        if document is None:
+            return self.transport.open(request)
+        return open(os.path.join(self.location, document['file']), 'rb')
+
+    def send(self, request):
+        return self.transport.send(request)
+
+
+class RecordingTransport(Transport):
+    """
+    Transport remembering every document it opens, in order.
+    """
+
+    def __init__(self, transport):
+        Transport.__init__(self)
+        self.transport = transport
+        self.documents = []
+
+    def open(self, request):
+        fp = self.transport.open(request)
+        try:
+            content = fp.read()
+        finally:
+            fp.close()
+        self.documents.append((request.url, content))
+        return StringIO(content)
+
+    def send(self, request):
+        return self.transport.send(request)
+
+
+def fetch(url, transport):
+    """
+    Download the WSDL at `url` and every document it imports.
+
+    :param url: WSDL url.
+    :param transport: Transport used to fetch the documents.
+    :return: List of (url, content) in the order they were read.
+    """
+    recorder = RecordingTransport(transport)
+    Client(url, cache=NoCache(), transport=recorder)
+    return recorder.documents
+
+
+def write(url, documents, location):
+    """
+    Write a snapshot, replacing the one at `location`.
+
+    Documents are named after their digest and every file is written to a temporary
+    file renamed over it, the manifest last, so clients starting meanwhile read
+    either the old snapshot or the new one.
+
+    :param url: WSDL url the documents were fetched from.
+    :param documents: List of (url, content) as returned by fetch.
+    :param location: Directory to write the snapshot to.
+    :return: The new manifest.
+    """
+    if not os.path.isdir(location):
+        os.makedirs(location)
+
+    manifest = dict(wsdl_url=url,
+                    suds=suds.__version__,
+                    created=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    documents={})
+    for doc_url, content in documents:
+        sha1 = digest(content)
+        name = 'document-%s.xml' % sha1
+        if not os.path.exists(os.path.join(location, name)):
+            _write_file(location, name, content)
+        manifest['documents'][doc_url] = dict(file=name, sha1=sha1)
+
+    try:
+        previous = load_manifest(location)['documents'].values()
+    except (SnapshotMissingException, ValueError):
+        previous = []
+    _write_file(location, MANIFEST, json.dumps(manifest, indent=2, sort_keys=True))
+
+    current = set(document['file'] for document in manifest['documents'].values())
+    for name in set(document['file'] for document in previous) - current:
+        try:
+            os.remove(os.path.join(location, name))
+        except OSError:
+            pass
+    return manifest
+
+
+def _write_file(location, name, data):
+    """ Write a file in `location` through a temporary file renamed over it. """
+    path = os.path.join(location, name)
+    fd, temp = tempfile.mkstemp(dir=location, prefix='.%s-' % name)
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        os.chmod(temp, 0o644)
+        try:
+            os.rename(temp, path)
+        except OSError:
+            # windows doesn't replace existing files
+            os.remove(path)
+            os.rename(temp, path)
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def compare(documents, location):
+    """
+    Compare live documents with the snapshot.
+
+    :param documents: List of (url, content) as returned by fetch.
+    :param location: Directory containing the snapshot.
+    :return: Sorted list of urls which were added, removed or changed. Empty if the snapshot is current.
+    """
+    snapshot = load_manifest(location)['documents']
+    live = dict((url, digest(content)) for url, content in documents)
+    changed = set(url for url in live if url not in snapshot or snapshot[url]['sha1'] != live[url])
+    changed.update(url for url in snapshot if url not in live)
+    return sorted(changed)
+
+
+def main(argv=None):
+    """ Command line entry point, see the module docstring. """
+    parser = OptionParser(usage='%prog --output DIR [--check] [--url URL]')
+    parser.add_option('--url', default=None, help='WSDL url (default: MMSoapClient.WSDL_URL)')
+    parser.add_option('--output', help='snapshot directory')
+    parser.add_option('--check', action='store_true', default=False,
+                      help='compare the snapshot with the live WSDL instead of writing it')
+    options, args = parser.parse_args(argv)
+    if not options.output:
+        parser.error('--output is required')
+
+    from .client import MMSoapClient, WellBehavedHttpTransport
+
+    url = options.url or MMSoapClient.WSDL_URL
+    documents = fetch(url, WellBehavedHttpTransport())
+
+    if options.check:
+        changed = compare(documents, options.output)
+        for doc_url in changed:
+            sys.stdout.write('changed: %s\n' % doc_url)
+        if changed:
+            return 1
+        sys.stdout.write('snapshot is up to date\n')
+        return 0
+
+    write(url, documents, options.output)
+    sys.stdout.write('wrote %d documents to %s\n' % (len(documents), options.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
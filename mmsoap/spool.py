@@ -0,0 +1,290 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Durable SQLite-backed outbound message spool.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from logging import getLogger
+
+from .results import BatchResult
+
+log = getLogger(__name__)
+
+PENDING, IN_FLIGHT, DONE, FAILED = 0, 1, 2, 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    state INTEGER NOT NULL DEFAULT 0,
+    message TEXT NOT NULL,
+    errors TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spool_state ON spool (state, id);
+'''
+
+
+class Spool(object):
+    """
+    Local on-disk queue of messages in front of MMSoapClient.send_message_batch.
+
+    enqueue() only writes a row to a local SQLite file. A drainer, either the background
+    thread started by start() or explicit drain() calls, sends pending rows in large
+    batches and marks each row done or failed from the per-sequence-number results as
+    soon as the request sending it returns. A row is done if at least one of its recipients
+    was accepted; the errors of the others are kept with it, see partial_failures().
+
+    Several drainers, also in other processes, can share a file: each row is claimed by
+    exactly one of them.
+
+    Rows being sent are in flight until then. Rows left in flight by a process which
+    stopped are only sent again after recover(), so delivery is at-least-once.
+
+    Example::
+
+        spool = Spool('/var/spool/mmsoap.db', client)
+        spool.recover()  # no other process drains this file
+        spool.start()
+        spool.enqueue(['+61412345678'], 'Hello')
+    """
+
+    def __init__(self, path, client, batch_size=1000, interval=1.0, keep_done=False):
+        """
+        :param path: Path of the SQLite file, created if missing.
+        :param client: The MMSoapClient used by the drainer.
+        :param batch_size: Maximum number of rows sent per drain.
+        :param interval: Seconds the drainer thread waits when the spool is empty or sending failed.
+        :param keep_done: Keep sent rows instead of deleting them.
+        """
+        self.path = path
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = interval
+        self.keep_done = keep_done
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def enqueue(self, recipients, content, scheduled=None, report=None):
+        """
+        Add a message to the spool.
+
+        :param recipients: Iterable of recipient numbers
+        :param content: Message content
+        :param scheduled: Scheduled date/time of the message in UTC format.
+        :param report: Request a delivery report for this message.
+        :return: id of the row.
+        """
+        return self.enqueue_many([dict(recipients=recipients, content=content,
+                                       scheduled=scheduled, report=report)])[0]
+
+    def enqueue_many(self, messages):
+        """
+        Add messages to the spool in a single transaction.
+
+        :param messages: Iterable of dicts of send_messages arguments (recipients, content, scheduled, report).
+        :return: List of row ids.
+        """
+        now = time.time()
+        ids = []
+        with self.lock:
+            with self.connection:
+                for message in messages:
+                    cursor = self.connection.execute(
+                        'INSERT INTO spool (message, created, updated) VALUES (?, ?, ?)',
+                        (self._dumps(message), now, now))
+                    ids.append(cursor.lastrowid)
+        return ids
+
+    def drain(self):
+        """
+        Send one batch of pending rows.
+
+        :return: Number of rows sent.
+        """
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        result = SpoolResult(self, rows)
+        try:
+            self.client.send_message_batch([json.loads(message) for row_id, message in rows], result=result)
+        except Exception:
+            # rows of earlier requests are marked already; it is unknown whether the failed
+            # request was sent, so its rows and the ones after it go back to the queue
+            sent = set(result.sequence_numbers)
+            self._update([(PENDING, None, row_id) for seq, (row_id, message) in enumerate(rows, 1)
+                          if seq not in sent])
+            raise
+        return len(rows)
+
+    def recover(self, timeout=None):
+        """
+        Return rows left in flight by a drainer which stopped to the queue.
+
+        Another process draining the same file has its rows in flight while it sends them,
+        so without `timeout` only call this when no other process is draining.
+
+        :param timeout: Only return rows claimed more than this many seconds ago, which should be
+                        well above the time a batch takes to send. None for all rows in flight.
+        :return: Number of rows recovered.
+        """
+        now = time.time()
+        claimed = now - timeout if timeout is not None else now
+        with self.lock:
+            with self.connection:
+                return self.connection.execute(
+                    'UPDATE spool SET state = ?, updated = ? WHERE state = ? AND updated <= ?',
+                    (PENDING, now, IN_FLIGHT, claimed)).rowcount
+
+    def start(self):
+        """ Start the background drainer thread. """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._drain_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """ Stop the background drainer after its current batch. """
+        self.stopped.set()
+        if wait and self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        """ Stop the drainer and close the database. """
+        self.stop()
+        self.connection.close()
+
+    def stats(self):
+        """ Get the number of rows pending, in flight, done, done with errors of some recipients, and failed. """
+        with self.lock:
+            counts = dict(self.connection.execute('SELECT state, COUNT(*) FROM spool GROUP BY state'))
+            partial, = self.connection.execute('SELECT COUNT(*) FROM spool WHERE state = ? AND errors IS NOT NULL',
+                                               (DONE,)).fetchone()
+        return dict(pending=counts.get(PENDING, 0), in_flight=counts.get(IN_FLIGHT, 0),
+                    done=counts.get(DONE, 0), partial=partial, failed=counts.get(FAILED, 0))
+
+    def failures(self):
+        """ Get the rows none of whose recipients were accepted as a list of (id, message, errors). """
+        return self._with_errors(FAILED)
+
+    def partial_failures(self):
+        """
+        Get the rows sent to some of their recipients but not all as a list of (id, message, errors).
+
+        Each error has the ``uid`` of its recipient, its 0-based position in the message's
+        recipients, so only the failed recipients need to be sent again.
+        """
+        return self._with_errors(DONE)
+
+    def _with_errors(self, state):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT id, message, errors FROM spool WHERE state = ? AND errors IS NOT NULL ORDER BY id',
+                (state,)).fetchall()
+        return [(row_id, json.loads(message), json.loads(errors)) for row_id, message, errors in rows]
+
+    def _drain_forever(self):
+        while not self.stopped.is_set():
+            try:
+                sent = self.drain()
+            except Exception:
+                log.exception('sending spooled messages failed')
+                sent = 0
+            if not sent:
+                self.stopped.wait(self.interval)
+
+    def _claim(self):
+        """
+        Mark the oldest pending rows in flight and return them as (id, message).
+
+        Another drainer may select the same rows before this one marks them, so a row is only
+        claimed if it is still pending when it is marked.
+        """
+        claimed = []
+        with self.lock:
+            with self.connection:
+                rows = self.connection.execute('SELECT id, message FROM spool WHERE state = ? ORDER BY id LIMIT ?',
+                                               (PENDING, self.batch_size)).fetchall()
+                now = time.time()
+                for row_id, message in rows:
+                    if self.connection.execute('UPDATE spool SET state = ?, updated = ? WHERE id = ? AND state = ?',
+                                               (IN_FLIGHT, now, row_id, PENDING)).rowcount == 1:
+                        claimed.append((row_id, message))
+        return claimed
+
+    def _update(self, updates):
+        """ Apply (state, errors, id) updates, deleting done rows unless they are kept. """
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                if self.keep_done:
+                    done = []
+                else:
+                    # done rows with errors of some recipients are kept for partial_failures
+                    done = [(row_id,) for state, errors, row_id in updates if state == DONE and errors is None]
+                    updates = [u for u in updates if u[0] != DONE or u[1] is not None]
+                self.connection.executemany('UPDATE spool SET state = ?, errors = ?, updated = ? WHERE id = ?',
+                                            [(state, errors, now, row_id) for state, errors, row_id in updates])
+                self.connection.executemany('DELETE FROM spool WHERE id = ?', done)
+
+    def _dumps(self, message):
+        scheduled = message.get('scheduled')
+        if isinstance(scheduled, datetime):
+            scheduled = scheduled.strftime('%Y-%m-%dT%H:%M:%SZ')
+        return json.dumps(dict(recipients=list(message['recipients']), content=message['content'],
+                               scheduled=scheduled, report=message.get('report')))
+
+
+class SpoolResult(BatchResult):
+    """
+    BatchResult of a drain, marking the rows of each request done or failed as soon as
+    its response is added, so a later request which raises doesn't send them again.
+
+    A row is failed if every recipient has an error, or an error names no recipient,
+    and otherwise done, with the errors of its recipients.
+    """
+
+    def __init__(self, spool, rows):
+        """
+        :param spool: The Spool.
+        :param rows: The (id, message) rows being sent, in sequence number order.
+        """
+        super(SpoolResult, self).__init__()
+        self.spool = spool
+        self.rows = rows
+
+    def add(self, response, sequence_numbers):
+        super(SpoolResult, self).add(response, sequence_numbers)
+        updates = []
+        for seq in sequence_numbers:
+            row_id, message = self.rows[seq - 1]
+            errors = self.errors_for(seq)
+            if not errors:
+                updates.append((DONE, None, row_id))
+                continue
+            uids = set(e.uid for e in errors)
+            failed = None in uids or len(uids) >= len(json.loads(message)['recipients'])
+            updates.append((FAILED if failed else DONE, json.dumps([e._asdict() for e in errors]), row_id))
+        self.spool._update(updates)
@@ -0,0 +1,147 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Personalised messages rendered from rows of a CSV file or any iterable, see MMSoapClient.send_templated.
+"""
+
+import csv
+from string import Template
+
+from .exceptions import InvalidRecipientException, RecipientBlockedException
+
+# rows rendered before the messages grouped so far are sent
+WINDOW = 10000
+
+# recipients of a single message
+MAX_RECIPIENTS = 1000
+
+TRUE_VALUES = frozenset(['1', 'true', 'yes', 'y'])
+
+
+def read_csv(source, encoding='utf-8', **kwargs):
+    """
+    Read the rows of a CSV file with a header line.
+
+    :param source: Path or file object of the file.
+    :param encoding: Encoding of the file.
+    :param kwargs: Passed to csv.DictReader, e.g. delimiter.
+    :return: Generator of dicts of column name to unicode value.
+    """
+    if isinstance(source, basestring):
+        with open(source, 'rb') as f:
+            for row in read_csv(f, encoding, **kwargs):
+                yield row
+        return
+
+    for row in csv.DictReader(source, **kwargs):
+        yield dict((key, value.decode(encoding) if isinstance(value, str) else value)
+                   for key, value in row.iteritems())
+
+
+def render(template, row):
+    """
+    Render the content of one row.
+
+    :param template: A callable taking the row, a string.Template, or a format string, e.g. 'Hi {name}'.
+    :param row: dict of the row's values.
+    """
+    if callable(template):
+        return template(row)
+    if isinstance(template, Template):
+        return template.substitute(row)
+    return template.format(**row)
+
+
+def flag(value):
+    """ Convert a report flag, possibly text from a CSV file, to a bool. """
+    if isinstance(value, basestring):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
+
+
+def group_messages(rows, template, result, recipient_field='recipient', scheduled=None, report=None,
+                   window=WINDOW, max_recipients=MAX_RECIPIENTS, prepare=None):
+    """
+    Render rows and group recipients whose messages are identical into one message.
+
+    Recipients are grouped when their rendered content, schedule and report flag are
+    the same. At most `window` rows are held at a time, so memory use doesn't depend
+    on the number of rows, but identical messages more than `window` rows apart may
+    be sent as separate messages.
+
+    :param rows: Iterable of dicts, one per recipient.
+    :param template: See render.
+    :param result: TemplatedResult counting the rows, messages and skipped rows.
+    :param recipient_field: Key of the recipient number in each row.
+    :param scheduled: Default scheduled date/time, overridden by a ``scheduled`` value of a row.
+    :param report: Default delivery report flag, overridden by a ``report`` value of a row.
+    :param window: Maximum number of rows held before their messages are emitted.
+    :param max_recipients: Maximum number of recipients per message.
+    :param prepare: Called with the recipients of each message, returning (recipients, positions)
+                    like MMSoapClient.prepare_recipients. Defaults to sending them unchanged.
+    :return: Generator of dicts of create_message arguments. Each recipient's uid is the
+             0-based number of its row.
+    """
+    groups = {}
+    held = 0
+
+    for number, row in enumerate(rows):
+        result.rows += 1
+        key = (render(template, row),
+               row.get('scheduled') or scheduled,
+               flag(row['report']) if row.get('report') not in (None, '') else flag(report))
+        recipients, uids = groups.setdefault(key, ([], []))
+        recipients.append(row[recipient_field])
+        uids.append(number)
+        held += 1
+
+        if len(recipients) >= max_recipients:
+            del groups[key]
+            held -= len(recipients)
+            for message in _messages(key, recipients, uids, result, prepare):
+                yield message
+
+        if held >= window:
+            for message in _flush(groups, result, prepare):
+                yield message
+            held = 0
+
+    for message in _flush(groups, result, prepare):
+        yield message
+
+
+def _flush(groups, result, prepare):
+    """ Emit the messages of every group held, in the order of their first rows. """
+    for key, (recipients, uids) in sorted(groups.items(), key=lambda item: item[1][1][0]):
+        for message in _messages(key, recipients, uids, result, prepare):
+            yield message
+    groups.clear()
+
+
+def _messages(key, recipients, uids, result, prepare):
+    content, scheduled, report = key
+    if prepare is not None:
+        count = len(recipients)
+        try:
+            recipients, positions = prepare(recipients)
+        except (InvalidRecipientException, RecipientBlockedException):
+            result.skipped += count
+            return
+        recipients = list(recipients)
+        if positions is not None:
+            uids = [uids[position] for position in positions]
+        result.skipped += count - len(recipients)
+
+    result.messages += 1
+    yield dict(recipients=recipients, uids=uids, content=content, scheduled=scheduled, report=report)
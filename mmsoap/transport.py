@@ -0,0 +1,276 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Keep-alive connection pool transport for suds.
+"""
+
+import base64
+import cookielib
+import errno
+import httplib
+import socket
+import threading
+import urllib
+import urllib2
+import urlparse
+from StringIO import StringIO
+
+from suds.transport import Reply, Transport, TransportError
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class PooledHttpTransport(Transport):
+    """
+    HTTP transport which keeps connections open and reuses them between requests.
+
+    Connections are pooled per scheme, host, port and proxy, and may be shared by
+    any number of clients and threads. Like ``WellBehavedHttpTransport``, proxies
+    are taken from the system configuration (the ``*_proxy`` environment variables
+    on Linux) and ``no_proxy`` is honoured. Cookies set by the server are kept in
+    ``cookiejar`` and sent back like suds' own HttpTransport does.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=10, read_timeout=60):
+        """
+        :param pool_size: Maximum number of idle connections kept per host. Requests are never
+                          blocked waiting for a connection; extra connections are closed after use.
+        :param connect_timeout: Seconds allowed to establish a connection.
+        :param read_timeout: Seconds allowed between bytes of a response.
+        """
+        Transport.__init__(self)
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.opened = 0
+        self.reused = 0
+        self.active = 0
+        self.cookiejar = cookielib.CookieJar()
+        self.__lock = threading.Lock()
+        self.__idle = {}
+
+    def open(self, request):
+        response, body = self.__read('GET', request)
+        return StringIO(body)
+
+    def send(self, request):
+        response, body = self.__read('POST', request)
+        if response.status in (202, 204):
+            return None
+        return Reply(200, dict(response.getheaders()), body)
+
+    def stream(self, request):
+        """
+        Send a SOAP request like ``send``, but return the reply unread.
+
+        :param request: A suds transport Request.
+        :return: File-like object with the reply body. Closing it returns the
+                 connection to the pool once the body has been read.
+        """
+        key, connection, response = self.__request('POST', request)
+        if response.status >= 300:
+            self.__read_error(key, connection, response)
+        return PooledResponse(self, key, connection, response)
+
+    def stats(self):
+        """
+        Get the pool counters.
+
+        :return: dict of connections currently open (in use or idle), idle, ever opened and reused.
+        """
+        self.__lock.acquire()
+        try:
+            idle = sum([len(connections) for connections in self.__idle.values()])
+            return dict(open=self.active + idle, idle=idle, opened=self.opened, reused=self.reused)
+        finally:
+            self.__lock.release()
+
+    def close(self):
+        """ Close all idle connections. """
+        self.__lock.acquire()
+        try:
+            idle, self.__idle = self.__idle, {}
+        finally:
+            self.__lock.release()
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def release(self, key, connection, response):
+        """ Return a connection whose response has been read to the pool, or close it. """
+        self.__lock.acquire()
+        try:
+            self.active -= 1
+            idle = self.__idle.setdefault(key, [])
+            if not response.will_close and len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        finally:
+            self.__lock.release()
+        connection.close()
+
+    def discard(self, connection):
+        """ Close a connection which can't be reused. """
+        self.__lock.acquire()
+        try:
+            self.active -= 1
+        finally:
+            self.__lock.release()
+        connection.close()
+
+    def __read(self, method, request):
+        key, connection, response = self.__request(method, request)
+        if response.status >= 300:
+            self.__read_error(key, connection, response)
+        try:
+            body = response.read()
+        except:
+            self.discard(connection)
+            raise
+        self.release(key, connection, response)
+        return response, body
+
+    def __read_error(self, key, connection, response):
+        body = response.read()
+        self.release(key, connection, response)
+        raise TransportError(response.reason, response.status, StringIO(body))
+
+    def __request(self, method, request):
+        """
+        Send a request on a pooled connection, retrying once on a fresh connection if a
+        reused one turns out to have been closed by the server before it answered.
+
+        :return: (pool key, connection, response)
+        """
+        key, path, tunnel, proxy_headers = self.__route(request.url)
+        cookies = urllib2.Request(request.url)
+        self.cookiejar.add_cookie_header(cookies)
+        headers = dict(request.headers or {}, **proxy_headers)
+        headers.update(cookies.unredirected_hdrs)
+        while True:
+            connection, reused = self.__acquire(key, tunnel)
+            try:
+                connection.request(method, path, request.message, headers)
+                response = connection.getresponse()
+                self.cookiejar.extract_cookies(CookieResponse(response), cookies)
+                return key, connection, response
+            except (httplib.BadStatusLine, socket.error) as e:
+                self.discard(connection)
+                if not reused or (isinstance(e, socket.error) and e.errno not in (errno.ECONNRESET, errno.EPIPE)):
+                    raise
+            except:
+                self.discard(connection)
+                raise
+
+    def __acquire(self, key, tunnel):
+        """ Take an idle connection for `key`, or open a new one. """
+        self.__lock.acquire()
+        try:
+            self.active += 1
+            idle = self.__idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop(), True
+            self.opened += 1
+        finally:
+            self.__lock.release()
+
+        scheme, host, port, proxy = key
+        if proxy is None:
+            connect_host, connect_port = host, port
+        else:
+            connect_host, connect_port = proxy[:2]
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(connect_host, connect_port, timeout=self.connect_timeout)
+        else:
+            connection = httplib.HTTPConnection(connect_host, connect_port, timeout=self.connect_timeout)
+        if tunnel is not None:
+            set_tunnel = getattr(connection, 'set_tunnel', None) or connection._set_tunnel
+            set_tunnel(*tunnel)
+        try:
+            connection.connect()
+            connection.sock.settimeout(self.read_timeout)
+        except:
+            self.discard(connection)
+            raise
+        return connection, False
+
+    def __route(self, url):
+        """
+        Work out where to connect to for `url`.
+
+        :return: (pool key, request path, tunnel arguments or None, extra request headers)
+        """
+        parts = urlparse.urlsplit(url)
+        scheme, host = parts.scheme, parts.hostname
+        port = parts.port or DEFAULT_PORTS[scheme]
+        path = urlparse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        proxy_url = None
+        if not urllib.proxy_bypass(host):
+            proxy_url = urllib.getproxies().get(scheme)
+        if not proxy_url:
+            return (scheme, host, port, None), path, None, {}
+
+        proxy = urlparse.urlsplit(proxy_url)
+        proxy_headers = {}
+        if proxy.username:
+            credentials = '%s:%s' % (urllib.unquote(proxy.username), urllib.unquote(proxy.password or ''))
+            proxy_headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials)
+        key = (scheme, host, port, (proxy.hostname, proxy.port or DEFAULT_PORTS[proxy.scheme or 'http'],
+                                    tuple(sorted(proxy_headers.items()))))
+        if scheme == 'https':
+            return key, path, (host, port, proxy_headers), {}
+        # plain http goes through the proxy with an absolute url
+        return key, url, None, proxy_headers
+
+
+class CookieResponse(object):
+    """
+    The view of an httplib response ``CookieJar.extract_cookies`` expects.
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    def info(self):
+        return self.response.msg
+
+
+class PooledResponse(object):
+    """
+    File-like reply of ``PooledHttpTransport.stream``.
+    """
+
+    def __init__(self, transport, key, connection, response):
+        self.transport = transport
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.closed = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.response.read()
+        return self.response.read(size)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.response.isclosed():
+            self.transport.release(self.key, self.connection, self.response)
+        else:
+            # unread data left on the connection, it can't be reused
+            self.transport.discard(self.connection)
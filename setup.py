@@ -6,6 +6,16 @@ from setuptools import find_packages, setup
 setup(
     name='MMSoap',
     packages=find_packages(),
+    package_data={
+        'mmsoap': ['simulator.wsdl'],
+    },
+    entry_points={
+        'console_scripts': [
+            'mmsoap-snapshot = mmsoap.snapshot:main',
+            'mmsoap-benchmark = mmsoap.benchmark:main',
+            'mmsoap-simulator = mmsoap.simulator:main',
+        ],
+    },
     url='https://github.com/messagemedia/messagemedia-python',
     license='Apache',
     description='This library provides a simple interface for sending and receiving messages using the MessageMedia SOAP API.',
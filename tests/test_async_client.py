@@ -0,0 +1,90 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import unittest
+
+from mmsoap import pool
+from mmsoap.async_client import OPERATIONS, AsyncMMSoapClient
+from mmsoap.executor import TimeoutError, WorkerPool
+from mmsoap.simulator import SimulatorServer
+
+
+class AsyncClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_mirrors_every_operation(self):
+        self.assertEqual(set(OPERATIONS), pool.OPERATIONS)
+        for name in OPERATIONS:
+            self.assertTrue(callable(getattr(AsyncMMSoapClient, name)))
+
+    def test_credentials_are_taken_at_submit_time(self):
+        with AsyncMMSoapClient('async-first', 'x', max_concurrency=1, wsdl_url=self.server.wsdl_url) as client:
+            client.warmup()
+            started, release = threading.Event(), threading.Event()
+
+            def busy():
+                started.set()
+                release.wait(10)
+            client.pool.submit(busy)
+            started.wait(10)
+
+            future = client.check_user()
+            client.set_userId('async-second')
+            release.set()
+            future.result(10)
+            self.assertTrue('async-first' in self.server.respond.state)
+            self.assertFalse('async-second' in self.server.respond.state)
+
+            client.check_user().result(10)
+            self.assertTrue('async-second' in self.server.respond.state)
+
+    def test_iter_replies(self):
+        self.server.respond.queue('async-replies', replies=2)
+        with AsyncMMSoapClient('async-replies', 'x', wsdl_url=self.server.wsdl_url) as client:
+            records = list(client.iter_replies().result(10))
+        self.assertEqual(len(records), 2)
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_timeout(self):
+        pool = WorkerPool(1)
+        release = threading.Event()
+        future = pool.submit(release.wait, 10)
+        self.assertRaises(TimeoutError, future.result, 0.01)
+        self.assertRaises(TimeoutError, future.exception, 0.01)
+        release.set()
+        self.assertEqual(future.result(10), True)
+        self.assertEqual(future.exception(), None)
+        pool.shutdown()
+
+    def test_exceptions_are_raised_by_result(self):
+        pool = WorkerPool(2)
+        futures = pool.map(lambda n: 1 / n, [1, 0])
+        self.assertEqual(futures[0].result(10), 1)
+        self.assertTrue(isinstance(futures[1].exception(10), ZeroDivisionError))
+        self.assertRaises(ZeroDivisionError, futures[1].result)
+        pool.shutdown()
+        self.assertRaises(RuntimeError, pool.submit, len, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+
+from mmsoap.client import MMSoapClient
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+def messages(count, content='Hello', recipients=1):
+    return [dict(recipients=['+614%04d%04d' % (i, r) for r in range(recipients)], content=content)
+            for i in range(count)]
+
+
+class SendMessageBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SimulatorServer(Simulator()).start()
+        self.client = MMSoapClient('batch', 'x', wsdl_url=self.server.wsdl_url)
+        self.client.load()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def requests(self):
+        return self.server.respond.stats()['requests']
+
+    def test_one_request_within_the_limits(self):
+        result = self.client.send_message_batch(messages(50, recipients=2))
+        self.assertEqual((result.requests, result.sent, result.failed), (1, 100, 0))
+        self.assertEqual(result.sequence_numbers, range(1, 51))
+        self.assertEqual(self.requests(), 1)
+
+    def test_chunked_by_count(self):
+        result = self.client.send_message_batch(messages(25), max_messages=10)
+        self.assertEqual((result.requests, result.sent), (3, 25))
+        self.assertEqual(self.requests(), 3)
+        self.assertEqual(result.sequence_numbers, range(1, 26))
+
+    def test_chunked_by_size(self):
+        content = 'x' * 500
+        size = self.client._message_size(messages(1, content)[0])
+        chunks = list(self.client._chunk_messages(messages(10, content), 1000, 3 * size))
+        self.assertEqual([[seq for seq, message in chunk] for chunk in chunks],
+                         [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10]])
+
+        result = self.client.send_message_batch(messages(10, content), max_bytes=3 * size)
+        self.assertEqual((result.requests, result.sent), (4, 10))
+        self.assertEqual(self.requests(), 4)
+
+    def test_large_message_is_sent_alone(self):
+        batch = messages(3)
+        batch[1] = dict(recipients=['+61412345678'], content='x' * 5000)
+        chunks = list(self.client._chunk_messages(batch, 1000, 2000))
+        self.assertEqual([[seq for seq, message in chunk] for chunk in chunks], [[1], [2], [3]])
+
+    def test_errors_by_sequence_number(self):
+        batch = messages(5)
+        batch[3] = dict(recipients=['+61412345678', 'not a number'], content='Hello', uids=[7, 8])
+        result = self.client.send_message_batch(batch, max_messages=2)
+        self.assertEqual((result.requests, result.sent, result.failed), (3, 5, 1))
+        self.assertTrue(result.succeeded(1))
+        self.assertFalse(result.succeeded(4))
+        error = result.error_for(4, 8)
+        self.assertEqual((error.code, error.recipient), ('invalidRecipient', 'not a number'))
+        self.assertEqual(result.error_for(4, 7), None)
+        self.assertEqual(len(result.errors_for(4)), 1)
+
+    def test_generators_are_consumed_once(self):
+        batch = (dict(message, recipients=iter(message['recipients'])) for message in messages(5))
+        result = self.client.send_message_batch(batch, max_messages=2)
+        self.assertEqual((result.requests, result.sent), (3, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mmsoap.blocklist import BlockList
+from mmsoap.client import MMSoapClient
+from mmsoap.exceptions import RecipientBlockedException
+from mmsoap.records import BlockedNumberRecord
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class BlockedNumbersClient(object):
+    """ Returns a fixed list of blocked numbers after `delay` seconds, counting the calls. """
+
+    def __init__(self, numbers, delay=0):
+        self.numbers = numbers
+        self.delay = delay
+        self.calls = 0
+
+    def get_blocked_numbers(self, records=False):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [BlockedNumberRecord(uid, number) for uid, number in enumerate(self.numbers)]
+
+
+class ConcurrentClient(object):
+    """ Runs `during` in another thread while get_blocked_numbers is waiting for its response. """
+
+    def __init__(self, client, during):
+        self.client = client
+        self.during = during
+
+    def get_blocked_numbers(self, records=False):
+        numbers = self.client.get_blocked_numbers(records=records)
+        thread = threading.Thread(target=self.during)
+        thread.start()
+        thread.join()
+        return numbers
+
+
+class BlockListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'blocked.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_filter(self):
+        blocklist = BlockList()
+        blocklist.sync(BlockedNumbersClient(['+61412345679']))
+        self.assertEqual(blocklist.filter(['+61412345678', '+61412345679', '+61412345670']),
+                         (['+61412345678', '+61412345670'], [0, 2], 1))
+        self.assertEqual(blocklist.filter(['+61412345679', '+61412345670'], [5, 6]), (['+61412345670'], [6], 1))
+
+    def test_filter_unchanged(self):
+        blocklist = BlockList()
+        uids = [3, 4]
+        recipients, returned, blocked = blocklist.filter(iter(['+61412345678', '+61412345670']), uids)
+        self.assertEqual((recipients, blocked), (['+61412345678', '+61412345670'], 0))
+        self.assertTrue(returned is uids)
+
+    def test_refresh_when_stale(self):
+        client = BlockedNumbersClient(['+61412345679'])
+        blocklist = BlockList(refresh_interval=3600)
+        self.assertTrue(blocklist.stale())
+        blocklist.refresh(client)
+        blocklist.refresh(client)
+        self.assertEqual(client.calls, 1)
+        self.assertTrue('+61412345679' in blocklist)
+
+        blocklist.synced -= 3600
+        blocklist.refresh(client)
+        self.assertEqual(client.calls, 2)
+
+        never = BlockList(refresh_interval=None)
+        never.refresh(client)
+        never.synced = 0
+        self.assertFalse(never.stale())
+
+    def test_saved_and_loaded(self):
+        blocklist = BlockList(self.path)
+        blocklist.sync(BlockedNumbersClient(['+61412345679', '+61412345670']))
+        loaded = BlockList(self.path)
+        self.assertEqual(loaded.numbers, frozenset(['+61412345679', '+61412345670']))
+        self.assertEqual(loaded.synced, blocklist.synced)
+        self.assertFalse(loaded.stale())
+        self.assertEqual(os.listdir(self.directory), ['blocked.json'])
+
+
+class ClientBlockListTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer(Simulator()).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_block_and_unblock_update_the_list(self):
+        blocklist = BlockList()
+        client = MMSoapClient('blocklist', 'x', wsdl_url=self.server.wsdl_url, blocklist=blocklist)
+        client.block_numbers(['+61412345679', '+61412345670'])
+        self.assertEqual(blocklist.numbers, frozenset(['+61412345679', '+61412345670']))
+
+        self.assertRaises(RecipientBlockedException, client.send_messages, ['+61412345679'], 'Hello')
+        response = client.send_messages(['+61412345678', '+61412345679'], 'Hello')
+        self.assertEqual(response._sent, 1)
+
+        client.unblock_numbers(['+61412345670'])
+        self.assertEqual(blocklist.numbers, frozenset(['+61412345679']))
+        blocklist.sync(client)
+        self.assertEqual(blocklist.numbers, frozenset(['+61412345679']))
+
+    def test_changes_during_a_fetch_are_kept(self):
+        blocklist = BlockList()
+        client = MMSoapClient('blocklist-sync', 'x', wsdl_url=self.server.wsdl_url, blocklist=blocklist)
+        client.block_numbers(['+61412345679'])
+
+        blocklist.sync(ConcurrentClient(client, lambda: client.block_numbers(['+61412345670'])))
+        self.assertEqual(blocklist.numbers, frozenset(['+61412345679', '+61412345670']))
+        blocklist.sync(ConcurrentClient(client, lambda: client.unblock_numbers(['+61412345679'])))
+        self.assertEqual(blocklist.numbers, frozenset(['+61412345670']))
+
+    def test_one_fetch_at_a_time(self):
+        blocklist = BlockList()
+        client = BlockedNumbersClient(['+61412345679'], delay=0.05)
+        threads = [threading.Thread(target=blocklist.refresh, args=(client,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(client.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
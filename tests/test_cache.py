@@ -0,0 +1,238 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from mmsoap.cache import ExtendedObjectCache, FileLock, MemoryCache, SqliteObjectCache
+from mmsoap.client import MMSoapClient
+from mmsoap.simulator import SimulatorServer
+
+
+class MemoryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp(prefix='mmsoap-test-')
+        self.backend = ExtendedObjectCache(self.location, days=1)
+        self.cache = MemoryCache(self.backend, maxsize=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_hit(self):
+        self.cache.put('a', dict(value=1))
+        self.assertEqual(self.cache.get('a'), dict(value=1))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+    def test_miss_goes_to_backend(self):
+        self.backend.put('a', [1, 2])
+        self.assertEqual(self.cache.get('a'), [1, 2])
+        self.assertEqual(self.cache.get('a'), [1, 2])
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.get('missing'), None)
+
+    def test_every_hit_returns_a_new_object(self):
+        self.cache.put('a', dict(items=[1]))
+        first = self.cache.get('a')
+        first['items'].append(2)
+        second = self.cache.get('a')
+        self.assertEqual(second, dict(items=[1]))
+        self.assertFalse(first is second)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        hits = self.cache.stats()['hits']
+        self.cache.get('a')
+        self.assertEqual(self.cache.stats()['hits'], hits + 1)
+        self.assertEqual(self.cache.get('b'), 2)    # from the backend
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_purge(self):
+        self.cache.put('a', 1)
+        self.cache.purge('a')
+        self.assertEqual(self.cache.get('a'), None)
+
+
+
+class FileLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp(prefix='mmsoap-test-')
+        self.path = os.path.join(self.location, 'lock')
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_exclusive(self):
+        first, second = FileLock(self.path), FileLock(self.path)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire(blocking=False))
+        started = time.time()
+        self.assertFalse(second.acquire(timeout=0.1))
+        self.assertTrue(time.time() - started >= 0.1)
+        first.release()
+        self.assertTrue(second.acquire(blocking=False))
+        second.release()
+        second.release()
+
+    def test_unusable_location_always_grants(self):
+        lock = FileLock(os.path.join(self.location, 'missing', 'lock'))
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
+
+
+class ExtendedObjectCacheTest(unittest.TestCase):
+    """ Two caches on one location stand in for two processes. """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp(prefix='mmsoap-test-')
+        self.first = ExtendedObjectCache(self.location, days=1)
+        self.second = ExtendedObjectCache(self.location, days=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def get_in_thread(self, cache, id):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(cache.get(id)))
+        thread.start()
+        return thread, results
+
+    def test_one_fetch_at_a_time(self):
+        self.assertEqual(self.first.get('wsdl'), None)     # the first caller fetches
+        thread, results = self.get_in_thread(self.second, 'wsdl')
+        thread.join(0.3)
+        self.assertTrue(thread.is_alive())                  # the other waits for it
+
+        self.first.put('wsdl', dict(parsed=True))
+        thread.join(10)
+        self.assertEqual(results, [dict(parsed=True)])
+
+    def test_expired_entry_is_served_while_refreshed(self):
+        self.first.put('wsdl', 'old')
+        self.first.expired = self.second.expired = lambda created: True
+        self.assertEqual(self.first.get('wsdl'), None)      # the first caller refreshes
+        self.assertEqual(self.second.get('wsdl'), 'old')    # the other keeps the expired copy
+        self.first.put('wsdl', 'new')
+        self.assertEqual(self.second.get('wsdl'), None)     # refreshed by the second now
+        self.second.put('wsdl', 'newer')
+        del self.first.expired, self.second.expired
+        self.assertEqual(self.first.get('wsdl'), 'newer')
+
+    def test_abandoned_fetch_is_taken_over(self):
+        self.first.lock_timeout = self.second.lock_timeout = 0.1
+        self.assertEqual(self.first.get('wsdl'), None)
+        self.assertEqual(self.second.get('wsdl'), None)     # fetched here too after the timeout
+        self.second.put('wsdl', 'value')
+        self.assertEqual(self.first.get('wsdl'), 'value')
+
+    def test_writes_are_atomic(self):
+        self.first.put('wsdl', 'value')
+        self.assertEqual([name for name in os.listdir(self.location) if name.startswith('.')], [])
+
+
+
+class SqliteObjectCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp(prefix='mmsoap-test-')
+        self.cache = SqliteObjectCache(self.location, days=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def execute(self, sql, *parameters):
+        connection = sqlite3.connect(self.cache.path)
+        with connection:
+            connection.execute(sql, parameters)
+        connection.close()
+
+    def test_put_and_get(self):
+        self.assertEqual(self.cache.path, os.path.join(self.location, 'suds.sqlite'))
+        self.assertEqual(self.cache.get('wsdl'), None)
+        self.cache.put('wsdl', dict(items=[1]))
+        first = self.cache.get('wsdl')
+        first['items'].append(2)
+        self.assertEqual(self.cache.get('wsdl'), dict(items=[1]))
+        # shared with other processes through the file
+        self.assertEqual(SqliteObjectCache(self.cache.path).get('wsdl'), dict(items=[1]))
+
+        self.cache.purge('wsdl')
+        self.assertEqual(self.cache.get('wsdl'), None)
+
+    def test_expired_and_other_versions_are_ignored(self):
+        for id in ('fresh', 'old', 'other'):
+            self.cache.put(id, id)
+        self.execute("UPDATE entries SET created = created - 2 * 86400 WHERE id = 'old'")
+        self.execute("UPDATE entries SET version = 'other' WHERE id = 'other'")
+        self.assertEqual([self.cache.get(id) for id in ('fresh', 'old', 'other')], ['fresh', None, None])
+        self.assertEqual(self.cache.expire(), 2)
+        self.assertEqual(self.cache.stamp('old'), None)
+        self.assertEqual(self.cache.get('fresh'), 'fresh')
+
+    def test_evicts_least_recently_used(self):
+        for i, id in enumerate(('a', 'b', 'c')):
+            self.cache.put(id, 'x' * 1000)
+            self.execute('UPDATE entries SET accessed = ? WHERE id = ?', i, id)
+        size = self.cache.stamp('a')[1]
+        self.execute("UPDATE entries SET accessed = 10 WHERE id = 'a'")
+        self.assertEqual(self.cache.evict(2 * size), 1)
+        self.assertEqual([self.cache.get(id) is not None for id in ('a', 'b', 'c')], [True, False, True])
+
+    def test_unreadable_entries_are_purged(self):
+        self.cache.put('wsdl', 1)
+        self.execute("UPDATE entries SET data = X'00' WHERE id = 'wsdl'")
+        self.assertEqual(self.cache.get('wsdl'), None)
+        self.assertEqual(self.cache.stamp('wsdl'), None)
+
+    def test_readonly(self):
+        missing = SqliteObjectCache(os.path.join(self.location, 'missing.sqlite'), readonly=True)
+        self.assertEqual(missing.get('wsdl'), None)
+        missing.put('wsdl', 1)
+        self.assertFalse(os.path.exists(missing.path))
+
+        self.cache.put('wsdl', 1)
+        readonly = SqliteObjectCache(self.cache.path, readonly=True)
+        self.assertEqual(readonly.get('wsdl'), 1)
+        readonly.clear()
+        self.assertEqual(self.cache.get('wsdl'), 1)
+
+    def test_client_backend(self):
+        server = SimulatorServer().start()
+        try:
+            client = MMSoapClient('sqlite', 'x', wsdl_url=server.wsdl_url, cache_location=self.location,
+                                  cache_backend='sqlite')
+            client.check_user()
+        finally:
+            server.stop()
+        connection = sqlite3.connect(self.cache.path)
+        try:
+            self.assertTrue(connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0] > 0)
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
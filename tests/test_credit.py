@@ -0,0 +1,124 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+import unittest
+
+from mmsoap.client import MMSoapClient
+from mmsoap.credit import CreditLedger
+from mmsoap.exceptions import InsufficientCreditException
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class AccountDetails(object):
+
+    def __init__(self, remaining, limit=100, type='daily'):
+        self._creditRemaining = remaining
+        self._creditLimit = limit
+        self._type = type
+
+
+class CreditLedgerTest(unittest.TestCase):
+
+    def test_unknown_balance_holds_nothing_back(self):
+        ledger = CreditLedger()
+        self.assertEqual(ledger.available, None)
+        ledger.reserve(10 ** 6)
+        self.assertEqual(ledger.reserved, 10 ** 6)
+
+    def test_reserve_and_settle(self):
+        ledger = CreditLedger()
+        ledger.update(AccountDetails('10'))
+        self.assertEqual((ledger.type, ledger.limit, ledger.remaining), ('daily', 100, 10))
+        ledger.reserve(6)
+        self.assertEqual(ledger.available, 4)
+        self.assertRaises(InsufficientCreditException, ledger.reserve, 5)
+        ledger.settle(6, AccountDetails(4))
+        self.assertEqual((ledger.reserved, ledger.available), (0, 4))
+
+    def test_late_responses_are_ignored(self):
+        ledger = CreditLedger()
+        ledger.update(AccountDetails(100))
+        first, second = ledger.reserve(5), ledger.reserve(5)
+        ledger.settle(5, AccountDetails(90), second)
+        ledger.settle(5, AccountDetails(95), first)
+        self.assertEqual((ledger.reserved, ledger.remaining), (0, 90))
+
+        ticket = ledger.ticket()
+        ledger.settle(0, AccountDetails(80), ledger.reserve(0))
+        ledger.update(AccountDetails(85), ticket)
+        self.assertEqual(ledger.remaining, 80)
+        ledger.update(AccountDetails(1000))
+        self.assertEqual(ledger.remaining, 1000)
+
+    def test_failed_request_keeps_balance(self):
+        ledger = CreditLedger()
+        ledger.update(AccountDetails(10))
+        ledger.reserve(6)
+        ledger.settle(6)
+        self.assertEqual(ledger.available, 10)
+
+    def test_wait_for_settle(self):
+        ledger = CreditLedger(wait=True, timeout=5)
+        ledger.update(AccountDetails(10))
+        ledger.reserve(8)
+        threading.Timer(0.05, ledger.settle, (8, AccountDetails(10))).start()
+        ledger.reserve(5)
+        self.assertEqual(ledger.available, 5)
+
+    def test_wait_times_out(self):
+        ledger = CreditLedger(wait=True, timeout=0.05)
+        ledger.update(AccountDetails(10))
+        ledger.reserve(8)
+        started = time.time()
+        self.assertRaises(InsufficientCreditException, ledger.reserve, 5)
+        self.assertTrue(time.time() - started >= 0.05)
+
+    def test_never_waits_beyond_limit(self):
+        ledger = CreditLedger(wait=True)
+        ledger.update(AccountDetails(10, limit=100))
+        self.assertRaises(InsufficientCreditException, ledger.reserve, 101)
+
+    def test_wait_overridden_per_call(self):
+        ledger = CreditLedger(wait=True)
+        ledger.update(AccountDetails(1))
+        self.assertRaises(InsufficientCreditException, ledger.reserve, 2, wait=False)
+
+
+class ClientCreditTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer(Simulator(credit_limit=3)).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_sends_track_the_balance(self):
+        ledger = CreditLedger()
+        client = MMSoapClient('credit', 'x', wsdl_url=self.server.wsdl_url, credit=ledger)
+        ledger.resync(client)
+        self.assertEqual((ledger.limit, ledger.remaining), (3, 3))
+
+        client.send_messages(['+61412345678', '+61412345679'], 'Hello')
+        self.assertEqual((ledger.remaining, ledger.reserved), (1, 0))
+        requests = self.server.respond.stats()['requests']
+        self.assertRaises(InsufficientCreditException, client.send_messages, ['+61412345678', '+61412345679'],
+                          'Hello')
+        self.assertEqual(self.server.respond.stats()['requests'], requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import unittest
+
+from suds import WebFault
+
+from mmsoap.client import MMSoapClient
+from mmsoap.decoder import NativeDecoder, Result
+from mmsoap.exceptions import InvalidRecipientException
+from mmsoap.simulator import Simulator, SimulatorServer
+
+SOAP11 = ('<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+          '<soapenv:Body>%s</soapenv:Body></soapenv:Envelope>')
+
+SEND_MESSAGES_REPLY = (
+    '<sendMessagesResponse xmlns="http://xml.m4u.com.au/2009">'
+    '<result sent="1" scheduled="0" failed="2">'
+    '<accountDetails type="daily" creditLimit="5000" creditRemaining="2500"/>'
+    '<errors><error code="invalidRecipient" sequenceNumber="1">'
+    '<recipients><recipient uid="1">abc</recipient><recipient uid="2">def</recipient></recipients>'
+    '</error></errors></result></sendMessagesResponse>')
+
+
+class PublishedShapes(dict):
+    """ Shapes dict counting the Shapes which had no attributes nor children when published. """
+
+    partial = 0
+
+    def __setitem__(self, key, shape):
+        self.partial += not (shape.attributes or shape.children)
+        dict.__setitem__(self, key, shape)
+
+    def update(self, shapes):
+        for key, shape in shapes.items():
+            self[key] = shape
+
+
+class ResultTest(unittest.TestCase):
+
+    def setUp(self):
+        self.result = Result()
+        for name, value in (('_code', 'other'), ('recipients', ['+61412345678'])):
+            self.result.__dict__[name] = value
+            self.result.__keylist__.append(name)
+
+    def test_index_by_name(self):
+        self.assertEqual(self.result['_code'], 'other')
+        self.assertTrue('recipients' in self.result)
+        self.assertFalse('errors' in self.result)
+
+    def test_index_by_position(self):
+        self.assertEqual(self.result[0], 'other')
+        self.assertEqual(self.result[1], ['+61412345678'])
+        self.assertEqual(self.result[-1], ['+61412345678'])
+        self.assertEqual(self.result[:2], ['other', ['+61412345678']])
+        self.assertRaises(IndexError, lambda: self.result[2])
+
+    def test_iterate(self):
+        self.assertEqual(list(self.result), [('_code', 'other'), ('recipients', ['+61412345678'])])
+        self.assertEqual(len(self.result), 2)
+
+
+class NativeDecoderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer(Simulator(accounts={'user': 'secret'})).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def client(self, password='secret', **kwargs):
+        return MMSoapClient('user', password, wsdl_url=self.server.wsdl_url, **kwargs)
+
+    def test_decodes_soap12_replies_natively(self):
+        client = self.client(native_decoder=True)
+        details = client.check_user()
+        self.assertTrue(isinstance(details, Result))
+        self.assertEqual(details._creditLimit, 1000000)
+        self.assertEqual(details._type, 'daily')
+
+    def test_decodes_soap11_replies_like_suds(self):
+        client = self.client(native_decoder=True)
+        client.load()
+        method = client.client.service.sendMessages.method
+        reply = SOAP11 % SEND_MESSAGES_REPLY
+
+        native = client.decoder.decode(client.client, method, reply)
+        expected = method.binding.output.get_reply(method, reply)[1]
+
+        self.assertTrue(isinstance(native, Result))
+        self.assertEqual((native._sent, native._failed), (expected._sent, expected._failed))
+        self.assertEqual(native.accountDetails._creditRemaining, expected.accountDetails._creditRemaining)
+        self.assertEqual(native.errors[0][0]._code, expected.errors[0][0]._code)
+        self.assertEqual([r.value for r in native.errors[0][0].recipients.recipient],
+                         [r.value for r in expected.errors[0][0].recipients.recipient])
+        self.assertEqual([r._uid for r in native.errors[0][0].recipients.recipient], [1, 2])
+
+    def test_shapes_are_published_complete(self):
+        client = self.client(native_decoder=True)
+        client.load()
+        method = client.client.service.sendMessages.method
+        reply = SOAP11 % SEND_MESSAGES_REPLY
+        shapes = PublishedShapes()
+        decoder = NativeDecoder(client.model)
+        decoder.shapes = shapes
+        results = []
+
+        def decode():
+            results.append(decoder.decode(client.client, method, reply).errors[0][0].recipients.recipient[1]._uid)
+
+        threads = [threading.Thread(target=decode) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [2] * 8)
+        self.assertTrue(shapes)
+        self.assertEqual(shapes.partial, 0)
+
+    def test_error_reply_raises_through_native_decoder(self):
+        client = self.client(native_decoder=True)
+        self.assertRaises(InvalidRecipientException, client.send_messages, ['not a number'], 'Hello')
+
+    def test_error_reply_raises_like_suds(self):
+        client = self.client()
+        self.assertRaises(InvalidRecipientException, client.send_messages, ['not a number'], 'Hello')
+
+    def test_check_replies(self):
+        self.server.respond.queue('user', replies=3)
+        suds_replies = self.client().check_replies()
+        native_replies = self.client(native_decoder=True).check_replies()
+        self.assertEqual(len(native_replies), len(suds_replies))
+        self.assertEqual([r._receiptId for r in native_replies], [r._receiptId for r in suds_replies])
+        self.assertEqual([r.received for r in native_replies], [r.received for r in suds_replies])
+
+    def test_fault(self):
+        client = self.client('wrong', native_decoder=True)
+        self.assertRaises(WebFault, client.check_user)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import unittest
+
+from mmsoap.client import MMSoapClient
+from mmsoap.dispatch import Dispatcher, TokenBucket
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(100, capacity=5)
+        started = time.time()
+        bucket.take(5)
+        self.assertTrue(time.time() - started < 0.05)
+        bucket.take(5)
+        self.assertTrue(time.time() - started >= 0.04)
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = Simulator()
+        self.server = SimulatorServer(self.simulator).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def dispatcher(self, **kwargs):
+        return Dispatcher(lambda: MMSoapClient('dispatch', 'x', wsdl_url=self.server.wsdl_url, **kwargs),
+                          workers=2)
+
+    def test_counts_accepted_and_rejected_recipients(self):
+        messages = [dict(recipients=['+61412345678', 'not a number', '+61412345679'], content='Hello'),
+                    dict(recipients=['+61412345670'], content='Hello'),
+                    dict(recipients=['bad'], content='Hello')]
+        summary = self.dispatcher().run(messages)
+        self.assertEqual(summary.sent, 3)
+        self.assertEqual(summary.failed, 2)
+        self.assertEqual(summary.requests, 3)
+        self.assertEqual(summary.errors, 0)
+
+    def test_failed_requests(self):
+        self.simulator.fault_rate = 1.0
+        summary = self.dispatcher().run([dict(recipients=['+61412345678', '+61412345679'], content='Hello')])
+        self.assertEqual(summary.sent, 0)
+        self.assertEqual(summary.failed, 2)
+        self.assertEqual(summary.errors, 1)
+
+    def test_rejected_before_sending(self):
+        summary = self.dispatcher(normalize='61').run([dict(recipients=['abc', 'def'], content='Hello'),
+                                                       dict(recipients=['0412345678', 'ghi'], content='Hello')])
+        self.assertEqual(summary.sent, 1)
+        self.assertEqual(summary.failed, 3)
+        self.assertEqual(summary.requests, 1)
+
+    def test_duplicates_are_not_failures(self):
+        summary = self.dispatcher(normalize='61').run(
+            [dict(recipients=['0412345678', '+61412345678', '0412 345 679', 'bad'], content='Hello')])
+        self.assertEqual((summary.sent, summary.failed, summary.deduplicated), (2, 1, 1))
+
+    def test_errors_before_sending_are_recorded(self):
+        def client_factory():
+            raise IOError('no route to host')
+
+        summary = Dispatcher(client_factory, workers=2).run(
+            [dict(recipients=['+61412345678', '+61412345679'], content='Hello'), dict(content='Hello')])
+        self.assertEqual((summary.sent, summary.failed, summary.errors, summary.requests), (0, 2, 2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+from datetime import datetime
+
+from suds.sax.date import DateTime
+
+from mmsoap.client import MMSoapClient
+from mmsoap.envelope import escape, render, text
+from mmsoap.simulator import SimulatorServer
+
+MESSAGES = [
+    dict(recipients=['+61412345678'], content='Hello'),
+    dict(recipients=['+61412345678', '+61412345679'], content='Tom & Jerry <"quoted"> \'single\' 100%',
+         seq=2, uids=[7, 9]),
+    dict(recipients=['+61412345670'], content=u'Caf\xe9 \u2603', scheduled=datetime(2016, 5, 4, 3, 2, 1),
+         report=True),
+    dict(recipients=['+61412345671'], content='Caf\xc3\xa9 in UTF-8', scheduled='2016-05-04T03:02:01Z',
+         report=1, seq=3),
+]
+
+
+class TextTest(unittest.TestCase):
+
+    def test_escape(self):
+        self.assertEqual(escape('a & b < c > d " e \' f'), 'a &amp; b &lt; c &gt; d &quot; e &apos; f')
+        self.assertEqual(escape('&amp; stays'), '&amp; stays')
+        self.assertEqual(escape('plain'), 'plain')
+
+    def test_text(self):
+        self.assertEqual(text(True), 'true')
+        self.assertEqual(text(12), '12')
+        self.assertEqual(text(u'caf\xe9'), u'caf\xe9')
+        self.assertEqual(text('caf\xc3\xa9'), u'caf\xe9')
+        self.assertEqual(text(datetime(2016, 5, 4, 3, 2, 1)), unicode(DateTime(datetime(2016, 5, 4, 3, 2, 1))))
+
+
+class EnvelopeTest(unittest.TestCase):
+    """ The template envelopes must be the same as the ones suds renders. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.client = MMSoapClient('user & co', 'p<a>ss', wsdl_url=self.server.wsdl_url, fast_serializer=True)
+
+    def suds_envelope(self, operation, body):
+        return render(self.client, operation, self.client.authentication, body)
+
+    def test_send_messages(self):
+        for send_mode in ('normal', 'dropAll'):
+            for messages in [MESSAGES[:1], MESSAGES]:
+                # suds takes unicode, the templates UTF-8 byte strings too
+                body = self.client._send_messages_body(
+                    [self.client.create_message(**dict(message, content=unicode(message['content'], 'utf-8')
+                                                       if isinstance(message['content'], str)
+                                                       else message['content']))
+                     for message in messages], send_mode)
+                self.assertEqual(self.client.envelopes.send_messages(messages, send_mode),
+                                 self.suds_envelope('sendMessages', body))
+
+    def test_items(self):
+        for operation, build, items in (('confirmReplies', '_confirm_replies_body', [1, 2, 3]),
+                                        ('confirmReports', '_confirm_reports_body', [4]),
+                                        ('deleteScheduledMessages', '_delete_scheduled_messages_body', ['a&b', 'c']),
+                                        ('blockNumbers', '_block_numbers_body', ['+61412345678', '+61412345679']),
+                                        ('unblockNumbers', '_unblock_numbers_body', ['+61412345678'])):
+            self.assertEqual(self.client.envelopes.items(operation, build, items),
+                             self.suds_envelope(operation, getattr(self.client, build)(items)))
+
+    def test_credentials(self):
+        for user_id, password in ((None, None), ('user', None), (None, 'secret'), ('', '')):
+            client = MMSoapClient(user_id, password, wsdl_url=self.server.wsdl_url, fast_serializer=True)
+            self.assertEqual(client.envelopes.send_messages(MESSAGES[:1], 'normal'),
+                             render(client, 'sendMessages', client.authentication,
+                                    client._send_messages_body(client.create_message(**MESSAGES[0]), 'normal')))
+            self.assertEqual(client.envelopes.items('confirmReplies', '_confirm_replies_body', [1]),
+                             render(client, 'confirmReplies', client.authentication,
+                                    client._confirm_replies_body([1])))
+
+    def test_send_through_templates(self):
+        response = self.client.send_messages(['+61412345678', '+61412345679'], 'Caf\xc3\xa9')
+        self.assertEqual(response._sent, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
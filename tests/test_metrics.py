@@ -0,0 +1,127 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+
+from suds import WebFault
+
+from mmsoap.client import MMSoapClient
+from mmsoap.exceptions import InvalidRecipientException
+from mmsoap.metrics import Histogram, Metrics
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram('h', 'Help.', ('operation',), buckets=(1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(('a',), value)
+        self.assertEqual(histogram.count(('a',)), 4)
+        self.assertEqual(histogram.sum(('a',)), 56.5)
+        self.assertEqual(histogram.percentile(('a',), 50), 1)
+        self.assertEqual(histogram.percentile(('a',), 100), float('inf'))
+        self.assertEqual(histogram.percentile(('b',), 50), None)
+        samples = list(histogram.samples())
+        self.assertEqual([value for suffix, labels, value in samples], [2, 3, 4, 4, 56.5])
+
+    def test_exposition(self):
+        metrics = Metrics(prefix='test')
+        metrics.calls.inc(('send_messages', 'ok'))
+        text = metrics.exposition()
+        self.assertTrue('# TYPE test_calls_total counter\n' in text)
+        self.assertTrue('test_calls_total{operation="send_messages",outcome="ok"} 1\n' in text)
+
+
+class ClientMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SimulatorServer(Simulator(accounts={'metrics': 'secret'})).start()
+        self.metrics = Metrics()
+        self.calls = []
+        self.metrics.add_hook(self.calls.append)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, password='secret', **kwargs):
+        return MMSoapClient('metrics', password, wsdl_url=self.server.wsdl_url, metrics=self.metrics, **kwargs)
+
+    def test_send_messages(self):
+        self.client().send_messages(['+61412345678', '+61412345679'], 'Hello')
+        call, = self.calls
+        self.assertEqual((call.operation, call.requests, call.error), ('send_messages', 1, None))
+        self.assertTrue(call.request_bytes > 0 and call.response_bytes > 0)
+        self.assertTrue(call.total >= call.transport > 0)
+        self.assertEqual(self.metrics.requests.values, {('send_messages',): 1})
+        self.assertEqual(self.metrics.request_bytes.count(('send_messages',)), 1)
+
+    def test_errors(self):
+        self.assertRaises(InvalidRecipientException, self.client().send_messages, ['not a number'], 'Hello')
+        self.assertRaises(WebFault, self.client('wrong').check_user)
+        self.assertEqual(self.metrics.calls.values, {('send_messages', 'error'): 1, ('check_user', 'error'): 1})
+        self.assertEqual(self.metrics.errors.values[('send_messages', 'invalidRecipient')], 1)
+
+    def test_batch_requests_are_summed(self):
+        client = self.client()
+        messages = [dict(recipients=['+6141234567%d' % i], content='Hello') for i in range(5)]
+        client.send_message_batch(messages, max_messages=2)
+        call, = self.calls
+        self.assertEqual(call.requests, 3)
+        self.assertEqual(self.metrics.requests.values, {('send_message_batch',): 3})
+
+    def test_streamed_replies_are_recorded_once_exhausted(self):
+        self.server.respond.queue('metrics', replies=5)
+        client = self.client()
+        client.load()
+        replies = client.iter_replies()
+        self.assertEqual(self.calls, [])
+        next(replies)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(len(list(replies)), 4)
+
+        call, = self.calls
+        self.assertEqual((call.operation, call.requests, call.error), ('iter_replies', 1, None))
+        self.assertTrue(call.request_bytes > 0)
+        self.assertTrue(call.response_bytes > 1000)
+        self.assertTrue(call.total >= call.transport + call.unmarshal)
+        self.assertEqual(self.metrics.requests.values, {('iter_replies',): 1})
+        self.assertEqual(self.metrics.response_bytes.sum(('iter_replies',)), call.response_bytes)
+
+    def test_streamed_records_count_in_the_calling_operation(self):
+        self.server.respond.queue('metrics', replies=3)
+        client = self.client()
+        client.load()
+        replies = client.check_replies(records=True)
+        self.assertEqual(len(replies), 3)
+        call, = self.calls
+        self.assertEqual((call.operation, call.requests, call.error), ('check_replies', 1, None))
+        self.assertTrue(call.request_bytes > 0 and call.response_bytes > 0)
+
+    def test_closed_stream_is_recorded(self):
+        self.server.respond.queue('metrics', reports=3)
+        replies = self.client().iter_reports()
+        next(replies)
+        replies.close()
+        call, = self.calls
+        self.assertEqual((call.operation, call.requests), ('iter_reports', 1))
+
+    def test_failed_stream_is_recorded(self):
+        self.assertRaises(WebFault, self.client('wrong').iter_replies)
+        call, = self.calls
+        self.assertEqual(call.operation, 'iter_replies')
+        self.assertEqual(self.metrics.calls.values, {('iter_replies', 'error'): 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+
+from mmsoap.numbers import normalize, to_e164
+
+NUMBERS = ['0412 345 678', '+61412345678', '0061412345678', '61412345678', '412345678', '+1 (212) 555-0100',
+           '00', '0', '+0412', '000412345678', '', 'abc', '12', '1234567890123456', '+123456', '0412-345-678 ',
+           '001234567', '6112345', '+', '(02) 9876 5432', '.61412345678', 412345678, 61412345678L]
+
+
+class ToE164Test(unittest.TestCase):
+
+    def test_prefixes(self):
+        self.assertEqual(to_e164('0412 345 678'), '+61412345678')
+        self.assertEqual(to_e164('0061412345678'), '+61412345678')
+        self.assertEqual(to_e164('61412345678'), '+61412345678')
+        self.assertEqual(to_e164('412345678'), '+61412345678')
+        self.assertEqual(to_e164('+1 (212) 555-0100'), '+12125550100')
+        self.assertEqual(to_e164('(020) 7946 0018', '44'), '+442079460018')
+        self.assertEqual(to_e164(412345678), '+61412345678')
+
+    def test_malformed(self):
+        for number in ('', '0', '+', '00', '+0412', 'abc', '12', '1234567890123456', '+61 412 345 678x'):
+            self.assertEqual(to_e164(number), None, number)
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def assertMatchesToE164(self, numbers, default_country='61'):
+        result = normalize(numbers, default_country)
+        expected = [to_e164(number, default_country) for number in numbers]
+        self.assertEqual([result.numbers[i] if i >= 0 else None for i in result.index], expected)
+        self.assertEqual(result.rejected, [position for position, number in enumerate(expected) if number is None])
+        self.assertEqual(len(result.numbers), len(set(result.numbers)))
+
+    def test_same_as_to_e164(self):
+        for default_country in ('61', '1', '44'):
+            self.assertMatchesToE164(NUMBERS, default_country)
+            self.assertMatchesToE164([number for number in NUMBERS if isinstance(number, str)], default_country)
+
+    def test_unicode(self):
+        self.assertMatchesToE164([unicode(number) for number in NUMBERS])
+
+    def test_non_ascii_bytes_among_unicode(self):
+        numbers = [u'0412345678', '\xe2\x80\x8b0412345679', u'0412345680', '0412345681']
+        self.assertMatchesToE164(numbers)
+        self.assertEqual(normalize(numbers).rejected, [1])
+
+    def test_embedded_line_break(self):
+        self.assertMatchesToE164(['0412345678', '0412\n345679', '0412345680'])
+
+    def test_duplicates(self):
+        result = normalize(['0412345678', '+61412345678', 'bad', '0412 345 679', '61412345678'])
+        self.assertEqual(result.numbers, ['+61412345678', '+61412345679'])
+        self.assertEqual(result.index, [0, 0, -1, 1, 0])
+        self.assertEqual(result.rejected, [2])
+        self.assertEqual(result.duplicates, 2)
+        self.assertEqual(result.first_positions(), [0, 3])
+        self.assertEqual(result.positions(), [[0, 1, 4], [3]])
+
+    def test_empty(self):
+        self.assertEqual(normalize([]), ([], [], []))
+
+    def test_default_country(self):
+        self.assertEqual(normalize(['0412345678'], '+61').numbers, ['+61412345678'])
+        self.assertRaises(ValueError, normalize, ['0412345678'], 'AU')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code):
+    """ Run `code` in a new interpreter, so mmsoap and suds are imported from scratch. """
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode:
+        raise AssertionError(err)
+    return out.strip()
+
+
+class PackageTest(unittest.TestCase):
+
+    def test_import_does_not_import_suds(self):
+        self.assertEqual(run('import sys, mmsoap; print "suds" in sys.modules'), 'False')
+
+    def test_exceptions(self):
+        self.assertEqual(run('import sys, mmsoap\n'
+                             'assert issubclass(mmsoap.InvalidRecipientException, mmsoap.BaseMMSOAPException)\n'
+                             'assert mmsoap.exceptions.OtherMMSOAPException is mmsoap.OtherMMSOAPException\n'
+                             'print "suds" in sys.modules'), 'False')
+
+    def test_submodules(self):
+        self.assertEqual(run('import mmsoap\n'
+                             'print mmsoap.client.MMSoapClient is mmsoap.MMSoapClient, mmsoap.records.__name__'),
+                         'True mmsoap.records')
+
+    def test_from_import(self):
+        self.assertEqual(run('from mmsoap import MMSoapClient, RecipientBlockedException\n'
+                             'from mmsoap.exceptions import RecipientBlockedException as E\n'
+                             'print E is RecipientBlockedException'), 'True')
+
+    def test_unknown_name(self):
+        self.assertEqual(run('import mmsoap\n'
+                             'try:\n'
+                             '    mmsoap.nothing\n'
+                             'except AttributeError:\n'
+                             '    print "AttributeError"'), 'AttributeError')
+
+
+if __name__ == '__main__':
+    unittest.main()
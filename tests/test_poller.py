@@ -0,0 +1,92 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+import unittest
+
+from mmsoap.poller import Poller
+from mmsoap.records import ReplyRecord
+
+
+class FlakyClient(object):
+    """ Returns the replies not confirmed yet, failing the first `check_failures` checks and confirms. """
+
+    def __init__(self, receipt_ids, check_failures=0, confirm_failures=0):
+        self.pending = list(receipt_ids)
+        self.check_failures = check_failures
+        self.confirm_failures = confirm_failures
+        self.confirmed = []
+
+    def iter_replies(self, maximum=None):
+        if self.check_failures:
+            self.check_failures -= 1
+            raise IOError('connection reset')
+        return [ReplyRecord(None, receipt_id, 'SMS', '+61412345678', None, 'Hi') for receipt_id in self.pending]
+
+    def confirm_replies(self, receipt_ids):
+        if self.confirm_failures:
+            self.confirm_failures -= 1
+            raise IOError('connection reset')
+        self.confirmed.extend(receipt_ids)
+        self.pending = [receipt_id for receipt_id in self.pending if receipt_id not in receipt_ids]
+
+
+class PollerTest(unittest.TestCase):
+
+    def run_until(self, poller, condition, timeout=5.0):
+        thread = threading.Thread(target=poller.run)
+        thread.start()
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        poller.stop()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive())
+
+    def poller(self, client, handled, **kwargs):
+        kwargs.setdefault('poll_interval', 0.01)
+        return Poller(client, handled.append, confirm_interval=0.01, error_delay=0.01, **kwargs)
+
+    def test_delivers_and_confirms(self):
+        client, handled = FlakyClient([1, 2, 3]), []
+        poller = self.poller(client, handled)
+        self.run_until(poller, lambda: len(client.confirmed) == 3)
+        self.assertEqual([record.receipt_id for record in handled], [1, 2, 3])
+        self.assertEqual(sorted(client.confirmed), [1, 2, 3])
+        self.assertEqual(poller.stats()['errors'], 0)
+
+    def test_keeps_polling_after_failed_checks(self):
+        client, handled = FlakyClient([1, 2], check_failures=3), []
+        poller = self.poller(client, handled)
+        self.run_until(poller, lambda: len(client.confirmed) == 2)
+        self.assertEqual(sorted(client.confirmed), [1, 2])
+        self.assertEqual(poller.stats()['errors'], 3)
+
+    def test_retries_failed_confirms(self):
+        client, handled = FlakyClient([1, 2], confirm_failures=2), []
+        poller = self.poller(client, handled)
+        self.run_until(poller, lambda: len(client.confirmed) == 2)
+        self.assertEqual(sorted(client.confirmed), [1, 2])
+        self.assertEqual([record.receipt_id for record in handled], [1, 2])
+        self.assertEqual(poller.stats()['errors'], 2)
+
+    def test_flushes_pending_confirmations_on_stop(self):
+        client, handled = FlakyClient([1, 2]), []
+        poller = Poller(client, handled.append, confirm_interval=3600, poll_interval=0.01)
+        self.run_until(poller, lambda: len(handled) == 2)
+        self.assertEqual(sorted(client.confirmed), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
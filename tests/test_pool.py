@@ -0,0 +1,78 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import unittest
+
+from mmsoap.credit import CreditLedger
+from mmsoap.pool import MMSoapClientPool
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class PoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer(Simulator(credit_limit=100)).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def pool(self, **kwargs):
+        return MMSoapClientPool([('a', 'pool-a', 'x'), ('b', 'pool-b', 'y')], wsdl_url=self.server.wsdl_url,
+                                **kwargs)
+
+    def test_each_account_gets_its_own_ledger(self):
+        pool = self.pool(credit=lambda key: CreditLedger())
+        ledger_a, ledger_b = pool.accounts['a'].credit, pool.accounts['b'].credit
+        self.assertFalse(ledger_a is ledger_b)
+
+        pool['a'].send_messages(['+61412345678', '+61412345679'], 'Hello')
+        pool['b'].send_messages(['+61412345678'], 'Hello')
+        self.assertEqual(ledger_a.remaining, 98)
+        self.assertEqual(ledger_b.remaining, 99)
+
+    def test_ledger_instance_is_rejected(self):
+        self.assertRaises(TypeError, self.pool, credit=CreditLedger())
+
+    def test_accounts_added_with_their_own_ledger(self):
+        pool = self.pool(credit=lambda key: CreditLedger())
+        ledger = CreditLedger()
+        pool.add('c', 'pool-c', 'z', credit=ledger)
+        self.assertTrue(pool.accounts['c'].credit is ledger)
+
+    def test_calls_use_the_credentials_of_the_account(self):
+        pool = self.pool()
+        results = {}
+
+        def call(key):
+            results[key] = pool[key].check_user()._creditRemaining
+        threads = [threading.Thread(target=call, args=(key,)) for key in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), ['a', 'b'])
+        self.assertEqual(pool.stats()['a']['calls'], 1)
+        self.assertEqual(pool.stats()['a']['errors'], 0)
+        self.assertTrue('pool-a' in self.server.respond.state)
+
+    def test_unknown_account(self):
+        pool = self.pool()
+        self.assertRaises(KeyError, lambda: pool['missing'])
+        self.assertRaises(AttributeError, lambda: pool['a'].load)
+
+
+if __name__ == '__main__':
+    unittest.main()
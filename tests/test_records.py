@@ -0,0 +1,125 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+from datetime import datetime
+from StringIO import StringIO
+
+from mmsoap.client import MMSoapClient
+from mmsoap.records import (BlockedNumberRecord, RecordColumns, ReplyRecord, ReportRecord, field_name,
+                            iter_records, make_record, parse_datetime, to_records)
+from mmsoap.simulator import Simulator, SimulatorServer
+
+REPORTS = (
+    '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"><soap:Body>'
+    '<checkReportsResponse xmlns="http://xml.m4u.com.au/2009"><result returned="2" remaining="0"><reports>'
+    '<report uid="7" receiptId="11" deliveryReportId="21" status="delivered">'
+    '<recipient>+61412345678</recipient><timestamp>2016-03-01T10:00:00+10:00</timestamp></report>'
+    '<report receiptId="12" status="failed"><recipient>+61412345679</recipient></report>'
+    '</reports></result></checkReportsResponse></soap:Body></soap:Envelope>')
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_field_name(self):
+        self.assertEqual(field_name('receiptId'), 'receipt_id')
+        self.assertEqual(field_name('{http://xml.m4u.com.au/2009}deliveryReportId'), 'delivery_report_id')
+        self.assertEqual(field_name('status'), 'status')
+
+    def test_parse_datetime(self):
+        self.assertEqual(parse_datetime('2016-03-01T10:00:00Z'), datetime(2016, 3, 1, 10))
+        self.assertEqual(parse_datetime('2016-03-01T10:00:00'), datetime(2016, 3, 1, 10))
+        self.assertEqual(parse_datetime('2016-03-01T10:00:00.25+10:00'), datetime(2016, 3, 1, 0, 0, 0, 250000))
+        self.assertEqual(parse_datetime('2016-03-01T10:00:00-01:30'), datetime(2016, 3, 1, 11, 30))
+        self.assertEqual(parse_datetime('yesterday'), 'yesterday')
+
+    def test_make_record(self):
+        record = make_record(ReportRecord, dict(uid='7', receipt_id='x', timestamp='2016-03-01T10:00:00Z'))
+        self.assertEqual(record, ReportRecord(7, 'x', None, None, datetime(2016, 3, 1, 10), None))
+
+    def test_iter_records(self):
+        fp = StringIO(REPORTS)
+        records = list(iter_records(fp, 'report', ReportRecord))
+        self.assertEqual(records, [
+            ReportRecord(7, 11, 21, '+61412345678', datetime(2016, 3, 1), 'delivered'),
+            ReportRecord(None, 12, None, '+61412345679', None, 'failed'),
+        ])
+        self.assertTrue(fp.closed)
+
+    def test_iter_records_text(self):
+        xml = '<r><recipient uid="1">+61412345678</recipient><recipient uid="2"> +61412345679 </recipient></r>'
+        self.assertEqual(list(iter_records(StringIO(xml), 'recipient', BlockedNumberRecord)),
+                         [BlockedNumberRecord(1, '+61412345678'), BlockedNumberRecord(2, '+61412345679')])
+
+
+class RecordColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            ReportRecord(7, 11, 21, '+61412345678', datetime(2016, 3, 1, 10, 0, 0, 500000), 'delivered'),
+            ReportRecord(None, 12, None, '+61412345679', None, 'failed'),
+            ReportRecord(9, 13, 23, '+61412345670', datetime(2016, 3, 2), 'delivered'),
+        ]
+
+    def test_round_trip(self):
+        columns = RecordColumns(ReportRecord, self.records)
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(list(columns), self.records)
+        self.assertEqual(columns[1], self.records[1])
+        self.assertEqual(columns[-1], self.records[-1])
+        self.assertEqual(columns[:2], self.records[:2])
+
+    def test_columns(self):
+        columns = RecordColumns(ReportRecord, self.records)
+        self.assertEqual(columns.column('receipt_id'), [11, 12, 13])
+        self.assertEqual(columns.column('uid'), [7, None, 9])
+        self.assertEqual(columns.column('timestamp'), [r.timestamp for r in self.records])
+        self.assertEqual(columns.column('status').count('delivered'), 2)
+
+    def test_repeated_values_stored_once(self):
+        statuses = [''.join(['deliv', 'ered']) for _ in range(3)]
+        columns = RecordColumns(ReportRecord, [ReportRecord(i, i, i, '', None, s) for i, s in enumerate(statuses)])
+        first, second, third = columns.column('status')
+        self.assertTrue(first is second is third)
+
+    def test_non_integer_ids(self):
+        columns = RecordColumns(ReplyRecord)
+        columns.append(ReplyRecord(1, 'abc', 'SMS', '+61412345678', None, 'Hi'))
+        columns.append(ReplyRecord(2, 10 ** 30, 'SMS', '+61412345678', None, 'Hi'))
+        self.assertEqual(columns.column('receipt_id'), ['abc', 10 ** 30])
+        self.assertEqual(columns.column('uid'), [1, 2])
+
+
+class SudsRecordsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer(Simulator()).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_records_match_suds_objects(self):
+        self.server.respond.queue('records', replies=3)
+        client = MMSoapClient('records', 'x', wsdl_url=self.server.wsdl_url)
+        replies = client.check_replies()
+        self.assertEqual(len(replies), 3)
+        records = to_records(ReplyRecord, replies)
+        self.assertEqual([r.receipt_id for r in records], [int(r._receiptId) for r in replies])
+        self.assertEqual([r.content for r in records], [r.content for r in replies])
+        self.assertTrue(all(isinstance(r.received, datetime) for r in records))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import unittest
+
+from suds import WebFault
+from suds.cache import NoCache
+from suds.client import Client
+from suds.plugin import MessagePlugin
+from suds.transport.http import HttpTransport
+
+from mmsoap.registry import ServiceModel, ServiceRegistry, SharedTransport
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class Recorder(MessagePlugin):
+
+    def __init__(self):
+        self.replies = 0
+
+    def parsed(self, context):
+        self.replies += 1
+
+
+class ServiceRegistryTest(unittest.TestCase):
+
+    def test_builds_once_per_key(self):
+        registry = ServiceRegistry()
+        built = []
+
+        def build():
+            built.append(1)
+            return object()
+
+        threads = [threading.Thread(target=registry.get, args=('key', build)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(built), 1)
+        self.assertTrue('key' in registry)
+        self.assertTrue(registry.get('key', build) is registry.get('key', build))
+
+        registry.discard('key')
+        self.assertFalse('key' in registry)
+        registry.get('key', build)
+        registry.clear()
+        self.assertFalse('key' in registry)
+        self.assertEqual(len(built), 2)
+
+
+class SharedClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer(Simulator(accounts={'shared': 'secret'})).start()
+        cls.model = ServiceModel(Client(cls.server.wsdl_url, cache=NoCache()))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def check_user(self, client, password='secret'):
+        authentication = client.factory.create('AuthenticationType')
+        authentication.userId = 'shared'
+        authentication.password = password
+        return client.service.checkUser(authentication)
+
+    def test_clones_share_the_model(self):
+        first, second = self.model.clone(), self.model.clone()
+        self.assertTrue(first.factory is second.factory is self.model.client.factory)
+        self.assertTrue(first.wsdl.schema is second.wsdl.schema is self.model.client.wsdl.schema)
+        self.assertFalse(first.options.transport is second.options.transport)
+        self.assertEqual(self.check_user(first).accountDetails._creditLimit,
+                         self.check_user(second).accountDetails._creditLimit)
+
+    def test_shared_transport(self):
+        transport = HttpTransport()
+        first, second = self.model.clone(transport=transport), self.model.clone(transport=transport)
+        self.assertTrue(first.options.transport is transport)
+        self.assertTrue(isinstance(second.options.transport, SharedTransport))
+        self.assertTrue(second.options.transport.transport is transport)
+        self.check_user(second)
+
+    def test_options_are_per_client(self):
+        raw = self.model.clone(retxml=True)
+        self.assertTrue('<checkUserResponse' in self.check_user(raw))
+
+        # read by the bindings rather than the client
+        unprefixed = self.model.clone(prefixes=False)
+        method = unprefixed.service.checkUser.method
+        self.assertTrue(method.binding.input.get_message(method, (None,), {}).plain().find('<Envelope ') > 0)
+        method = self.model.clone().service.checkUser.method
+        self.assertTrue('<SOAP-ENV:Envelope ' in method.binding.input.get_message(method, (None,), {}).plain())
+        self.assertTrue(self.model.client.options.prefixes)
+        self.assertRaises(WebFault, self.check_user, self.model.clone(), 'wrong')
+
+    def test_plugins_are_per_client(self):
+        recorder = Recorder()
+        plugged = self.model.clone(plugins=[recorder])
+        self.check_user(self.model.clone())
+        self.assertEqual(recorder.replies, 0)
+        self.check_user(plugged)
+        self.assertEqual(recorder.replies, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
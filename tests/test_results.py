@@ -0,0 +1,105 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+
+from mmsoap.client import MMSoapClient
+from mmsoap.results import RecipientError, decode_errors
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class MessageErrorSimulator(Simulator):
+    """ Fails the first `failures` sendMessages requests with an error naming no recipient. """
+
+    def __init__(self, failures, **kwargs):
+        Simulator.__init__(self, **kwargs)
+        self.failures = failures
+
+    def sendMessages(self, account, request):
+        if self.failures:
+            self.failures -= 1
+            return '<result sent="0" scheduled="0" failed="0">%s<errors><error code="other" sequenceNumber="1">' \
+                   '<recipients/></error></errors></result>' % self.account_details(account)
+        return Simulator.sendMessages(self, account, request)
+
+
+class DecodeErrorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SimulatorServer().start()
+        self.client = MMSoapClient('results', 'secret', wsdl_url=self.server.wsdl_url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_errors_per_recipient(self):
+        self.client.block_numbers(['+61412345679'])
+        response = self.client._send_message_list([dict(recipients=['+61412345678', '+61412345679', 'nope'],
+                                                        content='Hello', seq=4, uids=[10, 11, 12])], 'normal')
+        errors = sorted(decode_errors(response))
+        self.assertEqual(errors, [RecipientError('invalidRecipient', 4, 12, 'nope'),
+                                  RecipientError('recipientBlocked', 4, 11, '+61412345679')])
+        self.assertTrue(all(e.permanent and not e.retryable for e in errors))
+
+    def test_no_errors(self):
+        self.assertEqual(decode_errors(self.client.send_messages(['+61412345678'], 'Hello')), [])
+
+
+class RetryTest(unittest.TestCase):
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, simulator):
+        self.server = SimulatorServer(simulator).start()
+        self.sleeps = []
+        return MMSoapClient('results', 'secret', wsdl_url=self.server.wsdl_url)
+
+    def test_only_retryable_recipients_are_resent(self):
+        simulator = Simulator(error_rate=0.5, seed=3)
+        client = self.client(simulator)
+        recipients = ['+614123456%02d' % i for i in range(20)] + ['bad']
+        result = client.send_messages_with_retry(recipients, 'Hello', retries=10, sleep=self.sleeps.append)
+
+        self.assertEqual(result.sent, 20)
+        self.assertEqual([(e.code, e.uid) for e in result.errors], [('invalidRecipient', 20)])
+        self.assertTrue(result.attempts > 1)
+        self.assertEqual(result.attempts, len(self.sleeps) + 1)
+        self.assertEqual(self.sleeps, [1.0 * 2 ** n for n in range(len(self.sleeps))])
+        self.assertEqual(simulator.stats()['requests'], result.attempts)
+
+    def test_gives_up_after_retries(self):
+        simulator = Simulator(error_rate=1.0)
+        result = self.client(simulator).send_messages_with_retry(['+61412345678'], 'Hello', retries=2, delay=0.5,
+                                                                 sleep=self.sleeps.append)
+        self.assertEqual((result.sent, result.attempts, result.retried), (0, 3, 2))
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertEqual([(e.code, e.uid) for e in result.errors], [('other', 0)])
+
+    def test_message_errors_resend_every_recipient(self):
+        client = self.client(MessageErrorSimulator(1))
+        result = client.send_messages_with_retry(['+61412345678', '+61412345679'], 'Hello',
+                                                 sleep=self.sleeps.append)
+        self.assertEqual((result.sent, result.attempts, result.retried), (2, 2, 2))
+        self.assertEqual(result.errors, [])
+        self.assertEqual(self.sleeps, [1.0])
+
+    def test_message_errors_are_kept_after_the_last_attempt(self):
+        client = self.client(MessageErrorSimulator(3))
+        result = client.send_messages_with_retry(['+61412345678'], 'Hello', retries=1, sleep=self.sleeps.append)
+        self.assertEqual((result.sent, result.attempts), (0, 2))
+        self.assertEqual(result.errors, [RecipientError('other', 1, None, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import unittest
+
+from mmsoap.client import MMSoapClient
+from mmsoap.simulator import Simulator, SimulatorServer
+
+
+class SimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SimulatorServer(Simulator(accounts={'simulator': 'secret'})).start()
+        self.client = MMSoapClient('simulator', 'secret', wsdl_url=self.server.wsdl_url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_confirmed_reports_are_not_returned_again(self):
+        self.server.respond.queue('simulator', reports=3)
+        ids = [report._deliveryReportId for report in self.client.check_reports()]
+        self.assertEqual(len(ids), 3)
+
+        self.assertEqual(self.client.confirm_reports(ids[:2])._confirmed, 2)
+        self.assertEqual([report._deliveryReportId for report in self.client.check_reports()], ids[2:])
+
+    def test_scheduled_messages_can_be_deleted(self):
+        scheduled = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 3600))
+        response = self.client.send_messages(['+61412345678', '+61412345679'], 'Later', scheduled=scheduled,
+                                             report=True)
+        self.assertEqual((response._sent, response._scheduled), (0, 2))
+        message_ids = [message._messageId for message in response.scheduledMessages.message]
+        self.assertEqual(len(message_ids), 1)
+
+        self.assertEqual(self.client.delete_scheduled_messages(message_ids)._unscheduled, 1)
+        self.assertEqual(self.client.delete_scheduled_messages(message_ids)._unscheduled, 0)
+        self.assertEqual(self.server.respond.account('simulator').scheduled, {})
+
+    def test_unscheduled_messages_have_no_ids(self):
+        response = self.client.send_messages(['+61412345678'], 'Now')
+        self.assertEqual(response._sent, 1)
+        self.assertFalse('scheduledMessages' in response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mmsoap.client import MMSoapClient, WellBehavedHttpTransport
+from mmsoap.exceptions import SnapshotMissingException
+from mmsoap.simulator import SimulatorServer
+from mmsoap.snapshot import compare, fetch, load_manifest, write
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SimulatorServer().start()
+        self.location = tempfile.mkdtemp()
+        self.documents = fetch(self.server.wsdl_url, WellBehavedHttpTransport())
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.location)
+
+    def test_fetch(self):
+        urls = [url for url, content in self.documents]
+        self.assertEqual(urls, [self.server.wsdl_url])
+        self.assertTrue('deleteScheduledMessages' in self.documents[0][1])
+
+    def test_write(self):
+        manifest = write(self.server.wsdl_url, self.documents, self.location)
+        self.assertEqual(load_manifest(self.location), manifest)
+        self.assertEqual(manifest['wsdl_url'], self.server.wsdl_url)
+        document = manifest['documents'][self.server.wsdl_url]
+        f = open(os.path.join(self.location, document['file']), 'rb')
+        try:
+            self.assertEqual(f.read(), self.documents[0][1])
+        finally:
+            f.close()
+        self.assertEqual(sorted(os.listdir(self.location)), sorted([document['file'], 'manifest.json']))
+
+    def test_rewrite_removes_old_documents(self):
+        write(self.server.wsdl_url, [(self.server.wsdl_url, 'old'), ('http://example.com/gone.xsd', 'gone')],
+              self.location)
+        manifest = write(self.server.wsdl_url, self.documents, self.location)
+        self.assertEqual(sorted(os.listdir(self.location)),
+                         sorted([manifest['documents'][self.server.wsdl_url]['file'], 'manifest.json']))
+
+    def test_compare(self):
+        write(self.server.wsdl_url, self.documents, self.location)
+        self.assertEqual(compare(self.documents, self.location), [])
+
+        changed = [(self.server.wsdl_url, self.documents[0][1] + ' '), ('http://example.com/new.xsd', '')]
+        self.assertEqual(compare(changed, self.location), sorted(['http://example.com/new.xsd',
+                                                                  self.server.wsdl_url]))
+        self.assertEqual(compare([], self.location), [self.server.wsdl_url])
+
+    def test_missing_snapshot(self):
+        self.assertRaises(SnapshotMissingException, compare, self.documents, self.location)
+        client = MMSoapClient('user', 'secret', wsdl_url=self.server.wsdl_url, frozen=self.location)
+        self.assertRaises(SnapshotMissingException, client.load)
+
+    def test_frozen_client(self):
+        write(self.server.wsdl_url, self.documents, self.location)
+        client = MMSoapClient('user', 'secret', wsdl_url=self.server.wsdl_url, frozen=self.location)
+        self.assertEqual(client.send_messages(['+61412345678'], 'Hello')._sent, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mmsoap.client import MMSoapClient
+from mmsoap.simulator import Simulator, SimulatorServer
+from mmsoap.spool import IN_FLIGHT, Spool
+
+
+class SpoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimulatorServer(Simulator()).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'spool.db')
+        self.client = MMSoapClient('spool', 'x', wsdl_url=self.server.wsdl_url)
+        self.client.BATCH_MAX_MESSAGES = 2
+        self.spools = []
+
+    def tearDown(self):
+        for spool in self.spools:
+            spool.close()
+        shutil.rmtree(self.directory)
+
+    def spool(self, **kwargs):
+        spool = Spool(self.path, self.client, **kwargs)
+        self.spools.append(spool)
+        return spool
+
+    def fail_request(self, number):
+        """ Make the `number`th sendMessages request of the client raise. """
+        send, calls = self.client._send_message_list, []
+
+        def fail(messages, send_mode):
+            calls.append(messages)
+            if len(calls) == number:
+                raise IOError('connection reset')
+            return send(messages, send_mode)
+        self.client._send_message_list = fail
+
+    def test_drain(self):
+        spool = self.spool(keep_done=True)
+        spool.enqueue(['+61412345678'], 'Hello')
+        spool.enqueue(['not a number'], 'Hello')
+        self.assertEqual(spool.drain(), 2)
+        self.assertEqual(spool.stats(), dict(pending=0, in_flight=0, done=1, partial=0, failed=1))
+        row_id, message, errors = spool.failures()[0]
+        self.assertEqual(message['recipients'], ['not a number'])
+        self.assertEqual(errors[0]['code'], 'invalidRecipient')
+
+    def test_partially_sent_row_is_done(self):
+        spool = self.spool()
+        spool.enqueue(['+61412345678', 'not a number', '+61412345679'], 'Hello')
+        spool.enqueue(['+61412345670'], 'Hello')
+        self.assertEqual(spool.drain(), 2)
+        self.assertEqual(spool.stats(), dict(pending=0, in_flight=0, done=1, partial=1, failed=0))
+        self.assertEqual(spool.failures(), [])
+        (row_id, message, errors), = spool.partial_failures()
+        self.assertEqual([(e['uid'], e['recipient']) for e in errors], [(1, 'not a number')])
+
+    def test_concurrent_drainers_claim_each_row_once(self):
+        spool = self.spool(batch_size=7)
+        spool.enqueue_many([dict(recipients=['+614123%05d' % i], content='Hello') for i in range(300)])
+        spools = [spool] + [self.spool(batch_size=7) for i in range(3)]
+        claimed = [[] for s in spools]
+
+        def claim(spool, rows):
+            while True:
+                batch = spool._claim()
+                if not batch:
+                    return
+                rows.extend(row_id for row_id, message in batch)
+
+        threads = [threading.Thread(target=claim, args=args) for args in zip(spools, claimed)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = sum(claimed, [])
+        self.assertEqual(len(ids), 300)
+        self.assertEqual(len(set(ids)), 300)
+
+    def test_failed_request_keeps_earlier_requests_done(self):
+        spool = self.spool(keep_done=True)
+        spool.enqueue_many([dict(recipients=['+6141234567%d' % i], content='Hello') for i in range(5)])
+        self.fail_request(2)
+        self.assertRaises(IOError, spool.drain)
+        self.assertEqual(spool.stats(), dict(pending=3, in_flight=0, done=2, partial=0, failed=0))
+
+    def test_opening_leaves_rows_in_flight(self):
+        spool = self.spool()
+        spool.enqueue(['+61412345678'], 'Hello')
+        spool._claim()
+        other = self.spool()
+        self.assertEqual(other.stats()['in_flight'], 1)
+        self.assertEqual(other.drain(), 0)
+
+    def test_recover(self):
+        spool = self.spool()
+        spool.enqueue(['+61412345678'], 'Hello')
+        spool._claim()
+        self.assertEqual(spool.recover(timeout=60), 0)
+        spool.connection.execute('UPDATE spool SET updated = ? WHERE state = ?', (time.time() - 120, IN_FLIGHT))
+        self.assertEqual(spool.recover(timeout=60), 1)
+        self.assertEqual(spool.drain(), 1)
+        self.assertEqual(spool.stats(), dict(pending=0, in_flight=0, done=0, partial=0, failed=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import unittest
+from StringIO import StringIO
+
+from mmsoap.client import MMSoapClient
+from mmsoap.results import TemplatedResult
+from mmsoap.simulator import Simulator, SimulatorServer
+from mmsoap.templated import group_messages
+
+REPLY = re.compile(r'<reply uid="(\d+)".*<origin>(.*)</origin>.*<content>Re: (.*)</content>')
+
+
+def rows(count, plans=('gold', 'silver')):
+    return [dict(recipient='+6141234%04d' % i, plan=plans[i % len(plans)], name='n%d' % i) for i in range(count)]
+
+
+class GroupMessagesTest(unittest.TestCase):
+
+    def group(self, rows, template='{plan} plan', **kwargs):
+        result = TemplatedResult()
+        return list(group_messages(rows, template, result, **kwargs)), result
+
+    def test_identical_content_is_grouped(self):
+        messages, result = self.group(rows(6))
+        self.assertEqual([(m['content'], m['uids']) for m in messages],
+                         [('gold plan', [0, 2, 4]), ('silver plan', [1, 3, 5])])
+        self.assertEqual((result.rows, result.messages), (6, 2))
+
+    def test_schedule_and_report_split_groups(self):
+        batch = rows(4, plans=('gold',))
+        batch[1]['report'] = 'yes'
+        batch[2]['scheduled'] = '2030-01-01T00:00:00Z'
+        messages, result = self.group(batch)
+        self.assertEqual([(m['uids'], m['scheduled'], m['report']) for m in messages],
+                         [([0, 3], None, False), ([1], None, True), ([2], '2030-01-01T00:00:00Z', False)])
+
+    def test_max_recipients(self):
+        messages, result = self.group(rows(7, plans=('gold',)), max_recipients=3)
+        self.assertEqual([m['uids'] for m in messages], [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_window(self):
+        messages, result = self.group(rows(6), window=4)
+        self.assertEqual([m['uids'] for m in messages], [[0, 2], [1, 3], [4], [5]])
+
+    def test_prepare_skips_rows(self):
+        def prepare(recipients):
+            return [r for r in recipients if r != '+61412340002'], [i for i, r in enumerate(recipients)
+                                                                    if r != '+61412340002']
+        messages, result = self.group(rows(4), prepare=prepare)
+        self.assertEqual([m['uids'] for m in messages], [[0], [1, 3]])
+        self.assertEqual(result.skipped, 1)
+
+
+class SendTemplatedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SimulatorServer(Simulator(reply_rate=1.0)).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **kwargs):
+        client = MMSoapClient('templated', 'x', wsdl_url=self.server.wsdl_url, **kwargs)
+        client.load()
+        return client
+
+    def delivered(self):
+        """ Content delivered to each row, from the replies the simulator queued. """
+        replies = self.server.respond.account('templated').replies.values()
+        return dict((int(uid), (recipient, content)) for uid, recipient, content in
+                    (REPLY.search(reply).groups() for reply in replies))
+
+    def test_rows_are_delivered(self):
+        result = self.client().send_templated('Hi {name}, {plan}', rows(20), max_messages=5)
+        self.assertEqual((result.rows, result.messages, result.requests, result.sent), (20, 20, 4, 20))
+        self.assertEqual(result.requests_saved, 16)
+        self.assertEqual(self.server.respond.stats()['requests'], 4)
+        self.assertEqual(self.delivered(), dict((i, ('+6141234%04d' % i, 'Hi n%d, %s' % (i, ('gold', 'silver')[i % 2])))
+                                                for i in range(20)))
+
+    def test_grouped_in_one_request(self):
+        result = self.client().send_templated('{plan} plan', rows(10))
+        self.assertEqual((result.rows, result.messages, result.requests, result.sent), (10, 2, 1, 10))
+        self.assertEqual(self.delivered()[7], ('+61412340007', 'silver plan'))
+
+    def test_errors_by_row(self):
+        batch = rows(5)
+        batch[3]['recipient'] = 'not a number'
+        result = self.client().send_templated('{plan} plan', batch)
+        self.assertEqual((result.sent, result.failed), (4, 1))
+        self.assertEqual(result.error_for_row(3).recipient, 'not a number')
+        self.assertEqual(result.error_for_row(1), None)
+
+    def test_normalize_skips_invalid_rows(self):
+        batch = rows(4)
+        batch[0]['recipient'] = '0412340000'
+        batch[2]['recipient'] = 'not a number'
+        result = self.client(normalize='61').send_templated('{plan} plan', batch)
+        self.assertEqual((result.rows, result.skipped, result.sent, result.failed), (4, 1, 3, 0))
+        self.assertEqual(sorted(self.delivered()), [0, 1, 3])
+        self.assertEqual(self.delivered()[0][0], '+61412340000')
+
+    def test_csv(self):
+        data = 'recipient,name\n+61412340000,Ann\n+61412340001,Bob\n'
+        result = self.client().send_templated('Hi {name}', StringIO(data))
+        self.assertEqual((result.rows, result.sent), (2, 2))
+        self.assertEqual(self.delivered(), {0: ('+61412340000', 'Hi Ann'), 1: ('+61412340001', 'Hi Bob')})
+
+
+if __name__ == '__main__':
+    unittest.main()
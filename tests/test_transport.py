@@ -0,0 +1,117 @@
+#
+# Copyright 2014-2016 MessageMedia
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import socket
+import threading
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from suds import WebFault
+from suds.transport import Request
+
+from mmsoap.client import MMSoapClient
+from mmsoap.simulator import Simulator, SimulatorServer
+from mmsoap.transport import PooledHttpTransport
+
+
+class DroppingHandler(BaseHTTPRequestHandler):
+    """ Answers every POST, then closes the connection if the server says so, without telling the client. """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.cookies.append(self.headers.get('Cookie'))
+        body = 'reply %d' % len(self.server.cookies)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'session=abc; Path=/')
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = self.server.drop
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DroppingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, drop):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), DroppingHandler)
+        self.drop = drop
+        self.cookies = []
+        self.url = 'http://127.0.0.1:%d/' % self.server_address[1]
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+class PooledHttpTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = PooledHttpTransport()
+
+    def tearDown(self):
+        self.transport.close()
+
+    def post(self, url):
+        return self.transport.send(Request(url, 'request')).message
+
+    def test_reuses_connections(self):
+        server = SimulatorServer(Simulator(accounts={'transport': 'secret'})).start()
+        try:
+            client = MMSoapClient('transport', 'secret', wsdl_url=server.wsdl_url, transport=self.transport)
+            for i in range(3):
+                client.check_user()
+            self.assertEqual(self.transport.stats(), dict(open=1, idle=1, opened=1, reused=2))
+
+            server.respond.queue('transport', replies=3)
+            self.assertEqual(len(list(client.iter_replies())), 3)
+            self.assertEqual(len(client.check_replies()), 3)
+            self.assertEqual(self.transport.stats(), dict(open=1, idle=1, opened=1, reused=4))
+
+            self.assertRaises(WebFault, MMSoapClient('transport', 'wrong', wsdl_url=server.wsdl_url,
+                                                      transport=self.transport).check_user)
+            self.assertEqual(self.transport.stats()['open'], 1)
+        finally:
+            server.stop()
+
+    def test_retries_connections_closed_by_the_server(self):
+        server = DroppingServer(drop=True)
+        try:
+            self.assertEqual([self.post(server.url) for i in range(3)], ['reply 1', 'reply 2', 'reply 3'])
+            stats = self.transport.stats()
+            self.assertEqual((stats['opened'], stats['reused']), (3, 2))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_connection_errors_are_raised(self):
+        self.assertRaises(socket.error, self.transport.send, Request('http://127.0.0.1:1/', 'request'))
+        self.assertEqual(self.transport.stats()['open'], 0)
+
+    def test_cookies(self):
+        server = DroppingServer(drop=False)
+        try:
+            self.post(server.url)
+            self.post(server.url)
+            self.assertEqual(server.cookies, [None, 'session=abc'])
+            self.assertEqual([cookie.name for cookie in self.transport.cookiejar], ['session'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()